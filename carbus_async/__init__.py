@@ -1,13 +1,27 @@
-from .device import CarBusDevice
-from .messages import CanMessage, MessageDirection
+from .device import CanMatchRule, CarBusDevice
+from .messages import CanMessage, CanFrameBatch, MessageDirection
 from .exceptions import CarBusError, CommandError, SyncError
 from .can_router import CanIdRouter, RoutedCarBusCanTransport
-from .periodic import PeriodicCanSender, PeriodicJob
+from .periodic import PeriodicCanSender, PeriodicJob, PeriodicJobStats
+from .payload import PayloadGenerator
+from .stats import BusStatistics, BusStatsSnapshot
+from .trace import TraceFrame, TraceReader, TraceRecorder, TraceWriter
+from .trace_index import IndexedTraceReader, build_index
+from .replay import ReplayReport, TraceReplayer
+from .tx_buffer import TxBufferPlayer, TxBufferReport
+from .capture import CaptureResult, TriggerCapture
+from .state import BusStateEntry, BusStateTable
+from .filter_expr import CanFilter, FilterSyntaxError, compile_filter
+from .subscription import Subscription
+from .gateway import CanGateway, GatewayRoute
+from .cycle_monitor import AliveCounterCheck, CycleEvent, CycleEventKind, CycleTimeMonitor
 from .remote.client import open_remote_device
 
 __all__ = [
     "CarBusDevice",
+    "CanMatchRule",
     "CanMessage",
+    "CanFrameBatch",
     "MessageDirection",
     "CarBusError",
     "CommandError",
@@ -16,5 +30,33 @@ __all__ = [
     "RoutedCarBusCanTransport",
     "PeriodicCanSender",
     "PeriodicJob",
+    "PeriodicJobStats",
+    "PayloadGenerator",
+    "BusStatistics",
+    "BusStatsSnapshot",
+    "TraceFrame",
+    "TraceReader",
+    "TraceRecorder",
+    "TraceWriter",
+    "IndexedTraceReader",
+    "build_index",
+    "ReplayReport",
+    "TraceReplayer",
+    "TxBufferPlayer",
+    "TxBufferReport",
+    "CaptureResult",
+    "TriggerCapture",
+    "BusStateEntry",
+    "BusStateTable",
+    "CanFilter",
+    "FilterSyntaxError",
+    "compile_filter",
+    "Subscription",
+    "CanGateway",
+    "GatewayRoute",
+    "AliveCounterCheck",
+    "CycleEvent",
+    "CycleEventKind",
+    "CycleTimeMonitor",
     "open_remote_device",
 ]
@@ -1,6 +1,6 @@
 import asyncio
 import contextlib
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 
 from carbus_async import CanMessage
 from isotp_async.iface import CanTransport
@@ -52,6 +52,9 @@ class CanIdRouter:
 
 
 class RoutedCarBusCanTransport(CanTransport):
+    # send() сериализует кадр до возврата — CanMessage можно переиспользовать
+    copies_on_send = True
+
     def __init__(self, dev, channel: int, rx_id: int, router: CanIdRouter) -> None:
         self._dev = dev
         self._channel = channel
@@ -59,9 +62,16 @@ class RoutedCarBusCanTransport(CanTransport):
         self._router = router
         self._queue = router.get_queue(rx_id)
 
+    @property
+    def channel(self) -> int:
+        return self._channel
+
     async def send(self, msg: CanMessage) -> None:
         await self._dev.send_can(msg, channel=self._channel, confirm=False, echo=False)
 
+    async def send_batch(self, msgs: Sequence[CanMessage]) -> None:
+        await self._dev.send_can_batch([(self._channel, m) for m in msgs])
+
     async def recv(self, timeout: Optional[float] = None) -> Optional[CanMessage]:
         try:
             if timeout is None:
@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .device import CanMatchRule, CanPred
+from .messages import CanMessage
+from .trace import (
+    PathLike,
+    TimestampUnwrapper,
+    TraceFrame,
+    TraceWriter,
+    message_flags,
+    FRAME_BRS,
+    FRAME_EXTENDED,
+    FRAME_FD,
+    FRAME_RTR,
+)
+
+log = logging.getLogger("carbus_async.capture")
+
+IDLE = "idle"
+POST_TRIGGER = "post_trigger"
+SAVING = "saving"
+STOPPED = "stopped"
+
+
+class _FrameRing:
+    """
+    Кольцевой буфер кадров фиксированного размера: все массивы выделяются
+    один раз, push() только перезаписывает ячейки.
+    """
+
+    def __init__(self, capacity: int, slot_size: int) -> None:
+        self.capacity = capacity
+        self.slot = slot_size
+        self.ts = array("q", bytes(8 * capacity))
+        self.ch = array("B", bytes(capacity))
+        self.ids = array("I", bytes(4 * capacity))
+        self.flags = array("B", bytes(capacity))
+        self.sizes = array("B", bytes(capacity))
+        self.data = bytearray(capacity * slot_size)
+        self.head = 0
+        self.count = 0
+
+    def push(self, ts: int, channel: int, msg: CanMessage) -> None:
+        i = self.head
+        data = msg.data
+        n = len(data)
+        if n > self.slot:
+            n = self.slot
+            data = data[:n]
+        self.ts[i] = ts
+        self.ch[i] = channel
+        self.ids[i] = msg.can_id
+        self.flags[i] = message_flags(msg)
+        self.sizes[i] = n
+        off = i * self.slot
+        self.data[off:off + n] = data
+        i += 1
+        self.head = 0 if i == self.capacity else i
+        if self.count < self.capacity:
+            self.count += 1
+
+    @property
+    def full(self) -> bool:
+        return self.count == self.capacity
+
+    @property
+    def oldest_ts(self) -> Optional[int]:
+        if not self.count:
+            return None
+        return self.ts[(self.head - self.count) % self.capacity]
+
+    def clear(self) -> None:
+        self.head = 0
+        self.count = 0
+
+    def copy_from(self, other: "_FrameRing") -> None:
+        # срезовое присваивание одинаковой длины — memcpy без перевыделения
+        self.ts[:] = other.ts
+        self.ch[:] = other.ch
+        self.ids[:] = other.ids
+        self.flags[:] = other.flags
+        self.sizes[:] = other.sizes
+        self.data[:] = other.data
+        self.head = other.head
+        self.count = other.count
+
+    def frames(self, t_min: Optional[int] = None) -> Iterator[TraceFrame]:
+        start = (self.head - self.count) % self.capacity
+        for k in range(self.count):
+            i = (start + k) % self.capacity
+            ts = self.ts[i]
+            if t_min is not None and ts < t_min:
+                continue
+            fl = self.flags[i]
+            off = i * self.slot
+            yield TraceFrame(
+                ts,
+                self.ch[i],
+                CanMessage(
+                    can_id=self.ids[i],
+                    data=bytes(self.data[off:off + self.sizes[i]]),
+                    extended=bool(fl & FRAME_EXTENDED),
+                    rtr=bool(fl & FRAME_RTR),
+                    fd=bool(fl & FRAME_FD),
+                    brs=bool(fl & FRAME_BRS),
+                    timestamp_us=ts & 0xFFFFFFFF,
+                ),
+            )
+
+
+@dataclass
+class CaptureResult:
+    path: Path
+    reason: str
+    trigger_ts_us: int
+    pre_frames: int
+    post_frames: int
+
+
+class TriggerCapture:
+    """
+    Осциллографический захват: кольцевые буферы последних pre_frames кадров
+    по каждому каналу. Когда срабатывает триггер,
+    захват продолжается ещё post_s секунд / post_frames кадров, после чего
+    снимок (до + после) сохраняется в файл .cbt в фоновом потоке.
+
+    Вся память выделяется в конструкторе: рабочие буферы, их замороженная
+    копия на момент триггера и буфер пост-триггерных кадров.
+
+    pre_s — только верхняя граница истории: из кольца берутся кадры не старше
+    pre_s до триггера, но глубину задаёт pre_frames. Чтобы история покрывала
+    pre_s, pre_frames должно быть не меньше pre_s × частота кадров канала;
+    если кольцо оказалось короче, при сохранении пишется предупреждение.
+    """
+
+    def __init__(
+        self,
+        dev,
+        path: PathLike = "capture_{index:04d}.cbt",
+        *,
+        channels: Iterable[int] = (1, 2, 3, 4),
+        pre_frames: int = 10_000,
+        pre_s: Optional[float] = None,
+        post_frames: int = 10_000,
+        post_s: float = 1.0,
+        slot_size: int = 64,
+        rearm: bool = True,
+        on_saved: Optional[Callable[[CaptureResult], None]] = None,
+        autostart: bool = True,
+    ) -> None:
+        self._dev = dev
+        self.path_template = str(path)
+        self.pre_s = pre_s
+        self.post_s = post_s
+        self.rearm = rearm
+        self.on_saved = on_saved
+
+        self._rings: Dict[int, _FrameRing] = {ch: _FrameRing(pre_frames, slot_size) for ch in channels}
+        self._frozen: Dict[int, _FrameRing] = {ch: _FrameRing(pre_frames, slot_size) for ch in channels}
+        self._post = _FrameRing(post_frames, slot_size)
+
+        self._match_rules: List[CanMatchRule] = []
+        self._bus_error_channels: Optional[set] = None
+        self._bus_error_trigger = False
+
+        self._unwrap = TimestampUnwrapper()
+        self._last_ts = 0
+        self.state = IDLE
+        self._reason = ""
+        self._trigger_ts = 0
+        self._post_timer: Optional[asyncio.TimerHandle] = None
+        self._save_task: Optional[asyncio.Task] = None
+        self._index = 0
+
+        self.results: List[CaptureResult] = []
+        self.missed_triggers = 0
+        self._waiters: List[asyncio.Future] = []
+        self._attached = False
+
+        if autostart:
+            self.start()
+
+    # --- управление ---------------------------------------------------------
+
+    def start(self) -> None:
+        if self._attached:
+            return
+        self._dev.add_rx_tap(self._on_frame)
+        self._dev.add_bus_error_tap(self._on_bus_error)
+        self._attached = True
+        if self.state == STOPPED:
+            self.state = IDLE
+
+    async def stop(self) -> None:
+        if self._attached:
+            self._dev.remove_rx_tap(self._on_frame)
+            self._dev.remove_bus_error_tap(self._on_bus_error)
+            self._attached = False
+        if self._post_timer is not None:
+            self._post_timer.cancel()
+            self._post_timer = None
+        if self.state == POST_TRIGGER:
+            self._finish_post()
+        if self._save_task is not None:
+            await self._save_task
+        self.state = STOPPED
+
+    def arm(self) -> None:
+        """Повторно взвести триггер (нужно при rearm=False)."""
+        if self.state in (IDLE, STOPPED):
+            for ring in self._rings.values():
+                ring.clear()
+            self.state = IDLE
+
+    # --- условия срабатывания ---------------------------------------------
+
+    def trigger_on_match(
+        self,
+        *,
+        can_id: Optional[int] = None,
+        value: bytes = b"",
+        mask: Optional[bytes] = None,
+        offset: int = 0,
+        predicate: Optional[CanPred] = None,
+    ) -> None:
+        """Те же правила, что у CarBusDevice.on_can_match / on_can_id."""
+        self._match_rules.append(CanMatchRule(
+            can_id=can_id,
+            value=value or None,
+            mask=mask if value else None,
+            offset=offset,
+            predicate=predicate,
+        ))
+
+    def trigger_on_bus_error(self, channels: Optional[Iterable[int]] = None) -> None:
+        self._bus_error_trigger = True
+        self._bus_error_channels = set(channels) if channels is not None else None
+
+    def trigger(self, reason: str = "manual") -> bool:
+        """Ручной триггер. False — если захват уже идёт или сохраняется."""
+        return self._fire(reason, self._last_ts)
+
+    async def wait(self, timeout: Optional[float] = None) -> CaptureResult:
+        """Дождаться следующего сохранённого снимка."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        return await asyncio.wait_for(fut, timeout=timeout)
+
+    # --- read path ----------------------------------------------------------
+
+    def _on_frame(self, channel: int, msg: CanMessage) -> None:
+        ts = self._unwrap(msg.timestamp_us)
+        self._last_ts = ts
+        ring = self._rings.get(channel)
+        if ring is None:
+            return
+        state = self.state
+        # кольцо пишется и во время пост-окна — иначе после re-arm в истории
+        # следующего снимка была бы дыра длиной в это окно
+        ring.push(ts, channel, msg)
+
+        if state == POST_TRIGGER:
+            self._post.push(ts, channel, msg)
+            if self._post.full:
+                self._finish_post()
+            return
+
+        if state == IDLE and self._match_rules:
+            data = bytes(msg.data)
+            for rule in self._match_rules:
+                if rule.matches(channel, msg, data):
+                    self._fire(f"match ch={channel} id=0x{msg.can_id:X}", ts)
+                    break
+
+    def _on_bus_error(self, channel: int, header_flags: int, payload: bytes) -> None:
+        if not self._bus_error_trigger:
+            return
+        if self._bus_error_channels is not None and channel not in self._bus_error_channels:
+            return
+        self._fire(f"bus_error ch={channel}", self._last_ts)
+
+    # --- машина состояний ----------------------------------------------------
+
+    def _fire(self, reason: str, ts: int) -> bool:
+        if self.state != IDLE:
+            self.missed_triggers += 1
+            return False
+
+        for ch, ring in self._rings.items():
+            self._frozen[ch].copy_from(ring)
+        self._post.clear()
+        self._reason = reason
+        self._trigger_ts = ts
+        self.state = POST_TRIGGER
+        log.info("Capture triggered: %s", reason)
+
+        if self.post_s > 0:
+            loop = asyncio.get_running_loop()
+            self._post_timer = loop.call_later(self.post_s, self._finish_post)
+        else:
+            self._finish_post()
+        return True
+
+    def _finish_post(self) -> None:
+        if self.state != POST_TRIGGER:
+            return
+        if self._post_timer is not None:
+            self._post_timer.cancel()
+            self._post_timer = None
+        self.state = SAVING
+        path = Path(self.path_template.format(index=self._index, time=int(time.time())))
+        self._index += 1
+        self._save_task = asyncio.get_running_loop().create_task(self._save(path))
+
+    async def _save(self, path: Path) -> None:
+        try:
+            result = await asyncio.to_thread(self._write_snapshot, path)
+        except Exception:
+            log.exception("Failed to save capture to %s", path)
+            result = None
+        finally:
+            self.state = IDLE if self.rearm and self._attached else STOPPED
+
+        if result is None:
+            return
+        self.results.append(result)
+        if self.on_saved is not None:
+            try:
+                self.on_saved(result)
+            except Exception:
+                log.exception("on_saved callback failed")
+        waiters, self._waiters = self._waiters, []
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(result)
+
+    def _write_snapshot(self, path: Path) -> CaptureResult:
+        t_min = None
+        if self.pre_s is not None:
+            t_min = self._trigger_ts - int(self.pre_s * 1e6)
+            for ch, ring in self._frozen.items():
+                oldest = ring.oldest_ts
+                if ring.full and oldest is not None and oldest > t_min:
+                    log.warning(
+                        "Capture ch=%d: pre_frames=%d cover only %.3f s of pre_s=%.3f s",
+                        ch, ring.capacity, (self._trigger_ts - oldest) * 1e-6, self.pre_s,
+                    )
+
+        pre = heapq.merge(
+            *(ring.frames(t_min) for ring in self._frozen.values()),
+            key=lambda f: f.timestamp_us,
+        )
+        n_pre = 0
+        with TraceWriter(path) as w:
+            for f in pre:
+                w.write(f)
+                n_pre += 1
+            n_post = w.write_many(self._post.frames())
+
+        log.info("Capture saved: %s (%d pre, %d post)", path, n_pre, n_post)
+        return CaptureResult(
+            path=path,
+            reason=self._reason,
+            trigger_ts_us=self._trigger_ts,
+            pre_frames=n_pre,
+            post_frames=n_post,
+        )
@@ -0,0 +1,368 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import math
+import statistics
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+from .messages import CanMessage
+
+log = logging.getLogger("carbus_async.cycle_monitor")
+
+TIMESTAMP_WRAP = 1 << 32
+
+
+class CycleEventKind(str, Enum):
+    LEARNED = "learned"
+    TIMEOUT = "timeout"
+    RECOVERED = "recovered"
+    JITTER = "jitter"
+    SLOW = "slow"
+    ALIVE_ERROR = "alive_error"
+    CHECKSUM_ERROR = "checksum_error"
+
+
+@dataclass
+class CycleEvent:
+    kind: CycleEventKind
+    channel: int
+    can_id: int
+    extended: bool
+    period_s: Optional[float]
+    observed_s: Optional[float] = None
+    msg: Optional[CanMessage] = None
+
+
+@dataclass
+class CycleStats:
+    frames: int
+    period_s: Optional[float]
+    mean_s: Optional[float]
+    std_s: Optional[float]
+    min_s: Optional[float]
+    max_s: Optional[float]
+    timeouts: int
+    jitter_violations: int
+    alive_errors: int
+    checksum_errors: int
+    in_timeout: bool
+
+
+@dataclass(frozen=True)
+class AliveCounterCheck:
+    """
+    Счётчик жизни в data[byte] (биты shift .. shift+length-1).
+    Между соседними кадрами значение должно вырасти ровно на step по модулю 2**length.
+    """
+    byte: int
+    shift: int = 0
+    length: int = 4
+    step: int = 1
+
+    def value(self, data: bytes) -> Optional[int]:
+        if len(data) <= self.byte:
+            return None
+        return (data[self.byte] >> self.shift) & ((1 << self.length) - 1)
+
+    def ok(self, prev: int, cur: int) -> bool:
+        return (cur - prev) % (1 << self.length) == self.step % (1 << self.length)
+
+
+ChecksumFn = Callable[[bytes], bool]
+EventFn = Callable[[CycleEvent], None]
+
+
+class _Watch:
+    __slots__ = (
+        "channel", "can_id", "extended", "period", "tolerance", "timeout_factor",
+        "learn", "samples", "alive", "checksum",
+        "last_ts", "last_rx", "deadline_tick", "scheduled", "in_timeout", "slow",
+        "ewma", "n", "mean", "m2", "min", "max", "frames",
+        "timeouts", "jitter_violations", "alive_errors", "checksum_errors", "alive_prev",
+    )
+
+    def __init__(self, channel, can_id, extended, period, tolerance, timeout_factor, learn, alive, checksum):
+        self.channel = channel
+        self.can_id = can_id
+        self.extended = extended
+        self.period = period
+        self.tolerance = tolerance
+        self.timeout_factor = timeout_factor
+        self.learn = learn
+        self.samples: List[float] = []
+        self.alive = alive
+        self.checksum = checksum
+        self.last_ts = -1
+        self.last_rx = 0.0
+        self.deadline_tick = 0
+        self.scheduled = False
+        self.in_timeout = False
+        self.slow = False
+        self.ewma = 0.0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.frames = 0
+        self.timeouts = 0
+        self.jitter_violations = 0
+        self.alive_errors = 0
+        self.checksum_errors = 0
+        self.alive_prev: Optional[int] = None
+
+
+def _key(channel: int, can_id: int, extended: bool) -> int:
+    return (channel << 32) | (int(extended) << 31) | can_id
+
+
+class CycleTimeMonitor:
+    """
+    Контроль периодичности циклических сообщений.
+
+    Для каждого наблюдаемого ID период задаётся явно или выучивается по первым
+    learn_frames интервалам. Межкадровые интервалы (по аппаратным timestamp_us)
+    проверяются на допуск, считается статистика джиттера; пропажа сообщения
+    ловится одним «колесом таймеров» на весь монитор, а не отдельным таймером
+    на ID: приход кадра лишь сдвигает дедлайн записи (O(1)), а колесо при
+    проходе слота перекладывает записи с отодвинутым дедлайном.
+    """
+
+    def __init__(
+        self,
+        dev=None,
+        *,
+        tick_s: float = 0.005,
+        wheel_slots: int = 512,
+        on_event: Optional[EventFn] = None,
+        event_queue_size: int = 1000,
+        autostart: bool = True,
+    ) -> None:
+        self._dev = dev
+        self.tick_s = tick_s
+        self._slots: List[List[_Watch]] = [[] for _ in range(wheel_slots)]
+        self._watches: Dict[int, _Watch] = {}
+        self._listeners: List[EventFn] = [on_event] if on_event is not None else []
+        self.events: "asyncio.Queue[CycleEvent]" = asyncio.Queue(maxsize=event_queue_size)
+        self._t0 = time.monotonic()
+        self._tick = 0
+        self._task: Optional[asyncio.Task] = None
+        self._attached = False
+        if autostart:
+            self.start()
+
+    # --- настройка ------------------------------------------------------------
+
+    def watch(
+        self,
+        can_id: int,
+        *,
+        channel: int = 1,
+        extended: bool = False,
+        period_s: Optional[float] = None,
+        tolerance: float = 0.25,
+        timeout_factor: float = 3.0,
+        learn_frames: int = 10,
+        alive_counter: Optional[AliveCounterCheck] = None,
+        checksum: Optional[ChecksumFn] = None,
+    ) -> None:
+        """
+        period_s=None — выучить период по learn_frames интервалам.
+        tolerance — допустимое отклонение интервала (доля периода);
+        timeout_factor — через сколько периодов без кадра генерируется TIMEOUT.
+        С явным period_s дедлайн отсчитывается сразу (от watch() или start()),
+        так что TIMEOUT придёт и для ID, который не появился ни разу.
+        """
+        key = _key(channel, can_id, extended)
+        old = self._watches.get(key)
+        if old is not None:
+            old.scheduled = False
+        w = self._watches[key] = _Watch(
+            channel, can_id, extended, period_s, tolerance, timeout_factor,
+            learn_frames, alive_counter, checksum,
+        )
+        w.last_rx = time.monotonic()
+        if self._task is not None and not self._task.done():
+            self._schedule(w)
+
+    def unwatch(self, can_id: int, *, channel: int = 1, extended: bool = False) -> None:
+        w = self._watches.pop(_key(channel, can_id, extended), None)
+        if w is not None:
+            w.scheduled = False  # колесо выкинет запись при ближайшем проходе
+
+    def add_listener(self, fn: EventFn) -> None:
+        self._listeners.append(fn)
+
+    def stats(self, can_id: int, *, channel: int = 1, extended: bool = False) -> Optional[CycleStats]:
+        w = self._watches.get(_key(channel, can_id, extended))
+        if w is None:
+            return None
+        has = w.n > 0
+        return CycleStats(
+            frames=w.frames,
+            period_s=w.period,
+            mean_s=w.mean if has else None,
+            std_s=math.sqrt(w.m2 / (w.n - 1)) if w.n > 1 else (0.0 if has else None),
+            min_s=w.min if has else None,
+            max_s=w.max if has else None,
+            timeouts=w.timeouts,
+            jitter_violations=w.jitter_violations,
+            alive_errors=w.alive_errors,
+            checksum_errors=w.checksum_errors,
+            in_timeout=w.in_timeout,
+        )
+
+    # --- запуск ---------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._dev is not None and not self._attached:
+            self._dev.add_rx_tap(self.update)
+            self._attached = True
+        if self._task is None or self._task.done():
+            self._t0 = time.monotonic()
+            self._tick = 0
+            # тики колеса считаются от нового _t0: дедлайны ставятся заново
+            for slot in self._slots:
+                slot.clear()
+            for w in self._watches.values():
+                w.scheduled = False
+                if not w.in_timeout:
+                    w.last_rx = self._t0
+                    self._schedule(w)
+            self._task = asyncio.get_running_loop().create_task(
+                self._run(), name="CycleTimeMonitor",
+            )
+
+    async def stop(self) -> None:
+        if self._dev is not None and self._attached:
+            self._dev.remove_rx_tap(self.update)
+            self._attached = False
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    # --- read path ------------------------------------------------------------
+
+    def _emit(self, kind: CycleEventKind, w: _Watch, observed: Optional[float] = None,
+              msg: Optional[CanMessage] = None) -> None:
+        ev = CycleEvent(kind, w.channel, w.can_id, w.extended, w.period, observed, msg)
+        for fn in self._listeners:
+            try:
+                fn(ev)
+            except Exception:
+                log.exception("Cycle monitor listener failed")
+        if self.events.full():
+            self.events.get_nowait()
+        self.events.put_nowait(ev)
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._t0) / self.tick_s)
+
+    def _schedule(self, w: _Watch) -> None:
+        if w.period is None:
+            return
+        w.deadline_tick = self._now_tick() + max(1, math.ceil(w.period * w.timeout_factor / self.tick_s))
+        if not w.scheduled:
+            w.scheduled = True
+            self._slots[w.deadline_tick % len(self._slots)].append(w)
+
+    def update(self, channel: int, msg: CanMessage) -> None:
+        w = self._watches.get(_key(channel, msg.can_id, msg.extended))
+        if w is None:
+            return
+
+        w.frames += 1
+        ts = msg.timestamp_us
+        last = w.last_ts
+        w.last_ts = ts
+        w.last_rx = time.monotonic()
+
+        if w.in_timeout:
+            w.in_timeout = False
+            self._emit(CycleEventKind.RECOVERED, w, msg=msg)
+
+        if w.checksum is not None and not w.checksum(msg.data):
+            w.checksum_errors += 1
+            self._emit(CycleEventKind.CHECKSUM_ERROR, w, msg=msg)
+
+        if w.alive is not None:
+            cur = w.alive.value(msg.data)
+            prev = w.alive_prev
+            w.alive_prev = cur
+            if prev is not None and cur is not None and not w.alive.ok(prev, cur):
+                w.alive_errors += 1
+                self._emit(CycleEventKind.ALIVE_ERROR, w, msg=msg)
+
+        if last >= 0:
+            iat = ((ts - last) % TIMESTAMP_WRAP) * 1e-6
+            self._on_interval(w, iat, msg)
+
+        self._schedule(w)
+
+    def _on_interval(self, w: _Watch, iat: float, msg: CanMessage) -> None:
+        w.n += 1
+        delta = iat - w.mean
+        w.mean += delta / w.n
+        w.m2 += delta * (iat - w.mean)
+        if iat < w.min:
+            w.min = iat
+        if iat > w.max:
+            w.max = iat
+
+        period = w.period
+        if period is None:
+            w.samples.append(iat)
+            if len(w.samples) >= w.learn:
+                w.period = statistics.median(w.samples)
+                w.samples = []
+                w.ewma = w.period
+                self._emit(CycleEventKind.LEARNED, w, observed=w.period)
+            return
+
+        if abs(iat - period) > w.tolerance * period:
+            w.jitter_violations += 1
+            self._emit(CycleEventKind.JITTER, w, observed=iat, msg=msg)
+
+        w.ewma = iat if w.ewma == 0.0 else w.ewma + (iat - w.ewma) * 0.125
+        slow = w.ewma > period * (1.0 + w.tolerance)
+        if slow and not w.slow:
+            self._emit(CycleEventKind.SLOW, w, observed=w.ewma)
+        w.slow = slow
+
+    # --- колесо таймеров --------------------------------------------------------
+
+    async def _run(self) -> None:
+        n_slots = len(self._slots)
+        while True:
+            await asyncio.sleep(self.tick_s)
+            now = self._now_tick()
+            start = self._tick + 1
+            if now - start >= n_slots:
+                start = now - n_slots + 1
+            for tick in range(start, now + 1):
+                self._process_slot(tick)
+            self._tick = now
+
+    def _process_slot(self, tick: int) -> None:
+        slot = self._slots[tick % len(self._slots)]
+        if not slot:
+            return
+        entries = slot[:]
+        slot.clear()
+        for w in entries:
+            if not w.scheduled:
+                continue
+            if w.deadline_tick > tick:
+                self._slots[w.deadline_tick % len(self._slots)].append(w)
+                continue
+            w.scheduled = False
+            w.in_timeout = True
+            w.timeouts += 1
+            self._emit(CycleEventKind.TIMEOUT, w, observed=time.monotonic() - w.last_rx)
@@ -5,13 +5,17 @@ import contextlib
 import logging
 import struct
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Tuple, List, Awaitable, Callable
+from typing import TYPE_CHECKING, Dict, FrozenSet, Optional, Tuple, List, Awaitable, Callable, Iterable, Sequence
 
 import serial_asyncio
 
 from .exceptions import CarBusError, SyncError, CommandError
 from .messages import CanMessage
 
+if TYPE_CHECKING:
+    from .filter_expr import CanFilter, HwFilter
+    from .subscription import Subscription
+
 
 NOMINAL_BITRATE_INDEX: Dict[int, int] = {
     10_000: 0,
@@ -73,6 +77,8 @@ from .protocol import (
     DI_ISOTP,
     DI_TX_BUFFER,
     DI_TX_TASK,
+    EXPERIMENTAL_FEATURES,
+    PROVISIONAL_COMMANDS,
     is_ack,
     base_command_from_ack,
     need_extended_header,
@@ -402,15 +408,8 @@ class _PendingRequest:
 
 CanHook = Callable[[int, CanMessage], Awaitable[None]]
 CanPred = Callable[[int, CanMessage], bool]
-
-@dataclass(frozen=True)
-class _CanHookRule:
-    can_id: int | None                 # None => любой ID
-    value: bytes | None                # None => матч только по ID/predicate
-    mask: bytes | None
-    offset: int
-    handler: CanHook
-    predicate: CanPred | None = None
+CanTap = Callable[[int, CanMessage], None]
+BusErrorTap = Callable[[int, int, bytes], None]
 
 
 def _match_masked(data: bytes, *, offset: int, value: bytes, mask: bytes) -> bool:
@@ -424,11 +423,78 @@ def _match_masked(data: bytes, *, offset: int, value: bytes, mask: bytes) -> boo
             return False
     return True
 
+
+@dataclass(frozen=True)
+class CanMatchRule:
+    """
+    Условие на принятый кадр, как у on_can_id / on_can_match: CAN-ID (None —
+    любой), predicate(channel, msg) и (data[offset+i] & mask[i]) == (value[i] & mask[i]).
+    mask=None при заданном value — все биты.
+    """
+    can_id: int | None = None          # None => любой ID
+    value: bytes | None = None         # None => матч только по ID/predicate
+    mask: bytes | None = None
+    offset: int = 0
+    predicate: CanPred | None = None
+
+    def __post_init__(self) -> None:
+        if self.value is not None and self.mask is None:
+            object.__setattr__(self, "mask", bytes([0xFF]) * len(self.value))
+
+    def matches(self, channel: int, msg: CanMessage, data: bytes | None = None) -> bool:
+        """data — bytes(msg.data), если уже посчитан вызывающим."""
+        if self.can_id is not None and self.can_id != msg.can_id:
+            return False
+        if self.predicate is not None and not self.predicate(channel, msg):
+            return False
+        if self.value is not None:
+            if data is None:
+                data = bytes(msg.data)
+            if not _match_masked(data, offset=self.offset, value=self.value, mask=self.mask or b""):
+                return False
+        return True
+
+
+@dataclass(frozen=True)
+class _CanHookRule:
+    match: CanMatchRule
+    handler: CanHook
+
+
+# запись TX_BUFFER_ADD: delay_us u32, channel u32, затем кадр как в MESSAGE
+TX_BUFFER_ENTRY = struct.Struct("<II")
+# сколько TX_BUFFER_ADD ждут ответа одновременно (seq — 255 значений на все команды)
+TX_BUFFER_ADD_WINDOW = 16
+
+# общая очередь receive_can(): сколько кадров держать, пока их никто не читает
+RX_QUEUE_SIZE = 4096
+
+# ISOTP_OPEN: handle, tx_id, rx_id, флаги, BS, STmin, байт заполнения, TX_DL, N_Bs и N_Cr в мс
+ISOTP_OPEN_PARAMS = struct.Struct("<IIIIBBBBHH")
+ISOTP_FLAG_EXTID = 0x01
+ISOTP_FLAG_FD = 0x02
+ISOTP_FLAG_BRS = 0x04
+ISOTP_FLAG_PADDING = 0x08
+
+IsoTpSink = Callable[[bytes], None]
+
+
+def _channel_from_header_flags(header_flags: int) -> int:
+    # CHANNEL_1..CHANNEL_4 = n * 0x2000, т.е. номер канала в битах 13..15
+    return (header_flags >> 13) & 0x07
+
 @dataclass
 class CarBusDevice:
     port: str
     baudrate: int = 115200
     loop: Optional[asyncio.AbstractEventLoop] = None
+    # предварительные команды адаптера ("gateway", "tx_task", "tx_buffer",
+    # "isotp"), см. protocol.PROVISIONAL_COMMANDS; по умолчанию выключены
+    experimental: FrozenSet[str] = frozenset()
+    # предел общей очереди receive_can(): при переполнении вытесняется самый
+    # старый кадр (rx_queue_dropped), как в CanIdRouter; 0 — без ограничения
+    rx_queue_size: int = RX_QUEUE_SIZE
+    rx_queue_dropped: int = field(init=False, default=0)
 
     _reader: asyncio.StreamReader = field(init=False, repr=False)
     _writer: asyncio.StreamWriter = field(init=False, repr=False)
@@ -440,6 +506,11 @@ class CarBusDevice:
     _closed: bool = field(init=False, default=False, repr=False)
     _can_hooks: List[_CanHookRule] = field(init=False, repr=False)
     _can_hook_sem: asyncio.Semaphore = field(init=False, repr=False)
+    _rx_taps: List[CanTap] = field(init=False, repr=False)
+    _bus_error_taps: List[BusErrorTap] = field(init=False, repr=False)
+    _rx_queue_enabled: bool = field(init=False, default=True, repr=False)
+    _channel_bitrates: Dict[int, Tuple[int, Optional[int]]] = field(init=False, repr=False)
+    _isotp_sinks: Dict[int, Tuple[int, IsoTpSink]] = field(init=False, repr=False)
 
     _log: logging.Logger = field(init=False, repr=False)
     _wire_log: logging.Logger = field(init=False, repr=False)
@@ -460,8 +531,11 @@ class CarBusDevice:
         loop: Optional[asyncio.AbstractEventLoop] = None,
         use_can: bool = True,
         use_lin: bool = False,
+        experimental: Iterable[str] = (),
+        rx_queue_size: int = RX_QUEUE_SIZE,
     ) -> "CarBusDevice":
-        self = cls(port=port, baudrate=baudrate, loop=loop)
+        self = cls(port=port, baudrate=baudrate, loop=loop, experimental=frozenset(experimental),
+                   rx_queue_size=rx_queue_size)
         await self._connect()
         await self.sync()
         self._start_reader()
@@ -483,21 +557,18 @@ class CarBusDevice:
         loop: Optional[asyncio.AbstractEventLoop] = None,
         use_can: bool = True,
         use_lin: bool = False,
+        experimental: Iterable[str] = (),
+        rx_queue_size: int = RX_QUEUE_SIZE,
     ) -> "CarBusDevice":
-        self = cls(port=logical_port, baudrate=baudrate, loop=loop)
+        self = cls(port=logical_port, baudrate=baudrate, loop=loop, experimental=frozenset(experimental),
+                   rx_queue_size=rx_queue_size)
 
         self._log = logging.getLogger(f"carbus_async.device.{logical_port}")
         self._wire_log = logging.getLogger(f"carbus_async.wire.{logical_port}")
 
         self._reader = reader
         self._writer = writer
-
-        self._rx_queue = asyncio.Queue()
-        self._rx_channel_queues = {}
-        self._pending = {}
-        self._seq_counter = 0
-        self._reader_task = None
-        self._closed = False
+        self._init_state()
 
         await self.sync()
         self._start_reader()
@@ -555,7 +626,22 @@ class CarBusDevice:
             )
             self._log.debug("Connected to %s @ %d", self.port, self.baudrate)
 
-        self._rx_queue = asyncio.Queue()
+        self._init_state()
+
+    def __post_init__(self) -> None:
+        self.experimental = frozenset(self.experimental)
+        unknown = self.experimental - EXPERIMENTAL_FEATURES
+        if unknown:
+            raise ValueError(
+                f"Unknown experimental features {sorted(unknown)}; known: {sorted(EXPERIMENTAL_FEATURES)}"
+            )
+
+    def experimental_enabled(self, feature: str) -> bool:
+        return feature in self.experimental
+
+    def _init_state(self) -> None:
+        self._rx_queue = asyncio.Queue(maxsize=self.rx_queue_size)
+        self.rx_queue_dropped = 0
         self._rx_channel_queues = {}
         self._pending = {}
         self._seq_counter = 0
@@ -563,7 +649,11 @@ class CarBusDevice:
         self._closed = False
         self._can_hooks = []
         self._can_hook_sem = asyncio.Semaphore(200)
-
+        self._rx_taps = []
+        self._bus_error_taps = []
+        self._rx_queue_enabled = True
+        self._channel_bitrates = {}
+        self._isotp_sinks = {}
 
     async def close(self) -> None:
         if self._closed:
@@ -596,10 +686,8 @@ class CarBusDevice:
         """Хук на каждый принятый CAN кадр с данным can_id."""
         def deco(fn: CanHook) -> CanHook:
             self._can_hooks.append(_CanHookRule(
-                can_id=can_id,
-                value=None, mask=None, offset=0,
+                CanMatchRule(can_id=can_id, predicate=predicate),
                 handler=fn,
-                predicate=predicate,
             ))
             return fn
         return deco
@@ -622,29 +710,100 @@ class CarBusDevice:
 
         def deco(fn: CanHook) -> CanHook:
             self._can_hooks.append(_CanHookRule(
-                can_id=can_id,
-                value=value,
-                mask=mask,
-                offset=offset,
+                CanMatchRule(can_id=can_id, value=value, mask=mask, offset=offset, predicate=predicate),
                 handler=fn,
-                predicate=predicate,
             ))
             return fn
         return deco
 
+    def on_filter(self, expr: str):
+        """
+        Хук по выражению фильтра (см. carbus_async.filter_expr), например
+        "ch == 1 and id in 0x700..0x7FF and data[0] & 0xF0 == 0x10".
+        """
+        from .filter_expr import compile_filter
+
+        flt = compile_filter(expr)
+
+        def deco(fn: CanHook) -> CanHook:
+            self._can_hooks.append(_CanHookRule(CanMatchRule(predicate=flt), handler=fn))
+            return fn
+        return deco
+
+    def add_rx_tap(self, fn: CanTap) -> None:
+        """
+        Синхронный обработчик, вызываемый из read loop для каждого принятого кадра.
+        Должен быть быстрым и не блокировать: никаких await, I/O и т.п.
+        """
+        if fn not in self._rx_taps:
+            self._rx_taps.append(fn)
+
+    def remove_rx_tap(self, fn: CanTap) -> None:
+        with contextlib.suppress(ValueError):
+            self._rx_taps.remove(fn)
+
+    def add_bus_error_tap(self, fn: BusErrorTap) -> None:
+        """Синхронный обработчик BUS_ERROR: fn(channel, header_flags, payload)."""
+        if fn not in self._bus_error_taps:
+            self._bus_error_taps.append(fn)
+
+    def remove_bus_error_tap(self, fn: BusErrorTap) -> None:
+        with contextlib.suppress(ValueError):
+            self._bus_error_taps.remove(fn)
+
+    def subscribe(
+        self,
+        *,
+        can_ids: Optional[Iterable[int]] = None,
+        channels: Optional[Iterable[int]] = None,
+        filter: "str | CanPred | None" = None,
+        on_change: bool = False,
+        mask: Optional[bytes] = None,
+        min_interval_s: Optional[float] = None,
+        **kwargs,
+    ) -> "Subscription":
+        """
+        Подписка с фильтрацией в read loop: только изменившиеся данные
+        (on_change / mask) и/или не чаще min_interval_s на ID (last value wins).
+        См. carbus_async.subscription.Subscription.
+        """
+        from .subscription import Subscription
+
+        return Subscription(
+            self,
+            can_ids=can_ids,
+            channels=channels,
+            filter=filter,
+            on_change=on_change,
+            mask=mask,
+            min_interval_s=min_interval_s,
+            **kwargs,
+        )
+
+    def set_rx_queue_enabled(self, enabled: bool) -> None:
+        """
+        Включить/выключить общую очередь receive_can(). Если кадры забираются
+        только через RX tap-ы (таблица состояния, статистика, запись, ISO-TP
+        через open_isotp), очередь без читателя лишь держит до rx_queue_size
+        последних кадров — её можно отключить.
+        """
+        self._rx_queue_enabled = enabled
+        if not enabled:
+            while not self._rx_queue.empty():
+                self._rx_queue.get_nowait()
+
+    def get_channel_bitrate(self, channel: int) -> Optional[Tuple[int, Optional[int]]]:
+        """(nominal, data) битрейт, с которым канал был открыт через open_can_channel."""
+        return self._channel_bitrates.get(channel)
+
     def _fire_can_hooks(self, channel: int, msg: CanMessage) -> None:
         if not self._can_hooks:
             return
 
         data = bytes(msg.data)
         for rule in self._can_hooks:
-            if rule.can_id is not None and rule.can_id != msg.can_id:
-                continue
-            if rule.predicate is not None and not rule.predicate(channel, msg):
+            if not rule.match.matches(channel, msg, data):
                 continue
-            if rule.value is not None:
-                if not _match_masked(data, offset=rule.offset, value=rule.value, mask=rule.mask or b""):
-                    continue
 
             asyncio.create_task(self._run_can_hook(rule.handler, channel, msg))
 
@@ -691,11 +850,16 @@ class CarBusDevice:
     ) -> Tuple[int, int, bytes]:
         if self._closed:
             raise CarBusError("Device is closed")
+        feature = PROVISIONAL_COMMANDS.get(command)
+        if feature is not None and feature not in self.experimental:
+            raise CommandError(
+                f"Command 0x{command:02X} is provisional; open the device with experimental={{'{feature}'}}"
+            )
 
         seq = self._next_seq()
         dsize = len(payload)
 
-        if need_extended_header(command):
+        if need_extended_header(command, self.experimental):
             header = MsgCommandHeader(
                 command=command,
                 sequence=seq,
@@ -736,9 +900,41 @@ class CarBusDevice:
         if not expect_response:
             return 0, 0, b""
 
-        cmd_resp, flags_resp, payload_resp = await fut
+        try:
+            cmd_resp, flags_resp, payload_resp = await fut
+        finally:
+            # при отмене (таймаут вызывающего) не оставляем висящий seq
+            pending = self._pending.get(seq)
+            if pending is not None and pending.future is fut:
+                del self._pending[seq]
         return cmd_resp, flags_resp, payload_resp
 
+    async def _command(
+        self,
+        command: int,
+        *,
+        header_flags: int = 0,
+        payload: bytes = b"",
+        timeout: float = 1.0,
+    ) -> Tuple[int, bytes]:
+        """
+        Команда с ожиданием ACK не дольше timeout. ERROR, чужой ответ или
+        отсутствие ответа (старая прошивка не знает команду) -> CommandError.
+        """
+        try:
+            cmd, flags, resp = await asyncio.wait_for(
+                self._send_raw(command, header_flags=header_flags, payload=payload),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            raise CommandError(f"No response to command 0x{command:02X}") from None
+
+        if not is_ack(cmd) or base_command_from_ack(cmd) != command:
+            raise CommandError(
+                f"Unexpected response to 0x{command:02X}: cmd=0x{cmd:02X}, flags=0x{flags:04X}"
+            )
+        return flags, resp
+
     async def get_device_info(self) -> DeviceInfo:
         cmd, flags, payload = await self._send_raw(
             Command.DEVICE_INFO,
@@ -897,6 +1093,12 @@ class CarBusDevice:
                 f"Unexpected CHANNEL_OPEN response: cmd=0x{cmd:02X}, flags=0x{flags:04X}"
             )
 
+        if not auto_detect and nominal_index is None:
+            self._channel_bitrates[channel] = (
+                nominal_bitrate,
+                data_bitrate if fd and brs else None,
+            )
+
     async def open_can_channel_custom(
             self,
             channel: int = 1,
@@ -1122,6 +1324,242 @@ class CarBusDevice:
                 f"Unexpected FILTER_CLEAR response: cmd=0x{cmd:02X}, flags=0x{flags:04X}"
             )
 
+    async def apply_hw_filters(
+        self,
+        expr: "str | CanFilter",
+        channels: Iterable[int] = (1, 2, 3, 4),
+    ) -> Dict[int, Optional[List["HwFilter"]]]:
+        """
+        Вывести из выражения фильтра набор аппаратных id/mask фильтров и
+        загрузить его в адаптер. Набор — надмножество: всё, что пропускает
+        выражение, пропустит и адаптер. Каналы, условие на которых не сводится
+        к ID (None в результате), остаются без фильтров.
+        """
+        from .filter_expr import HW_EXT_FILTER_SLOTS, HW_STD_FILTER_SLOTS, compile_filter
+
+        flt = compile_filter(expr) if isinstance(expr, str) else expr
+        plan = flt.hw_filters(channels)
+
+        for channel, filters in plan.items():
+            await self.clear_all_filters(channel)
+            if not filters:
+                continue
+            std = [f for f in filters if not f.extended]
+            ext = [f for f in filters if f.extended]
+            for index, f in zip(HW_STD_FILTER_SLOTS, std):
+                await self.set_std_id_filter(channel, index, f.can_id, f.mask)
+            for index, f in zip(HW_EXT_FILTER_SLOTS, ext):
+                await self.set_ext_id_filter(channel, index, f.can_id, f.mask)
+            self._log.debug("HW filters ch=%d: %d std, %d ext", channel, len(std), len(ext))
+
+        return plan
+
+    # --- аппаратный шлюз между каналами (DI_GATEWAY) ------------------------------
+
+    async def gateway_set(
+        self,
+        src: int,
+        dst: int,
+        index: int,
+        *,
+        can_id: int = 0,
+        mask: int = 0,
+        extended: bool = False,
+        timeout: float = 1.0,
+    ) -> None:
+        """
+        Пробрасывать кадры src -> dst, у которых (id & mask) == (can_id & mask).
+        index — номер фильтра пары src/dst (0..filters-1 из gateway_info);
+        mask=0 — все кадры данного типа ID.
+        """
+        if index < 0:
+            raise ValueError("gateway filter index must be >= 0")
+        filter_type = 0x01 if extended else 0x00
+        await self._command(
+            Command.GATEWAY_SET,
+            header_flags=(src & 0x0F) * 0x20,
+            payload=struct.pack("<IIIII", index, dst, filter_type, can_id, mask),
+            timeout=timeout,
+        )
+
+    async def gateway_clear(self, src: int, dst: int, index: int, *, timeout: float = 1.0) -> None:
+        await self._command(
+            Command.GATEWAY_CLEAR,
+            header_flags=(src & 0x0F) * 0x20,
+            payload=struct.pack("<II", index, dst),
+            timeout=timeout,
+        )
+
+    # --- аппаратные задачи периодической отправки (DI_TX_TASK) ------------------
+
+    async def tx_task_set(
+        self,
+        index: int,
+        channel: int,
+        msg: CanMessage,
+        period_s: float,
+        *,
+        timeout: float = 1.0,
+    ) -> None:
+        """Запустить кадр msg с периодом period_s в аппаратной задаче index."""
+        _, frame = self._can_message_payload(msg, channel=channel)
+        period_us = max(1, int(round(period_s * 1e6)))
+        await self._command(
+            Command.TX_TASK_SET,
+            header_flags=(channel & 0x0F) * 0x20,
+            payload=struct.pack("<II", index, period_us) + frame,
+            timeout=timeout,
+        )
+
+    async def tx_task_update(
+        self,
+        index: int,
+        channel: int,
+        msg: CanMessage,
+        *,
+        timeout: float = 1.0,
+    ) -> None:
+        """Заменить кадр работающей аппаратной задачи, не сбивая её фазу."""
+        _, frame = self._can_message_payload(msg, channel=channel)
+        await self._command(
+            Command.TX_TASK_UPDATE,
+            header_flags=(channel & 0x0F) * 0x20,
+            payload=struct.pack("<I", index) + frame,
+            timeout=timeout,
+        )
+
+    async def tx_task_clear(self, index: int, *, timeout: float = 1.0) -> None:
+        await self._command(
+            Command.TX_TASK_CLEAR,
+            payload=struct.pack("<I", index),
+            timeout=timeout,
+        )
+
+    # --- буфер предзагруженной отправки (DI_TX_BUFFER) ---------------------------
+
+    async def tx_buffer_clear(self, *, timeout: float = 1.0) -> None:
+        await self._command(Command.TX_BUFFER_CLEAR, timeout=timeout)
+
+    async def tx_buffer_add(
+        self,
+        entries: Sequence[Tuple[int, int, CanMessage]],
+        *,
+        timeout: float = 1.0,
+    ) -> None:
+        """
+        Дописать в буфер адаптера кадры (delay_us, channel, msg); delay_us —
+        пауза перед кадром относительно предыдущего. Записи пакуются по
+        несколько в команду; без ответа одновременно не больше
+        TX_BUFFER_ADD_WINDOW команд, чтобы номера seq (их 255) не повторялись
+        среди ожидающих ответа.
+        """
+        packets: List[bytes] = []
+        cur = bytearray()
+        for delay_us, channel, msg in entries:
+            _, frame = self._can_message_payload(msg, channel=channel)
+            entry = TX_BUFFER_ENTRY.pack(delay_us, channel) + frame
+            if cur and len(cur) + len(entry) > 0xFF:
+                packets.append(bytes(cur))
+                cur = bytearray()
+            cur += entry
+        if cur:
+            packets.append(bytes(cur))
+
+        for i in range(0, len(packets), TX_BUFFER_ADD_WINDOW):
+            await asyncio.gather(*(
+                self._command(Command.TX_BUFFER_ADD, payload=p, timeout=timeout)
+                for p in packets[i:i + TX_BUFFER_ADD_WINDOW]
+            ))
+
+    async def tx_buffer_start(self, *, repeat: int = 1, timeout: float = 1.0) -> None:
+        """Запустить отправку буфера; repeat=0 — по кругу до tx_buffer_stop()."""
+        await self._command(Command.TX_BUFFER_START, payload=struct.pack("<I", repeat), timeout=timeout)
+
+    async def tx_buffer_stop(self, *, timeout: float = 1.0) -> None:
+        await self._command(Command.TX_BUFFER_STOP, timeout=timeout)
+
+    async def tx_buffer_status(self, *, timeout: float = 1.0) -> Tuple[int, int]:
+        """(кадров в очереди буфера, отправлено с момента старта)."""
+        _, resp = await self._command(Command.TX_BUFFER_STATUS, timeout=timeout)
+        if len(resp) < 8:
+            raise CommandError(f"Short TX_BUFFER_STATUS response: {resp.hex()}")
+        queued, sent = struct.unpack_from("<II", resp)
+        return queued, sent
+
+    # --- аппаратный ISO-TP (DI_ISOTP) --------------------------------------------
+
+    def _channel_flags(self, command: int, channel: int) -> int:
+        """Канал во флагах заголовка: биты 13..15 в расширенном (16 бит), 5..7 в коротком."""
+        if need_extended_header(command, self.experimental):
+            return (channel & 0x07) << 13
+        return (channel & 0x0F) * 0x20
+
+    async def isotp_open(
+        self,
+        channel: int,
+        tx_id: int,
+        rx_id: int,
+        on_pdu: IsoTpSink,
+        *,
+        extended: bool = False,
+        fd: bool = False,
+        brs: bool = False,
+        tx_dl: int = 8,
+        padding: Optional[int] = 0xAA,
+        block_size: int = 0,
+        st_min: int = 0,
+        n_bs_s: float = 1.0,
+        n_cr_s: float = 1.0,
+        timeout: float = 1.0,
+    ) -> int:
+        """
+        Открыть соединение в ISO-TP движке адаптера: сегментацию, FC и STmin
+        выполняет прошивка. Принятые PDU целиком приходят в on_pdu (вызывается
+        из read loop). Возвращает handle для isotp_send()/isotp_close().
+        """
+        handle = 0
+        while handle in self._isotp_sinks:
+            handle += 1
+        flags = (
+            (ISOTP_FLAG_EXTID if extended else 0)
+            | (ISOTP_FLAG_FD if fd else 0)
+            | (ISOTP_FLAG_BRS if brs else 0)
+            | (ISOTP_FLAG_PADDING if padding is not None else 0)
+        )
+        payload = ISOTP_OPEN_PARAMS.pack(
+            handle, tx_id, rx_id, flags,
+            block_size & 0xFF, st_min & 0xFF, (padding or 0) & 0xFF, tx_dl & 0xFF,
+            min(0xFFFF, int(n_bs_s * 1000)), min(0xFFFF, int(n_cr_s * 1000)),
+        )
+        self._isotp_sinks[handle] = (channel, on_pdu)
+        try:
+            await self._command(
+                Command.ISOTP_OPEN,
+                header_flags=self._channel_flags(Command.ISOTP_OPEN, channel),
+                payload=payload,
+                timeout=timeout,
+            )
+        except BaseException:
+            self._isotp_sinks.pop(handle, None)
+            raise
+        return handle
+
+    async def isotp_send(self, handle: int, channel: int, data: bytes, *, timeout: float = 5.0) -> None:
+        """Передать PDU; ACK приходит после отправки последнего CF (ERROR — N_Bs, OVFLW)."""
+        entry = self._isotp_sinks.get(handle)
+        if entry is not None and entry[0] != channel:
+            raise ValueError(f"ISO-TP handle {handle} is open on channel {entry[0]}, not {channel}")
+        await self._command(
+            Command.ISOTP_DATA,
+            header_flags=self._channel_flags(Command.ISOTP_DATA, channel),
+            payload=struct.pack("<I", handle) + bytes(data),
+            timeout=timeout,
+        )
+
+    async def isotp_close(self, handle: int, *, timeout: float = 1.0) -> None:
+        self._isotp_sinks.pop(handle, None)
+        await self._command(Command.ISOTP_CLOSE, payload=struct.pack("<I", handle), timeout=timeout)
+
     async def set_terminator(self, channel: int, enabled: bool) -> None:
 
         state = 0x01 if enabled else 0x00
@@ -1143,14 +1581,14 @@ class CarBusDevice:
             )
 
 
-    async def send_can(
+    def _can_message_payload(
         self,
         msg: CanMessage,
         *,
         channel: int,
         confirm: bool = False,
         echo: bool = False,
-    ) -> None:
+    ) -> Tuple[int, bytes]:
 
         if channel == 1:
             hflags = int(HeaderFlags.CHANNEL_1)
@@ -1193,7 +1631,20 @@ class CarBusDevice:
             int(raw_id),
             int(dlc),
         )
-        payload = header_struct + msg.data
+        return hflags, header_struct + msg.data
+
+    async def send_can(
+        self,
+        msg: CanMessage,
+        *,
+        channel: int,
+        confirm: bool = False,
+        echo: bool = False,
+    ) -> None:
+
+        hflags, payload = self._can_message_payload(
+            msg, channel=channel, confirm=confirm, echo=echo,
+        )
 
         await self._send_raw(
             Command.MESSAGE,
@@ -1202,6 +1653,54 @@ class CarBusDevice:
             expect_response=confirm,
         )
 
+    def _encode_can_batch(self, frames: Iterable[Tuple[int, CanMessage]], echo: bool) -> bytes:
+        if self._closed:
+            raise CarBusError("Device is closed")
+
+        out = bytearray()
+        for channel, msg in frames:
+            hflags, payload = self._can_message_payload(msg, channel=channel, echo=echo)
+            out += MsgCommandHeader(
+                command=Command.MESSAGE,
+                sequence=self._next_seq(),
+                flags=hflags,
+                dsize=len(payload),
+            ).to_bytes()
+            out += payload
+
+        if out and self._wire_log.isEnabledFor(logging.DEBUG):
+            self._wire_log.debug("TX MESSAGE batch dsize=%d :: %s", len(out), out.hex(" "))
+        return bytes(out)
+
+    async def send_can_batch(
+        self,
+        frames: Iterable[Tuple[int, CanMessage]],
+        *,
+        echo: bool = False,
+    ) -> None:
+        """
+        Отправить несколько кадров (channel, msg) одной записью в порт.
+        Подтверждения не запрашиваются — это путь для потоковой отправки.
+        """
+        if self.send_can_batch_nowait(frames, echo=echo):
+            await self._writer.drain()
+
+    def send_can_batch_nowait(
+        self,
+        frames: Iterable[Tuple[int, CanMessage]],
+        *,
+        echo: bool = False,
+    ) -> int:
+        """
+        То же, что send_can_batch(), но синхронно и без drain(): кадры сразу
+        уходят в транспорт. Можно вызывать из RX tap и call_soon-колбэков.
+        Возвращает число записанных байт.
+        """
+        data = self._encode_can_batch(frames, echo)
+        if data:
+            self._writer.write(data)
+        return len(data)
+
     async def receive_can(self) -> tuple[int, CanMessage]:
         return await self._rx_queue.get()
 
@@ -1220,6 +1719,7 @@ class CarBusDevice:
             return None
 
     async def _read_loop(self) -> None:
+        experimental = self.experimental
         try:
             while not self._closed:
                 cmd_bytes = await self._reader.readexactly(1)
@@ -1227,7 +1727,7 @@ class CarBusDevice:
                     break
                 cmd = cmd_bytes[0]
 
-                if need_extended_header(cmd):
+                if need_extended_header(cmd, experimental):
                     header_rest = await self._reader.readexactly(5)
                     header = MsgCommandHeader.from_bytes(cmd_bytes + header_rest)
                     flags = header.flags
@@ -1272,6 +1772,10 @@ class CarBusDevice:
                         pending.future.set_result((cmd, flags, payload))
                     continue
 
+                if cmd == Command.ISOTP_DATA and "isotp" in experimental:
+                    self._handle_isotp_data(flags, payload)
+                    continue
+
                 if seq in self._pending:
                     pending = self._pending.pop(seq)
                     if not pending.future.done():
@@ -1318,16 +1822,7 @@ class CarBusDevice:
         else:
             can_id = (id_raw) & 0x7FF
 
-        if header_flags & int(HeaderFlags.CHANNEL_1):
-            channel = 1
-        elif header_flags & int(HeaderFlags.CHANNEL_2):
-            channel = 2
-        elif header_flags & int(HeaderFlags.CHANNEL_3):
-            channel = 3
-        elif header_flags & int(HeaderFlags.CHANNEL_4):
-            channel = 4
-        else:
-            channel = 0
+        channel = _channel_from_header_flags(header_flags)
 
         msg = CanMessage.from_bus_payload(
             flags=bus_flags,
@@ -1337,9 +1832,27 @@ class CarBusDevice:
             data=data,
         )
 
+        for tap in self._rx_taps:
+            try:
+                tap(channel, msg)
+            except Exception:
+                self._log.exception("RX tap failed (ch=%s id=0x%X)", channel, msg.can_id)
+
         self._fire_can_hooks(channel, msg)
 
-        await self._rx_queue.put((channel, msg))
+        if self._rx_queue_enabled:
+            q = self._rx_queue
+            if q.full():
+                # receive_can() никто не читает (или не успевает) — вытесняем старый кадр
+                q.get_nowait()
+                if not self.rx_queue_dropped:
+                    self._log.warning(
+                        "RX queue full (%d frames), dropping oldest; "
+                        "call set_rx_queue_enabled(False) if receive_can() is not used",
+                        q.maxsize,
+                    )
+                self.rx_queue_dropped += 1
+            q.put_nowait((channel, msg))
 
         if channel != 0:
             q = self._rx_channel_queues.get(channel)
@@ -1347,11 +1860,38 @@ class CarBusDevice:
                 await q.put(msg)
 
 
+    def _handle_isotp_data(self, header_flags: int, payload: bytes) -> None:
+        if len(payload) < 4:
+            return
+        (handle,) = struct.unpack_from("<I", payload)
+        entry = self._isotp_sinks.get(handle)
+        if entry is None:
+            self._log.debug("ISO-TP PDU for unknown handle %d dropped", handle)
+            return
+        channel, sink = entry
+        rx_channel = _channel_from_header_flags(header_flags)
+        if rx_channel != channel:
+            self._log.warning(
+                "ISO-TP PDU for handle %d on channel %d, expected %d: dropped", handle, rx_channel, channel
+            )
+            return
+        try:
+            sink(payload[4:])
+        except Exception:
+            self._log.exception("ISO-TP sink failed (handle=%d)", handle)
+
     async def _handle_bus_error(self, header_flags: int, payload: bytes) -> None:
         self._log.warning(
             "BUS_ERROR: flags=0x%04X, payload=%s", header_flags, payload.hex(" ")
         )
 
+        channel = _channel_from_header_flags(header_flags)
+        for tap in self._bus_error_taps:
+            try:
+                tap(channel, header_flags, payload)
+            except Exception:
+                self._log.exception("BUS_ERROR tap failed (ch=%s)", channel)
+
 
 async def _example() -> None:
     dev = await CarBusDevice.open("COM6", baudrate=115200)
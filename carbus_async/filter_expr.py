@@ -0,0 +1,544 @@
+"""
+Язык фильтров кадров.
+
+    ch == 1 and id in 0x700..0x7FF and data[0] & 0xF0 == 0x10
+    ext and id in {0x18DAF110, 0x18DB33F1}
+    not rtr and (id == 0x100 or id in [0x200..0x20F, 0x300]) and len >= 2
+
+Поля: ch (channel), id (can_id), ext (extended), rtr, fd, brs, len (dlc),
+data[N]. Операции: == != < <= > >=, & | ^ ~ << >>, and/or/not (&&, ||, !),
+in / not in с диапазонами a..b и множествами {..}/[..].
+Приоритеты как в Python: побитовые операции связывают сильнее сравнений.
+Обращение к data[N] за пределами кадра делает сравнение ложным.
+
+Выражение компилируется один раз в обычную Python-функцию (channel, msg) -> bool;
+большие множества 11-битных ID проверяются по битовой карте.
+"""
+
+from __future__ import annotations
+
+import bisect
+import functools
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from .messages import CanMessage
+
+ID_MAX_STD = 0x7FF
+ID_MAX_EXT = 0x1FFFFFFF
+
+# индексы аппаратных фильтров (см. README): 11 bit — 0..27, 29 bit — 28..35
+HW_STD_FILTER_SLOTS = tuple(range(0, 28))
+HW_EXT_FILTER_SLOTS = tuple(range(28, 36))
+
+
+class FilterSyntaxError(ValueError):
+    pass
+
+
+FilterLike = Union[str, "CanFilter", Callable[[int, CanMessage], bool]]
+
+_FIELDS = {
+    "ch": "ch", "channel": "ch",
+    "id": "id", "can_id": "id",
+    "ext": "ext", "extended": "ext",
+    "rtr": "rtr", "fd": "fd", "brs": "brs",
+    "len": "len", "dlc": "len", "length": "len",
+}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+      (?P<num>0[xX][0-9a-fA-F_]+|0[bB][01_]+|\d[\d_]*)
+     |(?P<name>[A-Za-z_][A-Za-z_0-9]*)
+     |(?P<op>\.\.|==|!=|<=|>=|<<|>>|&&|\|\||[<>&|^~!()\[\]{},-])
+    )""", re.VERBOSE)
+
+_CMP_OPS = ("==", "!=", "<", "<=", ">", ">=")
+_SWAP = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+def _tokenize(src: str) -> List[Tuple[str, object]]:
+    out: List[Tuple[str, object]] = []
+    pos = 0
+    src = src.rstrip()
+    while pos < len(src):
+        m = _TOKEN_RE.match(src, pos)
+        if m is None or m.end() == pos:
+            raise FilterSyntaxError(f"unexpected character at {pos}: {src[pos:pos + 10]!r}")
+        pos = m.end()
+        if m.group("num") is not None:
+            out.append(("num", int(m.group("num").replace("_", ""), 0)))
+        elif m.group("name") is not None:
+            word = m.group("name")
+            lw = word.lower()
+            if lw in ("and", "or", "not", "in", "true", "false", "data"):
+                out.append((lw, lw))
+            elif lw in _FIELDS:
+                out.append(("field", _FIELDS[lw]))
+            else:
+                raise FilterSyntaxError(f"unknown name {word!r}")
+        else:
+            op = m.group("op")
+            op = {"&&": "and", "||": "or", "!": "not"}.get(op, op)
+            out.append((op, op))
+    out.append(("eof", None))
+    return out
+
+
+# --- разбор -------------------------------------------------------------------
+#
+# Узлы AST — кортежи:
+#   ("num", v) ("field", name) ("byte", n) ("bin", op, a, b) ("unary", op, a)
+#   ("cmp", op, a, b) ("in", a, ranges, negate) ("and", [..]) ("or", [..]) ("not", a)
+
+
+class _Parser:
+    def __init__(self, src: str) -> None:
+        self.toks = _tokenize(src)
+        self.i = 0
+
+    def peek(self, k: int = 0) -> str:
+        return self.toks[self.i + k][0]
+
+    def take(self, kind: Optional[str] = None):
+        tok = self.toks[self.i]
+        if kind is not None and tok[0] != kind:
+            raise FilterSyntaxError(f"expected {kind!r}, got {tok[0]!r}")
+        self.i += 1
+        return tok[1]
+
+    def parse(self):
+        node = self.or_expr()
+        if self.peek() != "eof":
+            raise FilterSyntaxError(f"unexpected {self.peek()!r}")
+        return node
+
+    def or_expr(self):
+        items = [self.and_expr()]
+        while self.peek() == "or":
+            self.take()
+            items.append(self.and_expr())
+        return items[0] if len(items) == 1 else ("or", items)
+
+    def and_expr(self):
+        items = [self.not_expr()]
+        while self.peek() == "and":
+            self.take()
+            items.append(self.not_expr())
+        return items[0] if len(items) == 1 else ("and", items)
+
+    def not_expr(self):
+        if self.peek() == "not":
+            self.take()
+            return ("not", self.not_expr())
+        return self.comparison()
+
+    def comparison(self):
+        left = self.bitor()
+        kind = self.peek()
+        if kind in _CMP_OPS:
+            self.take()
+            return ("cmp", kind, left, self.bitor())
+        if kind == "in" or (kind == "not" and self.peek(1) == "in"):
+            negate = kind == "not"
+            if negate:
+                self.take()
+            self.take("in")
+            return ("in", left, self.range_set(), negate)
+        return left
+
+    def range_set(self) -> Tuple[Tuple[int, int], ...]:
+        if self.peek() in ("{", "["):
+            close = "}" if self.take() == "{" else "]"
+            items = [self.range_item()]
+            while self.peek() == ",":
+                self.take()
+                items.append(self.range_item())
+            self.take(close)
+        else:
+            items = [self.range_item()]
+        return _merge_ranges(items)
+
+    def range_item(self) -> Tuple[int, int]:
+        lo = self.take("num")
+        if self.peek() == "..":
+            self.take()
+            hi = self.take("num")
+            if hi < lo:
+                raise FilterSyntaxError(f"empty range {lo:#x}..{hi:#x}")
+            return lo, hi
+        return lo, lo
+
+    def bitor(self):
+        node = self.bitxor()
+        while self.peek() == "|":
+            self.take()
+            node = ("bin", "|", node, self.bitxor())
+        return node
+
+    def bitxor(self):
+        node = self.bitand()
+        while self.peek() == "^":
+            self.take()
+            node = ("bin", "^", node, self.bitand())
+        return node
+
+    def bitand(self):
+        node = self.shift()
+        while self.peek() == "&":
+            self.take()
+            node = ("bin", "&", node, self.shift())
+        return node
+
+    def shift(self):
+        node = self.unary()
+        while self.peek() in ("<<", ">>"):
+            op = self.take()
+            node = ("bin", op, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() in ("~", "-"):
+            op = self.take()
+            return ("unary", op, self.unary())
+        return self.primary()
+
+    def primary(self):
+        kind = self.peek()
+        if kind == "num":
+            return ("num", self.take())
+        if kind in ("true", "false"):
+            self.take()
+            return ("num", int(kind == "true"))
+        if kind == "field":
+            return ("field", self.take())
+        if kind == "data":
+            self.take()
+            self.take("[")
+            n = self.take("num")
+            self.take("]")
+            return ("byte", n)
+        if kind == "(":
+            self.take()
+            node = self.or_expr()
+            self.take(")")
+            return node
+        raise FilterSyntaxError(f"unexpected {kind!r}")
+
+
+def _merge_ranges(items: Iterable[Tuple[int, int]]) -> Tuple[Tuple[int, int], ...]:
+    out: List[List[int]] = []
+    for lo, hi in sorted(items):
+        if out and lo <= out[-1][1] + 1:
+            out[-1][1] = max(out[-1][1], hi)
+        else:
+            out.append([lo, hi])
+    return tuple((lo, hi) for lo, hi in out)
+
+
+# --- компиляция ---------------------------------------------------------------
+
+_FIELD_CODE = {
+    "ch": "ch",
+    "id": "i",
+    "ext": "m.extended",
+    "rtr": "m.rtr",
+    "fd": "m.fd",
+    "brs": "m.brs",
+    "len": "len(d)",
+}
+
+_BITMAP_MIN_RANGES = 4
+
+
+def _in_ranges(x: int, starts: Sequence[int], ends: Sequence[int]) -> bool:
+    k = bisect.bisect_right(starts, x) - 1
+    return k >= 0 and x <= ends[k]
+
+
+class _CodeGen:
+    def __init__(self) -> None:
+        self.consts: Dict[str, object] = {"_in_ranges": _in_ranges}
+        self.uses_id = False
+        self.uses_data = False
+
+    def const(self, value) -> str:
+        name = f"_c{len(self.consts)}"
+        self.consts[name] = value
+        return name
+
+    def max_byte(self, node) -> int:
+        kind = node[0]
+        if kind == "byte":
+            return node[1]
+        if kind in ("bin", "cmp"):
+            return max(self.max_byte(node[2]), self.max_byte(node[3]))
+        if kind == "unary":
+            return self.max_byte(node[2])
+        if kind == "in":
+            return self.max_byte(node[1])
+        return -1
+
+    def guarded(self, node, code: str) -> str:
+        k = self.max_byte(node)
+        if k < 0:
+            return code
+        return f"(len(d) > {k} and {code})"
+
+    def value(self, node) -> str:
+        kind = node[0]
+        if kind == "num":
+            return repr(node[1])
+        if kind == "field":
+            if node[1] == "id":
+                self.uses_id = True
+            if node[1] == "len":
+                self.uses_data = True
+            return _FIELD_CODE[node[1]]
+        if kind == "byte":
+            self.uses_data = True
+            return f"d[{node[1]}]"
+        if kind == "bin":
+            return f"({self.value(node[2])} {node[1]} {self.value(node[3])})"
+        if kind == "unary":
+            return f"({node[1]}{self.value(node[2])})"
+        return f"({self.boolean(node)})"
+
+    def membership(self, x: str, ranges: Tuple[Tuple[int, int], ...]) -> str:
+        if len(ranges) < _BITMAP_MIN_RANGES:
+            parts = [f"{x} == {lo}" if lo == hi else f"{lo} <= {x} <= {hi}" for lo, hi in ranges]
+            return " or ".join(parts)
+        if ranges[-1][1] <= ID_MAX_STD:
+            bm = bytearray(ID_MAX_STD + 1)
+            for lo, hi in ranges:
+                bm[lo:hi + 1] = b"\x01" * (hi - lo + 1)
+            return f"({x} <= {ID_MAX_STD} and {self.const(bytes(bm))}[{x}] == 1)"
+        starts = self.const(tuple(lo for lo, _ in ranges))
+        ends = self.const(tuple(hi for _, hi in ranges))
+        return f"_in_ranges({x}, {starts}, {ends})"
+
+    def boolean(self, node) -> str:
+        kind = node[0]
+        if kind == "and":
+            return " and ".join(f"({self.boolean(n)})" for n in node[1])
+        if kind == "or":
+            return " or ".join(f"({self.boolean(n)})" for n in node[1])
+        if kind == "not":
+            return f"not ({self.boolean(node[1])})"
+        if kind == "cmp":
+            code = f"{self.value(node[2])} {node[1]} {self.value(node[3])}"
+            return self.guarded(node, code)
+        if kind == "in":
+            x = self.value(node[1])
+            code = f"({self.membership(x, node[2])})"
+            if node[3]:
+                code = f"not {code}"
+            return self.guarded(node, code)
+        return self.guarded(node, f"bool({self.value(node)})")
+
+
+class CanFilter:
+    """
+    Скомпилированный фильтр: вызывается как predicate(channel, msg) -> bool,
+    поэтому подходит везде, где принимается CanPred (хуки, подписки, запись).
+    """
+
+    __slots__ = ("source", "code", "_fn", "_ast")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self._ast = _Parser(source).parse()
+        gen = _CodeGen()
+        body = gen.boolean(self._ast)
+        lines = ["def _filter(ch, m):"]
+        if gen.uses_id:
+            lines.append("    i = m.can_id")
+        if gen.uses_data:
+            lines.append("    d = m.data")
+        lines.append(f"    return bool({body})")
+        self.code = "\n".join(lines)
+        ns: Dict[str, object] = dict(gen.consts)
+        exec(compile(self.code, f"<filter {source!r}>", "exec"), ns)
+        self._fn = ns["_filter"]
+
+    def __call__(self, channel: int, msg: CanMessage) -> bool:
+        return self._fn(channel, msg)
+
+    def __repr__(self) -> str:
+        return f"CanFilter({self.source!r})"
+
+    def hw_filters(self, channels: Iterable[int] = (1, 2, 3, 4)) -> Dict[int, Optional[List["HwFilter"]]]:
+        """
+        Набор аппаратных фильтров (id/mask) по каналам, пропускающий как минимум
+        всё, что пропускает выражение. None — канал ограничить нельзя
+        (условие не сводится к ID), нужно принимать всё. Точная проверка
+        остаётся за программным фильтром.
+        """
+        return hw_filter_plan(self._ast, channels)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_filter(source: str) -> CanFilter:
+    return CanFilter(source)
+
+
+def as_filter(flt: Optional[FilterLike]) -> Optional[Callable[[int, CanMessage], bool]]:
+    """Строку компилирует, callable (в т.ч. CanFilter) возвращает как есть."""
+    if flt is None or callable(flt):
+        return flt
+    if isinstance(flt, str):
+        return compile_filter(flt)
+    raise TypeError(f"filter must be str or callable, got {type(flt).__name__}")
+
+
+# --- аппаратные фильтры --------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class HwFilter:
+    extended: bool
+    can_id: int
+    mask: int
+
+
+# Сводка ветви: (каналы | None, диапазоны ID | None, extended | None); None — без ограничения
+_Branch = Tuple[Optional[frozenset], Optional[Tuple[Tuple[int, int], ...]], Optional[bool]]
+_ANY: _Branch = (None, None, None)
+_MAX_BRANCHES = 64
+
+
+def _field_const(node) -> Optional[Tuple[str, str, int]]:
+    """cmp field <op> num (в любом порядке) -> (field, op, value)."""
+    op, a, b = node[1], node[2], node[3]
+    if a[0] == "field" and b[0] == "num":
+        return a[1], op, b[1]
+    if b[0] == "field" and a[0] == "num":
+        return b[1], _SWAP[op], a[1]
+    return None
+
+
+def _intersect(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    out = []
+    for lo1, hi1 in a:
+        for lo2, hi2 in b:
+            lo, hi = max(lo1, lo2), min(hi1, hi2)
+            if lo <= hi:
+                out.append((lo, hi))
+    return _merge_ranges(out)
+
+
+def _branches(node) -> List[_Branch]:
+    kind = node[0]
+    if kind == "or":
+        out: List[_Branch] = []
+        for n in node[1]:
+            out.extend(_branches(n))
+        return out if len(out) <= _MAX_BRANCHES else [_ANY]
+    if kind == "and":
+        acc: List[_Branch] = [_ANY]
+        for n in node[1]:
+            nxt: List[_Branch] = []
+            for c1, r1, e1 in acc:
+                for c2, r2, e2 in _branches(n):
+                    if e1 is not None and e2 is not None and e1 != e2:
+                        continue
+                    ch = c1 & c2 if c1 is not None and c2 is not None else (c1 if c2 is None else c2)
+                    nxt.append((ch, _intersect(r1, r2), e1 if e1 is not None else e2))
+            if len(nxt) > _MAX_BRANCHES:
+                return [_ANY]
+            acc = nxt
+        return acc
+    if kind == "field" and node[1] == "ext":
+        return [(None, None, True)]
+    if kind == "not" and node[1] == ("field", "ext"):
+        return [(None, None, False)]
+    if kind == "in" and node[1][0] == "field" and not node[3]:
+        name, ranges = node[1][1], node[2]
+        if name == "id":
+            return [(None, ranges, None)]
+        if name == "ch":
+            return [(frozenset(v for lo, hi in ranges for v in range(lo, min(hi, 15) + 1)), None, None)]
+    if kind == "cmp":
+        fc = _field_const(node)
+        if fc is not None:
+            name, op, v = fc
+            if name == "ch" and op == "==":
+                return [(frozenset((v,)), None, None)]
+            if name == "ext" and op in ("==", "!="):
+                return [(None, None, bool(v) == (op == "=="))]
+            if name == "id":
+                r = {
+                    "==": ((v, v),),
+                    "<": ((0, v - 1),) if v > 0 else (),
+                    "<=": ((0, v),),
+                    ">": ((v + 1, ID_MAX_EXT),),
+                    ">=": ((v, ID_MAX_EXT),),
+                }.get(op)
+                if r is not None:
+                    return [(None, r, None)]
+    return [_ANY]
+
+
+def _range_blocks(lo: int, hi: int, width: int) -> List[Tuple[int, int]]:
+    """Покрытие [lo, hi] выровненными блоками -> [(id, mask)]."""
+    full = (1 << width) - 1
+    out = []
+    while lo <= hi:
+        size = lo & -lo if lo else 1 << width
+        while size > hi - lo + 1:
+            size >>= 1
+        out.append((lo, full & ~(size - 1)))
+        lo += size
+    return out
+
+
+def _prefix_block(lo: int, hi: int, width: int) -> Tuple[int, int]:
+    full = (1 << width) - 1
+    diff = lo ^ hi
+    mask = full & ~((1 << diff.bit_length()) - 1)
+    return lo & mask, mask
+
+
+def _cover(ranges: Tuple[Tuple[int, int], ...], width: int, limit: int) -> List[Tuple[int, int]]:
+    rs = [list(r) for r in ranges]
+    while True:
+        blocks = [b for lo, hi in rs for b in _range_blocks(lo, hi, width)]
+        if len(blocks) <= limit:
+            return blocks
+        if len(rs) == 1:
+            return [_prefix_block(rs[0][0], rs[0][1], width)]
+        # склеиваем два соседних диапазона с наименьшим зазором
+        k = min(range(len(rs) - 1), key=lambda j: rs[j + 1][0] - rs[j][1])
+        rs[k][1] = rs[k + 1][1]
+        del rs[k + 1]
+
+
+def hw_filter_plan(ast, channels: Iterable[int]) -> Dict[int, Optional[List[HwFilter]]]:
+    branches = _branches(ast)
+    plan: Dict[int, Optional[List[HwFilter]]] = {}
+    for ch in channels:
+        mine = [b for b in branches if b[0] is None or ch in b[0]]
+        if not mine:
+            # канал выражением не выбирается вовсе — пусть отсечёт программный фильтр
+            plan[ch] = None
+            continue
+        if any(r is None for _, r, _ in mine):
+            plan[ch] = None
+            continue
+        std: List[Tuple[int, int]] = []
+        ext: List[Tuple[int, int]] = []
+        for _, ranges, is_ext in mine:
+            for lo, hi in ranges:
+                if is_ext is not True and lo <= ID_MAX_STD:
+                    std.append((lo, min(hi, ID_MAX_STD)))
+                if is_ext is not False:
+                    ext.append((lo, min(hi, ID_MAX_EXT)))
+        out = [HwFilter(False, i, m) for i, m in _cover(_merge_ranges(std), 11, len(HW_STD_FILTER_SLOTS))] if std else []
+        out += [HwFilter(True, i, m) for i, m in _cover(_merge_ranges(ext), 29, len(HW_EXT_FILTER_SLOTS))] if ext else []
+        plan[ch] = out
+    return plan
@@ -0,0 +1,377 @@
+"""
+Шлюз между каналами (и адаптерами).
+
+Маршрут src -> dst с фильтром по id/mask программируется в адаптер
+(DI_GATEWAY): кадры пробрасываются прошивкой, без USB и Python. Остальное
+(выражение filter=, замена ID, правка данных, ограничение частоты, пересылка
+на другой адаптер, нет пары src/dst в gateway_info, кончились фильтры пары,
+адаптер отверг команду) исполняет программный движок:
+
+- кадр обрабатывается прямо в read loop (RX tap), без очередей и задач;
+- правила заранее разложены по (канал, ID): точные ID — словарь, маски и
+  «все кадры» — список канала; результат поиска кэшируется по ID;
+- правка данных сведена к двум целочисленным операциям над payload;
+- исходящие кадры копятся и уходят одной записью на адаптер через
+  send_can_batch_nowait() в том же проходе цикла событий.
+
+    gw = CanGateway(dev)
+    gw.add_route(1, 2, can_id=0x700, mask=0x700)          # аппаратно
+    gw.add_route(2, 1, can_id=0x7DF, new_id=0x7E0)        # программно
+    gw.add_route(1, 1, dst_dev=dev2, can_id=0x100, min_interval_s=0.1,
+                 patch=b"\\x00\\x80", patch_mask=b"\\x00\\xF0")
+    await gw.start()
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .exceptions import CarBusError
+from .filter_expr import FilterLike, as_filter
+from .messages import CanMessage
+from .timing import clock
+
+log = logging.getLogger("carbus_async.gateway")
+
+ID_MASK_STD = 0x7FF
+ID_MASK_EXT = 0x1FFFFFFF
+
+# (can_id, mask, extended) — один аппаратный фильтр
+HwEntry = Tuple[int, int, bool]
+# произвольная правка: вернуть новый кадр или None — не пересылать
+RouteModify = Callable[[int, CanMessage], Optional[CanMessage]]
+
+_LOOKUP_CACHE_LIMIT = 1 << 16
+
+
+def _key(channel: int, extended: bool, can_id: int) -> int:
+    return (channel << 32) | (int(extended) << 31) | can_id
+
+
+@dataclass
+class GatewayRoute:
+    src: int
+    dst: int
+    can_id: Optional[int] = None        # None — все кадры (и 11, и 29 бит)
+    mask: Optional[int] = None          # None — точное совпадение can_id
+    extended: bool = False
+    filter: Optional[FilterLike] = None
+    dst_dev: object = None              # другой адаптер; None — тот же
+    new_id: Optional[int] = None        # замена ID
+    new_extended: Optional[bool] = None
+    patch: Optional[bytes] = None       # данные, накладываемые по patch_mask
+    patch_mask: Optional[bytes] = None  # None — patch целиком
+    modify: Optional[RouteModify] = None
+    min_interval_s: Optional[float] = None  # не чаще раза за интервал на ID
+
+    hardware: bool = False              # маршрут исполняет адаптер
+    matched: int = 0                    # кадров прошло фильтр (программно)
+    forwarded: int = 0                  # переслано программно
+    suppressed: int = 0                 # отброшено ограничением частоты
+    dropped: int = 0                    # отброшено modify (вернул None)
+
+    _pred: Optional[Callable[[int, CanMessage], bool]] = field(default=None, repr=False)
+    _hw_slots: List[int] = field(default_factory=list, repr=False)
+    _last: Dict[int, float] = field(default_factory=dict, repr=False)
+    _keep: int = field(default=-1, repr=False)
+    _set: int = field(default=0, repr=False)
+
+    def __post_init__(self) -> None:
+        self._pred = as_filter(self.filter)
+        if self.patch is not None:
+            mask = self.patch_mask if self.patch_mask is not None else b"\xFF" * len(self.patch)
+            if len(mask) != len(self.patch):
+                raise ValueError("patch and patch_mask must have the same length")
+            m = int.from_bytes(mask, "little")
+            self._keep = ~m
+            self._set = int.from_bytes(self.patch, "little") & m
+
+    @property
+    def software_only(self) -> bool:
+        return (
+            self._pred is not None
+            or self.dst_dev is not None
+            or self.new_id is not None
+            or self.new_extended is not None
+            or self.patch is not None
+            or self.modify is not None
+            or self.min_interval_s is not None
+        )
+
+    @property
+    def exact(self) -> bool:
+        """Маршрут на один ID — индексируется словарём."""
+        if self.can_id is None:
+            return False
+        full = ID_MASK_EXT if self.extended else ID_MASK_STD
+        return self.mask is None or self.mask & full == full
+
+    def hw_entries(self) -> Optional[List[HwEntry]]:
+        """Аппаратные фильтры маршрута; None — аппаратно не выражается."""
+        if self.software_only:
+            return None
+        if self.can_id is None:
+            return [(0, 0, False), (0, 0, True)]
+        full = ID_MASK_EXT if self.extended else ID_MASK_STD
+        mask = full if self.mask is None else self.mask & full
+        return [(self.can_id & mask, mask, self.extended)]
+
+    def id_matches(self, extended: bool, can_id: int) -> bool:
+        if self.can_id is None:
+            return True
+        if extended != self.extended:
+            return False
+        full = ID_MASK_EXT if self.extended else ID_MASK_STD
+        mask = full if self.mask is None else self.mask
+        return not (can_id ^ self.can_id) & mask
+
+    def matches(self, channel: int, msg: CanMessage) -> bool:
+        if not self.id_matches(msg.extended, msg.can_id):
+            return False
+        return self._pred is None or self._pred(channel, msg)
+
+    def rewrite(self, channel: int, msg: CanMessage) -> Optional[CanMessage]:
+        """Кадр для отправки; без правок — тот же объект."""
+        if self.new_id is not None or self.new_extended is not None or self.patch is not None:
+            data = msg.data
+            if self.patch is not None and data:
+                n = len(data)
+                d = (int.from_bytes(data, "little") & self._keep) | self._set
+                data = (d & ((1 << (8 * n)) - 1)).to_bytes(n, "little")
+            msg = CanMessage(
+                can_id=self.new_id if self.new_id is not None else msg.can_id,
+                data=data,
+                extended=self.new_extended if self.new_extended is not None else msg.extended,
+                rtr=msg.rtr,
+                fd=msg.fd,
+                brs=msg.brs,
+                timestamp_us=msg.timestamp_us,
+            )
+        if self.modify is not None:
+            return self.modify(channel, msg)
+        return msg
+
+
+class CanGateway:
+    """
+    Набор маршрутов шлюза.
+
+    hardware=False — не трогать DI_GATEWAY, всё пересылать программно.
+    Маршруты добавляются до start(); stop() снимает аппаратные фильтры.
+    """
+
+    def __init__(self, dev, *, hardware: bool = True) -> None:
+        self._dev = dev
+        self.hardware = hardware
+        self.routes: List[GatewayRoute] = []
+        self.tx_errors = 0
+
+        self._exact: Dict[int, List[GatewayRoute]] = {}
+        self._wild: Dict[int, List[GatewayRoute]] = {}
+        self._lookup: Dict[int, Tuple[GatewayRoute, ...]] = {}
+        self._order: Dict[int, int] = {}
+        self._out: Dict[int, Tuple[object, List[Tuple[int, CanMessage]]]] = {}
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self._attached = False
+        self._started = False
+
+    def add_route(
+        self,
+        src: int,
+        dst: int,
+        *,
+        can_id: Optional[int] = None,
+        mask: Optional[int] = None,
+        extended: bool = False,
+        filter: Optional[FilterLike] = None,
+        dst_dev=None,
+        new_id: Optional[int] = None,
+        new_extended: Optional[bool] = None,
+        patch: Optional[bytes] = None,
+        patch_mask: Optional[bytes] = None,
+        modify: Optional[RouteModify] = None,
+        min_interval_s: Optional[float] = None,
+    ) -> GatewayRoute:
+        if self._started:
+            raise CarBusError("Gateway is running; stop() it before changing routes")
+        if src == dst and (dst_dev is None or dst_dev is self._dev):
+            raise ValueError("src and dst must differ")
+        route = GatewayRoute(
+            src, dst,
+            can_id=can_id, mask=mask, extended=extended, filter=filter,
+            dst_dev=None if dst_dev is self._dev else dst_dev,
+            new_id=new_id, new_extended=new_extended,
+            patch=bytes(patch) if patch is not None else None,
+            patch_mask=bytes(patch_mask) if patch_mask is not None else None,
+            modify=modify, min_interval_s=min_interval_s,
+        )
+        self.routes.append(route)
+        return route
+
+    # --- запуск / остановка ---------------------------------------------------
+
+    async def _hw_capacity(self) -> Dict[Tuple[int, int], int]:
+        if not self.hardware:
+            return {}
+        if not self._dev.experimental_enabled("gateway"):
+            log.debug("Gateway commands are not enabled (experimental), routing in software")
+            return {}
+        try:
+            info = await self._dev.get_device_info()
+        except CarBusError as e:
+            log.info("DEVICE_INFO failed, gateway runs in software: %s", e)
+            return {}
+        if not info.feature_gateway:
+            return {}
+        return {(g["src"], g["dst"]): g["filters"] for g in info.gateway_info}
+
+    async def _program(self, route: GatewayRoute, entries: List[HwEntry], first: int) -> bool:
+        slots: List[int] = []
+        try:
+            for i, (can_id, mask, extended) in enumerate(entries):
+                index = first + i
+                await self._dev.gateway_set(route.src, route.dst, index,
+                                            can_id=can_id, mask=mask, extended=extended)
+                slots.append(index)
+        except CarBusError as e:
+            log.info("Gateway %d->%d rejected by adapter, using software: %s", route.src, route.dst, e)
+            route._hw_slots = slots
+            await self._clear_hw(route)
+            return False
+        route._hw_slots = slots
+        route.hardware = True
+        return True
+
+    async def start(self) -> None:
+        if self._started:
+            return
+        self._started = True
+        capacity = await self._hw_capacity()
+        used: Dict[Tuple[int, int], int] = {}
+        software: List[GatewayRoute] = []
+
+        for route in self.routes:
+            entries = route.hw_entries()
+            pair = (route.src, route.dst)
+            free = capacity.get(pair, 0) - used.get(pair, 0)
+            if entries is not None and len(entries) <= free:
+                if await self._program(route, entries, used.get(pair, 0)):
+                    used[pair] = used.get(pair, 0) + len(entries)
+                    log.debug("Gateway %d->%d in hardware: %s", route.src, route.dst, entries)
+                    continue
+                capacity = {}   # адаптер не принимает команду — дальше не пробуем
+            software.append(route)
+
+        self._build_index(software)
+        if software:
+            self._dev.add_rx_tap(self._on_frame)
+            self._attached = True
+            log.debug("Gateway software routes: %d", len(software))
+
+    def _build_index(self, routes: List[GatewayRoute]) -> None:
+        self._exact.clear()
+        self._wild.clear()
+        self._lookup.clear()
+        self._order = {id(r): i for i, r in enumerate(routes)}
+        for r in routes:
+            r._last.clear()
+            if r.exact:
+                self._exact.setdefault(_key(r.src, r.extended, r.can_id), []).append(r)
+            else:
+                self._wild.setdefault(r.src, []).append(r)
+
+    def _resolve(self, key: int, channel: int, extended: bool, can_id: int) -> Tuple[GatewayRoute, ...]:
+        routes = list(self._exact.get(key, ()))
+        routes += [r for r in self._wild.get(channel, ()) if r.id_matches(extended, can_id)]
+        routes.sort(key=lambda r: self._order[id(r)])
+        if len(self._lookup) >= _LOOKUP_CACHE_LIMIT:
+            self._lookup.clear()
+        res = self._lookup[key] = tuple(routes)
+        return res
+
+    async def _clear_hw(self, route: GatewayRoute) -> None:
+        for index in route._hw_slots:
+            try:
+                await self._dev.gateway_clear(route.src, route.dst, index)
+            except CarBusError as e:
+                log.warning("Failed to clear gateway %d->%d #%d: %s", route.src, route.dst, index, e)
+        route._hw_slots = []
+        route.hardware = False
+
+    async def stop(self) -> None:
+        if self._attached:
+            self._dev.remove_rx_tap(self._on_frame)
+            self._attached = False
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush()
+        for route in self.routes:
+            if route.hardware:
+                await self._clear_hw(route)
+        self._build_index([])
+        self._started = False
+
+    async def __aenter__(self) -> "CanGateway":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.stop()
+
+    # --- программная пересылка ------------------------------------------------
+
+    def _on_frame(self, channel: int, msg: CanMessage) -> None:
+        key = _key(channel, msg.extended, msg.can_id)
+        routes = self._lookup.get(key)
+        if routes is None:
+            routes = self._resolve(key, channel, msg.extended, msg.can_id)
+        if not routes:
+            return
+
+        now = None
+        for route in routes:
+            if route._pred is not None and not route._pred(channel, msg):
+                continue
+            route.matched += 1
+
+            if route.min_interval_s is not None:
+                if now is None:
+                    now = clock()
+                if now - route._last.get(key, -1e9) < route.min_interval_s:
+                    route.suppressed += 1
+                    continue
+                route._last[key] = now
+
+            out = route.rewrite(channel, msg)
+            if out is None:
+                route.dropped += 1
+                continue
+
+            dev = route.dst_dev if route.dst_dev is not None else self._dev
+            slot = self._out.get(id(dev))
+            if slot is None:
+                slot = self._out[id(dev)] = (dev, [])
+            slot[1].append((route.dst, out))
+            route.forwarded += 1
+
+        if self._out and self._flush_handle is None:
+            # все кадры, разобранные из одного чтения порта, уйдут одной записью
+            self._flush_handle = asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        out, self._out = self._out, {}
+        for dev, frames in out.values():
+            try:
+                dev.send_can_batch_nowait(frames)
+            except CarBusError as e:
+                self.tx_errors += len(frames)
+                log.warning("Gateway forward of %d frames failed: %s", len(frames), e)
+            except Exception:
+                # callback loop-а: исключение иначе уйдёт в обработчик loop-а,
+                # а пачка пропадёт без учёта
+                self.tx_errors += len(frames)
+                log.exception("Gateway forward of %d frames failed", len(frames))
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
 
 from .protocol import BusMessageFlags
 
@@ -53,3 +54,42 @@ class CanMessage:
             brs=brs,
             timestamp_us=timestamp_us,
         )
+
+
+@dataclass
+class CanFrameBatch:
+    """
+    Пачка кадров в колоночном виде: параллельные массивы timestamp/канал/ID/флаги
+    и список payload-ов. Флаги — младшие биты BusMessageFlags (EXTID, RTR, FDF, BRS).
+    """
+    timestamps_us: array = field(default_factory=lambda: array("q"))
+    channels: array = field(default_factory=lambda: array("B"))
+    can_ids: array = field(default_factory=lambda: array("I"))
+    flags: array = field(default_factory=lambda: array("B"))
+    data: List[bytes] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.can_ids)
+
+    def append(self, timestamp_us: int, channel: int, can_id: int, flags: int, data: bytes) -> None:
+        self.timestamps_us.append(timestamp_us)
+        self.channels.append(channel)
+        self.can_ids.append(can_id)
+        self.flags.append(flags)
+        self.data.append(data)
+
+    def message(self, i: int) -> CanMessage:
+        fl = self.flags[i]
+        return CanMessage(
+            can_id=self.can_ids[i],
+            data=self.data[i],
+            extended=bool(fl & BusMessageFlags.EXTID),
+            rtr=bool(fl & BusMessageFlags.RTR),
+            fd=bool(fl & BusMessageFlags.FDF),
+            brs=bool(fl & BusMessageFlags.BRS),
+            timestamp_us=self.timestamps_us[i] & 0xFFFFFFFF,
+        )
+
+    def __iter__(self) -> Iterator[Tuple[int, int, CanMessage]]:
+        for i in range(len(self.can_ids)):
+            yield self.timestamps_us[i], self.channels[i], self.message(i)
@@ -0,0 +1,297 @@
+"""
+Декларативные генераторы данных для периодических кадров.
+
+Счётчики, рампы и таблицы значений кладутся в поле по биту (нумерация Intel:
+бит 0 — младший бит data[0], бит 8 — младший бит data[1] и т.д.), контрольные
+суммы (CRC8, XOR) пересчитываются после всех полей в порядке объявления.
+
+PayloadGenerator подходит как modify для PeriodicCanSender.add(). Если длина
+полного цикла (НОК длин всех полей) не превышает precompute_limit, все кадры
+цикла считаются один раз заранее и на тик остаётся только выбор по индексу.
+"""
+
+from __future__ import annotations
+
+import math
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple, Union
+
+
+# --- поля-значения ------------------------------------------------------------
+
+
+class SignalField:
+    """Поле start_bit..start_bit+length-1, значение на тике — values[tick % len(values)]."""
+
+    __slots__ = ("start_bit", "length", "values")
+
+    def __init__(self, start_bit: int, length: int, values: Sequence[int]) -> None:
+        if length <= 0 or start_bit < 0:
+            raise ValueError("bad signal position")
+        if not values:
+            raise ValueError("values must not be empty")
+        limit = 1 << length
+        for v in values:
+            if not 0 <= v < limit:
+                raise ValueError(f"value {v} does not fit into {length} bits")
+        self.start_bit = start_bit
+        self.length = length
+        self.values = tuple(values)
+
+    @property
+    def cycle(self) -> int:
+        return len(self.values)
+
+    @property
+    def min_size(self) -> int:
+        return (self.start_bit + self.length + 7) // 8
+
+    def apply(self, buf: bytearray, tick: int) -> None:
+        put_bits(buf, self.start_bit, self.length, self.values[tick % len(self.values)])
+
+
+class Counter(SignalField):
+    """
+    Счётчик жизни. modulo — число состояний (по умолчанию 2**length);
+    например, для AUTOSAR E2E Profile 1 счётчик идёт 0..14: modulo=15.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, start_bit: int, length: int = 4, *, step: int = 1, start: int = 0,
+                 modulo: Optional[int] = None) -> None:
+        mod = modulo if modulo is not None else 1 << length
+        cycle = mod // math.gcd(step % mod or mod, mod)
+        super().__init__(start_bit, length, [(start + i * step) % mod for i in range(cycle)])
+
+
+class Ramp(SignalField):
+    """Пила start..stop (включительно) с шагом step; bounce=True — треугольник."""
+
+    __slots__ = ()
+
+    def __init__(self, start_bit: int, length: int, *, start: int, stop: int, step: int = 1,
+                 bounce: bool = False) -> None:
+        if step <= 0:
+            raise ValueError("step must be > 0")
+        if stop >= start:
+            up = list(range(start, stop + 1, step))
+        else:
+            up = list(range(start, stop - 1, -step))
+        values = up + up[-2:0:-1] if bounce and len(up) > 2 else up
+        super().__init__(start_bit, length, values)
+
+
+class Table(SignalField):
+    """Значения из таблицы по кругу."""
+
+    __slots__ = ()
+
+
+def put_bits(buf: bytearray, start_bit: int, length: int, value: int) -> None:
+    shift = start_bit & 7
+    if shift == 0 and length == 8:
+        buf[start_bit >> 3] = value
+        return
+    b0 = start_bit >> 3
+    b1 = (start_bit + length + 7) >> 3
+    mask = ((1 << length) - 1) << shift
+    cur = int.from_bytes(buf[b0:b1], "little")
+    cur = (cur & ~mask) | ((value << shift) & mask)
+    buf[b0:b1] = cur.to_bytes(b1 - b0, "little")
+
+
+def get_bits(data: bytes, start_bit: int, length: int) -> int:
+    b0 = start_bit >> 3
+    b1 = (start_bit + length + 7) >> 3
+    return (int.from_bytes(data[b0:b1], "little") >> (start_bit & 7)) & ((1 << length) - 1)
+
+
+# --- контрольные суммы ----------------------------------------------------------
+
+
+@lru_cache(maxsize=None)
+def crc8_table(poly: int) -> bytes:
+    table = bytearray(256)
+    for i in range(256):
+        c = i
+        for _ in range(8):
+            c = ((c << 1) ^ poly) & 0xFF if c & 0x80 else (c << 1) & 0xFF
+        table[i] = c
+    return bytes(table)
+
+
+def crc8(data: Union[bytes, bytearray, memoryview], *, poly: int = 0x1D, init: int = 0xFF,
+         xor_out: int = 0xFF) -> int:
+    """CRC8 без отражения; по умолчанию SAE J1850 (как Crc_CalculateCRC8 в AUTOSAR)."""
+    table = crc8_table(poly)
+    c = init
+    for b in data:
+        c = table[c ^ b]
+    return c ^ xor_out
+
+
+class _ChecksumField(ABC):
+    """Байт контрольной суммы; подкласс без compute() не создаётся (TypeError)."""
+
+    __slots__ = ("byte", "span")
+
+    def __init__(self, byte: int, span: Optional[Tuple[int, int]]) -> None:
+        self.byte = byte
+        self.span = span
+
+    @property
+    def min_size(self) -> int:
+        end = self.span[1] if self.span is not None else 0
+        return max(self.byte + 1, end)
+
+    def _covered(self, data) -> bytes:
+        """Байты, входящие в сумму: span или весь кадр без байта суммы."""
+        if self.span is not None:
+            a, b = self.span
+            return bytes(data[a:b])
+        return bytes(data[:self.byte]) + bytes(data[self.byte + 1:])
+
+    @abstractmethod
+    def compute(self, data) -> int:
+        """Значение суммы для data (байт data[byte] в сумму не входит)."""
+
+    def apply(self, buf: bytearray, tick: int) -> None:
+        buf[self.byte] = self.compute(buf)
+
+    def check(self, data: bytes) -> bool:
+        """Проверка принятого кадра; подходит как checksum= в CycleTimeMonitor.watch()."""
+        return len(data) > self.byte and data[self.byte] == self.compute(data)
+
+
+class Crc8(_ChecksumField):
+    """
+    CRC8 в data[byte] по span=(start, end) или по всем остальным байтам.
+    data_id — префикс, который участвует в CRC, но не передаётся (AUTOSAR E2E):
+    байты data_id добавляются перед данными младшим байтом вперёд.
+    """
+
+    __slots__ = ("poly", "init", "xor_out", "prefix", "table")
+
+    def __init__(self, byte: int = 0, *, span: Optional[Tuple[int, int]] = None,
+                 poly: int = 0x1D, init: int = 0xFF, xor_out: int = 0xFF,
+                 data_id: Optional[int] = None, data_id_bytes: int = 2) -> None:
+        super().__init__(byte, span)
+        self.poly = poly
+        self.init = init
+        self.xor_out = xor_out
+        self.prefix = data_id.to_bytes(data_id_bytes, "little") if data_id is not None else b""
+        self.table = crc8_table(poly)
+
+    def compute(self, data) -> int:
+        table = self.table
+        c = self.init
+        for b in self.prefix:
+            c = table[c ^ b]
+        for b in self._covered(data):
+            c = table[c ^ b]
+        return c ^ self.xor_out
+
+
+class Xor8(_ChecksumField):
+    """XOR всех байт span (или всех, кроме байта суммы)."""
+
+    __slots__ = ("init",)
+
+    def __init__(self, byte: int = 0, *, span: Optional[Tuple[int, int]] = None, init: int = 0) -> None:
+        super().__init__(byte, span)
+        self.init = init
+
+    def compute(self, data) -> int:
+        c = self.init
+        for b in self._covered(data):
+            c ^= b
+        return c
+
+
+Field = Union[SignalField, _ChecksumField]
+
+
+def e2e_profile1(data_id: int, *, crc_byte: int = 0, counter_bit: int = 8) -> List[Field]:
+    """
+    Поля в стиле AUTOSAR E2E Profile 1 (вариант с обоими байтами Data ID):
+    счётчик 0..14 в младшей тетраде data[1] и CRC8 SAE J1850 в data[0].
+    """
+    return [
+        Counter(counter_bit, 4, modulo=15),
+        Crc8(crc_byte, data_id=data_id),
+    ]
+
+
+# --- генератор ------------------------------------------------------------------
+
+
+class PayloadGenerator:
+    """
+    gen = PayloadGenerator(b"\\x00" * 8, [Counter(8, 4), Crc8(0)])
+    sender.add("abs", channel=1, can_id=0x1A0, data=b"\\x00" * 8, period_s=0.01, modify=gen)
+
+    template=None — шаблоном служат data задачи (при замене job.data кадры
+    пересчитываются при следующем тике).
+    """
+
+    def __init__(
+        self,
+        template: Optional[bytes] = None,
+        fields: Sequence[Field] = (),
+        *,
+        precompute_limit: int = 4096,
+    ) -> None:
+        self.fields: Tuple[Field, ...] = tuple(fields)
+        self.precompute_limit = precompute_limit
+
+        cycle = 1
+        for f in self.fields:
+            if isinstance(f, SignalField):
+                cycle = cycle * f.cycle // math.gcd(cycle, f.cycle)
+        self.cycle = cycle
+
+        self._source: Optional[bytes] = None
+        self._template = b""
+        self._frames: Optional[List[bytes]] = None
+        self._buf = bytearray()
+        if template is not None:
+            self._build(bytes(template))
+        self._fixed = template is not None
+
+    def _build(self, template: bytes) -> None:
+        need = max((f.min_size for f in self.fields), default=0)
+        if len(template) < need:
+            raise ValueError(f"payload template is {len(template)} bytes, fields need {need}")
+        self._source = template
+        self._template = template
+        if self.cycle <= self.precompute_limit:
+            self._frames = [self._render(tick) for tick in range(self.cycle)]
+        else:
+            self._frames = None
+
+    def _render(self, tick: int) -> bytes:
+        buf = bytearray(self._template)
+        for f in self.fields:
+            f.apply(buf, tick)
+        return bytes(buf)
+
+    @property
+    def precomputed(self) -> bool:
+        return self._frames is not None
+
+    def frame(self, tick: int) -> bytes:
+        frames = self._frames
+        if frames is not None:
+            return frames[tick % self.cycle]
+        return self._render(tick)
+
+    def __call__(self, tick: int, data: bytes) -> bytes:
+        if not self._fixed and data is not self._source:
+            self._build(bytes(data))
+            self._source = data
+        frames = self._frames
+        if frames is not None:
+            return frames[tick % self.cycle]
+        return self._render(tick)
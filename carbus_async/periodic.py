@@ -1,15 +1,89 @@
 from __future__ import annotations
 
 import asyncio
-import time
-from dataclasses import dataclass
-from typing import Awaitable, Callable, Optional, Union
+import heapq
+import itertools
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
 from .messages import CanMessage
 from .device import CarBusDevice
+from .exceptions import CarBusError
+from .timing import clock
 
 ModifyFn = Callable[[int, bytes], Union[bytes, Awaitable[bytes]]]
 
+log = logging.getLogger("carbus_async.periodic")
+
+# Что делать, если планировщик опоздал больше чем на период (залип loop, GC и т.п.):
+CATCH_UP_BURST = "burst"      # отправить все пропущенные кадры подряд
+CATCH_UP_SKIP = "skip"        # пропустить просроченные слоты, сохранив исходную фазу
+CATCH_UP_REPHASE = "rephase"  # начать отсчёт периода заново от текущего момента
+CATCH_UP_POLICIES = (CATCH_UP_BURST, CATCH_UP_SKIP, CATCH_UP_REPHASE)
+
+
+@dataclass(frozen=True)
+class PeriodicJobStats:
+    sent: int
+    missed: int                 # слоты, пропущенные политикой skip/rephase
+    failed: int                 # тики, кадр которых не ушёл (ошибка modify или записи)
+    period_mean_s: float        # фактический период между отправками
+    period_std_s: float
+    period_min_s: float
+    period_max_s: float
+    lateness_mean_s: float      # опоздание относительно дедлайна
+    lateness_max_s: float
+
+
+class _TimingAcc:
+    __slots__ = ("sent", "missed", "failed", "last", "n", "mean", "m2", "pmin", "pmax", "late_sum", "late_max")
+
+    def __init__(self) -> None:
+        self.sent = 0
+        self.missed = 0
+        self.failed = 0
+        self.last = -1.0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.pmin = math.inf
+        self.pmax = 0.0
+        self.late_sum = 0.0
+        self.late_max = 0.0
+
+    def add(self, now: float, lateness: float) -> None:
+        self.sent += 1
+        self.late_sum += lateness
+        if lateness > self.late_max:
+            self.late_max = lateness
+        if self.last >= 0:
+            iat = now - self.last
+            self.n += 1
+            d = iat - self.mean
+            self.mean += d / self.n
+            self.m2 += d * (iat - self.mean)
+            if iat < self.pmin:
+                self.pmin = iat
+            if iat > self.pmax:
+                self.pmax = iat
+        self.last = now
+
+    def snapshot(self) -> PeriodicJobStats:
+        n = self.n
+        return PeriodicJobStats(
+            sent=self.sent,
+            missed=self.missed,
+            failed=self.failed,
+            period_mean_s=self.mean,
+            period_std_s=math.sqrt(self.m2 / (n - 1)) if n > 1 else 0.0,
+            period_min_s=self.pmin if n else 0.0,
+            period_max_s=self.pmax,
+            lateness_mean_s=self.late_sum / self.sent if self.sent else 0.0,
+            lateness_max_s=self.late_max,
+        )
+
 
 @dataclass
 class PeriodicJob:
@@ -25,67 +99,150 @@ class PeriodicJob:
     echo: bool = False
     confirm: bool = False
     modify: Optional[ModifyFn] = None
+    catch_up: str = CATCH_UP_BURST
 
-    _task: Optional[asyncio.Task] = None
-    _stop: asyncio.Event = asyncio.Event()
+    _sender: Optional["PeriodicCanSender"] = field(default=None, init=False, repr=False)
+    _gen: int = field(default=0, init=False, repr=False)
+    _active: bool = field(default=False, init=False, repr=False)
+    _tick: int = field(default=0, init=False, repr=False)
+    _next_t: float = field(default=0.0, init=False, repr=False)
+    _t0: float = field(default=0.0, init=False, repr=False)
+    _slot: int = field(default=0, init=False, repr=False)
+    _acc: _TimingAcc = field(default_factory=_TimingAcc, init=False, repr=False)
+    _hw_index: Optional[int] = field(default=None, init=False, repr=False)
 
-    def start(self, dev: CarBusDevice) -> None:
-        if self._task is not None and not self._task.done():
-            return
-        self._stop = asyncio.Event()
-        self._task = asyncio.create_task(self._run(dev), name=f"PeriodicJob:{self.name}")
+    @property
+    def running(self) -> bool:
+        return self._active or self._hw_index is not None
+
+    @property
+    def hardware(self) -> bool:
+        """Задача выполняется аппаратной TX-задачей адаптера (stats() тогда пустые)."""
+        return self._hw_index is not None
+
+    @property
+    def tick(self) -> int:
+        return self._tick
+
+    def stats(self) -> PeriodicJobStats:
+        return self._acc.snapshot()
+
+    def reset_stats(self) -> None:
+        self._acc = _TimingAcc()
+
+    def _restart(self, now: float) -> None:
+        self._tick = 0
+        self._t0 = now
+        self._slot = 0
+        self._next_t = now
 
-        def _done(t: asyncio.Task):
-            exc = t.exception()
-            if exc:
-                print(f"[PeriodicJob:{self.name}] crashed:", repr(exc))
+    def _advance(self, now: float, ok: bool = True) -> None:
+        """
+        Учесть тик в момент now (ok=False — кадр не ушёл) и назначить
+        следующий дедлайн. Дедлайны считаются как t0 + slot * period_s,
+        без накопления ошибки.
+        """
+        acc = self._acc
+        if ok:
+            acc.add(now, now - self._next_t)
+        else:
+            acc.failed += 1
+        self._tick += 1
 
-        self._task.add_done_callback(_done)
+        period = self.period_s
+        self._slot += 1
+        nxt = self._t0 + self._slot * period
+        if nxt <= now and self.catch_up != CATCH_UP_BURST:
+            if self.catch_up == CATCH_UP_SKIP:
+                slot = math.floor((now - self._t0) / period) + 1
+                acc.missed += slot - self._slot
+                self._slot = slot
+                nxt = self._t0 + slot * period
+            else:
+                acc.missed += math.floor((now - nxt) / period) + 1
+                self._t0 = now
+                self._slot = 1
+                nxt = now + period
+        self._next_t = nxt
+
+    def start(self, dev: CarBusDevice) -> None:
+        # задача, созданная не через PeriodicCanSender, получает свой планировщик
+        if self._sender is None or self._sender._dev is not dev:
+            self._sender = PeriodicCanSender(dev)
+        self._sender._schedule(self)
 
     async def stop(self) -> None:
-        self._stop.set()
-        if self._task is not None:
-            self._task.cancel()
-            with asyncio.CancelledError.__suppress_context__ if False else None:
-                pass
-            try:
-                await self._task
-            except asyncio.CancelledError:
-                pass
-            self._task = None
-
-    async def _run(self, dev: CarBusDevice) -> None:
-        tick = 0
-        next_t = time.perf_counter()
-
-        while not self._stop.is_set():
-            now = time.perf_counter()
-            if now < next_t:
-                await asyncio.sleep(next_t - now)
-            next_t += self.period_s
-
-            out = self.data
-            if self.modify is not None:
-                res = self.modify(tick, out)
-                out = await res if asyncio.iscoroutine(res) else res
-
-            msg = CanMessage(
-                can_id=self.can_id,
-                data=out,
-            )
-            await dev.send_can(
-                msg,
-                channel=self.channel,
-                confirm=self.confirm,
-                echo=self.echo,
-            )
-            tick += 1
+        if self._sender is not None:
+            await self._sender._stop_job(self)
+
+    def _message(self, data: bytes) -> CanMessage:
+        return CanMessage(
+            can_id=self.can_id,
+            data=data,
+            extended=self.extended,
+            fd=self.fd,
+            brs=self.brs,
+            rtr=self.rtr,
+        )
+
+
+# (deadline, seq, generation, job); запись устаревает, когда job._gen ушёл вперёд
+_HeapEntry = Tuple[float, int, int, PeriodicJob]
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
 
 
 class PeriodicCanSender:
-    def __init__(self, dev: CarBusDevice):
+    """
+    Все периодические задачи обслуживаются одной asyncio-задачей с кучей,
+    упорядоченной по ближайшему дедлайну: добавление и удаление — O(log n)
+    (удаление ленивое, устаревшие записи выбрасываются при извлечении).
+    Кадры, срок которых наступает в пределах coalesce_s, уходят одной записью
+    через send_can_batch().
+
+    Поведение после опоздания задаётся политикой catch_up задачи (burst/skip/
+    rephase), фактический период и опоздания видны в job.stats().
+
+    hardware=True — переносить задачи без modify/confirm/echo в аппаратные
+    TX-задачи адаптера (DI_TX_TASK), пока есть свободные. Задача стартует
+    программно и переезжает на адаптер после подтверждения; если адаптер
+    такого не умеет, всё остаётся на программном планировщике.
+    """
+
+    def __init__(
+        self,
+        dev: CarBusDevice,
+        *,
+        coalesce_s: float = 0.0005,
+        max_batch: int = 64,
+        spin_s: float = 0.0,
+        hardware: bool = False,
+    ):
         self._dev = dev
         self._jobs: dict[str, PeriodicJob] = {}
+        self.coalesce_s = coalesce_s
+        self.max_batch = max_batch
+        # >0 — последние spin_s до дедлайна ждать активно (как timing.sleep_until),
+        # нужно для периодов порядка миллисекунды и меньше
+        self.spin_s = spin_s
+
+        self._heap: List[_HeapEntry] = []
+        self._seq = itertools.count()
+        self._stale = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Future] = None
+
+        self.hardware = hardware
+        self._hw_free: Optional[List[int]] = None   # None — адаптер ещё не опрошен
+        self._hw_lock = asyncio.Lock()
+        self._hw_pending: set = set()
+        self._stopping = False
+        # отправки с confirm=True и async modify идут в своих задачах,
+        # чтобы не задерживать остальные задачи планировщика
+        self._inflight: set = set()
 
     def add(
         self,
@@ -102,10 +259,15 @@ class PeriodicCanSender:
         rtr: bool = False,
         echo: bool = False,
         confirm: bool = False,
+        catch_up: str = CATCH_UP_BURST,
         autostart: bool = True,
     ) -> PeriodicJob:
         if name in self._jobs:
             raise ValueError(f"Periodic job '{name}' already exists")
+        if period_s <= 0:
+            raise ValueError("period_s must be > 0")
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"catch_up must be one of {CATCH_UP_POLICIES}")
 
         job = PeriodicJob(
             name=name,
@@ -120,20 +282,327 @@ class PeriodicCanSender:
             echo=echo,
             confirm=confirm,
             modify=modify,
+            catch_up=catch_up,
         )
+        job._sender = self
         self._jobs[name] = job
         if autostart:
-            job.start(self._dev)
+            self._schedule(job)
         return job
 
     def get(self, name: str) -> PeriodicJob:
         return self._jobs[name]
 
+    def stats(self) -> Dict[str, PeriodicJobStats]:
+        return {name: job.stats() for name, job in self._jobs.items()}
+
+    async def update_data(self, name: str, data: bytes) -> None:
+        """
+        Заменить данные задачи. Для программной задачи действует со следующего
+        тика, для аппаратной — отправляется в адаптер.
+        """
+        job = self._jobs[name]
+        job.data = data
+        if job._hw_index is not None:
+            await self._dev.tx_task_update(job._hw_index, job.channel, job._message(data))
+
+    async def wait_offloaded(self) -> None:
+        """Дождаться завершения переноса задач на аппаратные TX-задачи."""
+        while self._hw_pending:
+            await asyncio.gather(*list(self._hw_pending), return_exceptions=True)
+
     async def remove(self, name: str) -> None:
-        job = self._jobs.pop(name, None)
+        job = self._jobs.get(name)
         if job is not None:
             await job.stop()
+            del self._jobs[name]
 
     async def stop_all(self) -> None:
-        await asyncio.gather(*(job.stop() for job in self._jobs.values()), return_exceptions=True)
-        self._jobs.clear()
+        self._stopping = True
+        error: Optional[CarBusError] = None
+        try:
+            await self.wait_offloaded()
+            for name, job in list(self._jobs.items()):
+                try:
+                    await self._stop_job(job)
+                except CarBusError as e:
+                    log.warning("Failed to clear TX task of '%s': %s", name, e)
+                    error = error or e
+                    continue
+                del self._jobs[name]
+        finally:
+            self._stopping = False
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
+        self._heap.clear()
+        self._stale = 0
+        if error is not None:
+            # задачи с неочищенными TX-задачами остаются в _jobs — stop_all() можно повторить
+            raise error
+
+    # --- аппаратные TX-задачи ----------------------------------------------------
+
+    def _hw_eligible(self, job: PeriodicJob) -> bool:
+        return (
+            self.hardware
+            and not self._stopping
+            and self._hw_free != []
+            and job.modify is None
+            and not job.confirm
+            and not job.echo
+        )
+
+    async def _probe_hw(self) -> None:
+        if not self._dev.experimental_enabled("tx_task"):
+            log.debug("TX task commands are not enabled (experimental), using software scheduling")
+            self._hw_free = []
+            return
+        try:
+            info = await self._dev.get_device_info()
+        except CarBusError as e:
+            log.info("TX task probe failed, using software scheduling: %s", e)
+            self._hw_free = []
+            return
+        count = info.tx_task_count or 0
+        self._hw_free = list(range(count)) if info.feature_tx_task else []
+        log.debug("Adapter TX tasks available: %d", len(self._hw_free))
+
+    async def _offload(self, job: PeriodicJob) -> None:
+        async with self._hw_lock:
+            if self._hw_free is None:
+                await self._probe_hw()
+            if not self._hw_free or not job._active or job._hw_index is not None:
+                return
+
+            gen = job._gen
+            index = self._hw_free.pop(0)
+            try:
+                await self._dev.tx_task_set(index, job.channel, job._message(job.data), job.period_s)
+            except CarBusError as e:
+                log.info("TX task %d rejected for '%s', keeping software: %s", index, job.name, e)
+                self._hw_free = []
+                return
+
+            if not job._active or job._gen != gen:
+                # задачу остановили, пока адаптер подтверждал
+                try:
+                    await self._dev.tx_task_clear(index)
+                except CarBusError as e:
+                    # адаптер продолжает слать кадр — слот остаётся за задачей,
+                    # job.stop() повторит очистку и вернёт ошибку
+                    log.warning("Failed to clear TX task %d of stopped job '%s': %s", index, job.name, e)
+                    job._hw_index = index
+                    return
+                self._hw_released(index)
+                return
+
+            self._unschedule(job)
+            job._hw_index = index
+            log.debug("Periodic job '%s' moved to TX task %d", job.name, index)
+
+    def _hw_released(self, index: int) -> None:
+        if self._hw_free is not None:
+            self._hw_free.append(index)
+            # освободившийся слот отдаём ожидающей программной задаче
+            for job in self._jobs.values():
+                if job._active and self._hw_eligible(job):
+                    self._spawn_offload(job)
+                    break
+
+    async def _stop_job(self, job: PeriodicJob) -> None:
+        """Остановить задачу; CarBusError — адаптер не очистил TX-задачу, она ещё передаётся."""
+        self._unschedule(job)
+        if job._hw_index is None:
+            return
+        async with self._hw_lock:
+            index = job._hw_index
+            if index is None:
+                return
+            # индекс сбрасываем только после подтверждения: иначе при ошибке
+            # адаптер продолжит передачу, а остановить её будет нечем
+            await self._dev.tx_task_clear(index)
+            job._hw_index = None
+        self._hw_released(index)
+
+    # --- планировщик ----------------------------------------------------------
+
+    def _schedule(self, job: PeriodicJob) -> None:
+        if job._active or job._hw_index is not None:
+            return
+        if job.catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"catch_up must be one of {CATCH_UP_POLICIES}")
+        job._active = True
+        job._gen += 1
+        job._restart(clock())
+        self._push(job)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(
+                self._run(), name="PeriodicCanSender",
+            )
+            self._task.add_done_callback(self._task_done)
+        elif self._wakeup is not None:
+            _wake(self._wakeup)
+
+        if self._hw_eligible(job):
+            self._spawn_offload(job)
+
+    def _spawn_offload(self, job: PeriodicJob) -> None:
+        t = asyncio.get_running_loop().create_task(self._offload(job))
+        self._hw_pending.add(t)
+        t.add_done_callback(self._hw_pending.discard)
+
+    def _unschedule(self, job: PeriodicJob) -> None:
+        if not job._active:
+            return
+        job._active = False
+        job._gen += 1
+        self._stale += 1
+        if self._stale > 64 and self._stale * 2 > len(self._heap):
+            self._heap = [e for e in self._heap if e[3]._gen == e[2]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _push(self, job: PeriodicJob) -> None:
+        heapq.heappush(self._heap, (job._next_t, next(self._seq), job._gen, job))
+
+    def _task_done(self, t: asyncio.Task) -> None:
+        if t.cancelled():
+            return
+        exc = t.exception()
+        if exc:
+            log.error("PeriodicCanSender scheduler crashed: %r", exc)
+
+    async def _sleep(self, delay: Optional[float]) -> None:
+        loop = asyncio.get_running_loop()
+        fut = self._wakeup = loop.create_future()
+        handle = loop.call_later(delay, _wake, fut) if delay is not None else None
+        try:
+            await fut
+        finally:
+            if handle is not None:
+                handle.cancel()
+            self._wakeup = None
+
+    async def _run(self) -> None:
+        while True:
+            heap = self._heap
+            while heap and heap[0][3]._gen != heap[0][2]:
+                heapq.heappop(heap)
+                self._stale -= 1
+
+            if not heap:
+                await self._sleep(None)
+                continue
+
+            delay = heap[0][0] - clock()
+            if delay > 0:
+                if delay > self.spin_s:
+                    await self._sleep(delay - self.spin_s)
+                else:
+                    await asyncio.sleep(0)
+                continue  # голова могла смениться, пока спали
+
+            horizon = clock() + self.coalesce_s
+            due: List[PeriodicJob] = []
+            while heap and heap[0][0] <= horizon and len(due) < self.max_batch:
+                _, _, gen, job = heapq.heappop(heap)
+                if job._gen != gen:
+                    self._stale -= 1
+                    continue
+                due.append(job)
+
+            await self._fire(due)
+
+    def _requeue(self, job: PeriodicJob, gen: int, now: float, ok: bool = True) -> None:
+        restarted = job._active and job._gen != gen
+        if not restarted:   # перезапущенная задача уже получила новый t0
+            job._advance(now, ok)
+        if job._active and job._gen == gen:
+            self._push(job)
+            if self._wakeup is not None:
+                _wake(self._wakeup)
+        else:
+            # остановлена во время отправки: _unschedule посчитал запись,
+            # которой в куче уже нет
+            self._stale -= 1
+
+    def _spawn_send(self, job: PeriodicJob, gen: int, now: float, what) -> None:
+        t = asyncio.get_running_loop().create_task(self._send_one(job, gen, now, what))
+        self._inflight.add(t)
+        t.add_done_callback(self._inflight.discard)
+
+    async def _send_one(self, job: PeriodicJob, gen: int, now: float, what) -> None:
+        """
+        Медленная отправка (ожидание ACK или async modify) в своей задаче; до
+        её окончания задача не возвращается в кучу, так что тики не накладываются.
+        """
+        ok = False
+        try:
+            msg = job._message(await what) if asyncio.iscoroutine(what) else what
+            await self._dev.send_can(msg, channel=job.channel, confirm=job.confirm, echo=job.echo)
+            ok = True
+        except Exception:
+            log.exception("Periodic job '%s' failed", job.name)
+        finally:
+            self._requeue(job, gen, now, ok)
+
+    async def _fire(self, due: List[PeriodicJob]) -> None:
+        batch: List[Tuple[int, CanMessage]] = []
+        echo_batch: List[Tuple[int, CanMessage]] = []
+        # задачи пакетов учитываются только после записи: статистика sent/
+        # опозданий не должна включать кадры, которые не ушли
+        batch_jobs: List[Tuple[PeriodicJob, int]] = []
+        echo_jobs: List[Tuple[PeriodicJob, int]] = []
+        now = clock()
+
+        for job in due:
+            gen = job._gen
+            out = job.data
+            try:
+                if job.modify is not None:
+                    out = job.modify(job._tick, out)
+                    if asyncio.iscoroutine(out):
+                        self._spawn_send(job, gen, now, out)
+                        continue
+                msg = job._message(out)
+                if job.confirm:
+                    self._spawn_send(job, gen, now, msg)
+                    continue
+                if job.echo:
+                    echo_batch.append((job.channel, msg))
+                    echo_jobs.append((job, gen))
+                else:
+                    batch.append((job.channel, msg))
+                    batch_jobs.append((job, gen))
+                continue
+            except Exception:
+                log.exception("Periodic job '%s' failed", job.name)
+
+            self._requeue(job, gen, now, False)
+
+        await self._flush(batch, batch_jobs, now, echo=False)
+        await self._flush(echo_batch, echo_jobs, now, echo=True)
+
+    async def _flush(self, batch: List[Tuple[int, CanMessage]], jobs: List[Tuple[PeriodicJob, int]],
+                     now: float, *, echo: bool) -> None:
+        if not batch:
+            return
+        ok = False
+        try:
+            if echo:
+                await self._dev.send_can_batch(batch, echo=True)
+            else:
+                await self._dev.send_can_batch(batch)
+            ok = True
+        except Exception:
+            log.exception("Periodic batch send failed (%d frames)", len(batch))
+        for job, gen in jobs:
+            self._requeue(job, gen, now, ok)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from enum import IntEnum, IntFlag
+from typing import AbstractSet
 
 
 class Command(IntEnum):
@@ -15,7 +16,29 @@ class Command(IntEnum):
     FILTER_SET = 0x21      # COMMAND_FILTER_SET
     FILTER_CLEAR = 0x22    # COMMAND_FILTER_CLEAR
 
+    # Аппаратные функции адаптера (DI_GATEWAY / DI_TX_TASK / DI_TX_BUFFER / DI_ISOTP).
+    # В спецификации протокола CarBus описаны только биты DEVICE_INFO; коды команд
+    # и раскладка payload ниже предварительные и прошивкой не подтверждены.
+    # Поэтому они выключены: CarBusDevice шлёт их только с experimental={...}
+    # (см. PROVISIONAL_COMMANDS), иначе библиотека работает программно.
+    GATEWAY_SET = 0x28
+    GATEWAY_CLEAR = 0x29
+
+    TX_TASK_SET = 0x30
+    TX_TASK_UPDATE = 0x31
+    TX_TASK_CLEAR = 0x32
+
+    TX_BUFFER_CLEAR = 0x34
+    TX_BUFFER_ADD = 0x35
+    TX_BUFFER_START = 0x36
+    TX_BUFFER_STOP = 0x37
+    TX_BUFFER_STATUS = 0x38
+
+    ISOTP_OPEN = 0x3A
+    ISOTP_CLOSE = 0x3B
+
     MESSAGE = 0x40
+    ISOTP_DATA = 0x44      # PDU целиком: host -> адаптер и адаптер -> host
     BUS_ERROR = 0x48
 
     ERROR = 0xFF
@@ -28,6 +51,26 @@ class FilterType(IntEnum):
 
 EXTENDED_HEADER_COMMANDS = {Command.MESSAGE, Command.BUS_ERROR}
 
+# предварительные команды -> функция, которую нужно включить в CarBusDevice(experimental=...)
+PROVISIONAL_COMMANDS = {
+    Command.GATEWAY_SET: "gateway",
+    Command.GATEWAY_CLEAR: "gateway",
+    Command.TX_TASK_SET: "tx_task",
+    Command.TX_TASK_UPDATE: "tx_task",
+    Command.TX_TASK_CLEAR: "tx_task",
+    Command.TX_BUFFER_CLEAR: "tx_buffer",
+    Command.TX_BUFFER_ADD: "tx_buffer",
+    Command.TX_BUFFER_START: "tx_buffer",
+    Command.TX_BUFFER_STOP: "tx_buffer",
+    Command.TX_BUFFER_STATUS: "tx_buffer",
+    Command.ISOTP_OPEN: "isotp",
+    Command.ISOTP_CLOSE: "isotp",
+    Command.ISOTP_DATA: "isotp",
+}
+EXPERIMENTAL_FEATURES = frozenset(PROVISIONAL_COMMANDS.values())
+# с расширенным заголовком, только если функция включена
+PROVISIONAL_EXTENDED_HEADER_COMMANDS = {Command.ISOTP_DATA}
+
 
 class HeaderFlags(IntFlag):
     NONE = 0x0000
@@ -136,9 +179,11 @@ def base_command_from_ack(cmd: int) -> int:
     return cmd & 0x7F
 
 
-def need_extended_header(command: int) -> bool:
+def need_extended_header(command: int, experimental: AbstractSet[str] = frozenset()) -> bool:
     try:
         c = Command(command)
     except ValueError:
         return False
+    if c in PROVISIONAL_EXTENDED_HEADER_COMMANDS:
+        return PROVISIONAL_COMMANDS[c] in experimental
     return c in EXTENDED_HEADER_COMMANDS
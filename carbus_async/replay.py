@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .filter_expr import FilterLike, as_filter
+from .messages import CanMessage
+from .timing import DEFAULT_SPIN_S, clock, sleep_until
+
+log = logging.getLogger("carbus_async.replay")
+
+
+@dataclass
+class ReplayReport:
+    frames_sent: int = 0
+    batches: int = 0
+    target_duration_s: float = 0.0
+    actual_duration_s: float = 0.0
+    mean_error_s: float = 0.0
+    rms_error_s: float = 0.0
+    max_error_s: float = 0.0
+    late_frames: int = 0
+    stopped: bool = False
+
+    def __str__(self) -> str:
+        return (
+            f"frames={self.frames_sent} batches={self.batches} "
+            f"duration={self.actual_duration_s:.3f}s/{self.target_duration_s:.3f}s "
+            f"err mean={self.mean_error_s * 1e6:.0f}us rms={self.rms_error_s * 1e6:.0f}us "
+            f"max={self.max_error_s * 1e6:.0f}us late={self.late_frames}"
+        )
+
+
+class TraceReplayer:
+    """
+    Воспроизведение записанного трафика на CarBusDevice с сохранением таймингов.
+
+    frames — любой итерируемый источник (timestamp_us, channel, CanMessage):
+    TraceReader, IndexedTraceReader.query(...), импорт из candump/ASC и т.п.
+    Источник читается лениво, память не растёт с длиной трассы.
+
+    Дедлайны считаются от одной опорной точки (без накопления дрейфа);
+    все кадры, чьё время наступило в пределах coalesce_s, уходят одной
+    записью через send_can_batch().
+    """
+
+    def __init__(
+        self,
+        dev,
+        frames: Iterable[Tuple[int, int, CanMessage]],
+        *,
+        speed: float = 1.0,
+        channels: Optional[Iterable[int]] = None,
+        can_ids: Optional[Iterable[int]] = None,
+        filter: Optional[FilterLike] = None,
+        channel_map: Optional[Dict[int, int]] = None,
+        coalesce_s: float = 0.0005,
+        spin_s: float = DEFAULT_SPIN_S,
+        late_threshold_s: float = 0.001,
+        start_delay_s: float = 0.01,
+        max_batch: int = 64,
+        echo: bool = False,
+    ) -> None:
+        if speed <= 0:
+            raise ValueError("speed must be > 0")
+        self._dev = dev
+        self._frames = frames
+        self.speed = speed
+        self._channels: Optional[Set[int]] = set(channels) if channels is not None else None
+        self._can_ids: Optional[Set[int]] = set(can_ids) if can_ids is not None else None
+        self._filter = as_filter(filter)
+        self._channel_map = dict(channel_map or {})
+        self.coalesce_s = coalesce_s
+        self.spin_s = spin_s
+        self.late_threshold_s = late_threshold_s
+        self.start_delay_s = start_delay_s
+        self.max_batch = max_batch
+        self.echo = echo
+        self._stop = asyncio.Event()
+        self.report = ReplayReport()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _selected(self) -> Iterator[Tuple[int, int, CanMessage]]:
+        chs = self._channels
+        ids = self._can_ids
+        flt = self._filter
+        cmap = self._channel_map
+        for ts, ch, msg in self._frames:
+            if chs is not None and ch not in chs:
+                continue
+            if ids is not None and msg.can_id not in ids:
+                continue
+            if flt is not None and not flt(ch, msg):
+                continue
+            yield ts, cmap.get(ch, ch), msg
+
+    async def run(self) -> ReplayReport:
+        rep = self.report = ReplayReport()
+        it = self._selected()
+        pending = next(it, None)
+        if pending is None:
+            return rep
+
+        scale = 1e-6 / self.speed
+        ts0 = pending[0]
+        t0 = clock() + self.start_delay_s
+        err_sum = 0.0
+        err_sq = 0.0
+        last_target = 0.0
+
+        batch: List[Tuple[int, CanMessage]] = []
+        targets: List[float] = []
+
+        while pending is not None and not self._stop.is_set():
+            deadline = t0 + (pending[0] - ts0) * scale
+            await sleep_until(deadline, spin_s=self.spin_s)
+
+            horizon = clock() + self.coalesce_s
+            while pending is not None and len(batch) < self.max_batch:
+                target = t0 + (pending[0] - ts0) * scale
+                if target > horizon:
+                    break
+                batch.append((pending[1], pending[2]))
+                targets.append(target)
+                pending = next(it, None)
+
+            sent_at = clock()
+            await self._dev.send_can_batch(batch, echo=self.echo)
+
+            for target in targets:
+                err = sent_at - target
+                err_sum += err
+                err_sq += err * err
+                a = abs(err)
+                if a > rep.max_error_s:
+                    rep.max_error_s = a
+                if err > self.late_threshold_s:
+                    rep.late_frames += 1
+            last_target = targets[-1]
+            rep.frames_sent += len(batch)
+            rep.batches += 1
+            batch.clear()
+            targets.clear()
+
+        rep.stopped = pending is not None
+        rep.target_duration_s = last_target - t0
+        rep.actual_duration_s = clock() - t0
+        if rep.frames_sent:
+            rep.mean_error_s = err_sum / rep.frames_sent
+            rep.rms_error_s = math.sqrt(err_sq / rep.frames_sent)
+        log.debug("Replay finished: %s", rep)
+        return rep
+
+
+async def replay(dev, frames: Iterable[Tuple[int, int, CanMessage]], **kwargs) -> ReplayReport:
+    return await TraceReplayer(dev, frames, **kwargs).run()
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .messages import CanMessage
+
+STD_ID_COUNT = 0x800
+
+
+@dataclass(frozen=True)
+class BusStateEntry:
+    msg: CanMessage
+    rx_time: float       # time.monotonic() момента приёма
+    count: int           # сколько раз кадр обновлялся
+
+
+class _ChannelState:
+    __slots__ = ("std_msg", "std_time", "std_count", "ext")
+
+    def __init__(self) -> None:
+        self.std_msg: List[Optional[CanMessage]] = [None] * STD_ID_COUNT
+        self.std_time: List[float] = [0.0] * STD_ID_COUNT
+        self.std_count: List[int] = [0] * STD_ID_COUNT
+        # can_id -> [msg, rx_time, count]
+        self.ext: Dict[int, list] = {}
+
+
+class BusStateTable:
+    """
+    Таблица «последнее значение» по (channel, can_id), обновляемая из read loop.
+
+    Читатели опрашивают её напрямую — без очередей и без своего потребителя
+    receive_can(). Для 11-битных ID хранение — списки по индексу can_id,
+    для 29-битных — словарь. changed() позволяет дождаться следующего
+    обновления конкретного ID.
+    """
+
+    def __init__(self, dev=None, *, autostart: bool = True) -> None:
+        self._dev = dev
+        self._channels: Dict[int, _ChannelState] = {}
+        # (channel | None, can_id, extended) -> futures
+        self._waiters: Dict[Tuple[Optional[int], int, bool], List[asyncio.Future]] = {}
+        self._attached = False
+        if dev is not None and autostart:
+            self.start()
+
+    def start(self) -> None:
+        if self._dev is None or self._attached:
+            return
+        self._dev.add_rx_tap(self.update)
+        self._attached = True
+
+    def stop(self) -> None:
+        if self._dev is not None and self._attached:
+            self._dev.remove_rx_tap(self.update)
+        self._attached = False
+
+    def _channel(self, channel: int) -> _ChannelState:
+        c = self._channels.get(channel)
+        if c is None:
+            c = self._channels[channel] = _ChannelState()
+        return c
+
+    def update(self, channel: int, msg: CanMessage) -> None:
+        c = self._channels.get(channel)
+        if c is None:
+            c = self._channel(channel)
+        now = time.monotonic()
+        can_id = msg.can_id
+        ext = msg.extended
+
+        if not ext and can_id < STD_ID_COUNT:
+            c.std_msg[can_id] = msg
+            c.std_time[can_id] = now
+            c.std_count[can_id] += 1
+        else:
+            e = c.ext.get(can_id)
+            if e is None:
+                c.ext[can_id] = [msg, now, 1]
+            else:
+                e[0] = msg
+                e[1] = now
+                e[2] += 1
+
+        if self._waiters:
+            self._wake((channel, can_id, ext), channel, msg)
+            self._wake((None, can_id, ext), channel, msg)
+
+    def _wake(self, key, channel: int, msg: CanMessage) -> None:
+        futs = self._waiters.pop(key, None)
+        if not futs:
+            return
+        for fut in futs:
+            if not fut.done():
+                fut.set_result((channel, msg))
+
+    def get(self, can_id: int, channel: int = 1, *, extended: bool = False) -> Optional[BusStateEntry]:
+        c = self._channels.get(channel)
+        if c is None:
+            return None
+        if not extended and can_id < STD_ID_COUNT:
+            msg = c.std_msg[can_id]
+            if msg is None:
+                return None
+            return BusStateEntry(msg, c.std_time[can_id], c.std_count[can_id])
+        e = c.ext.get(can_id)
+        if e is None:
+            return None
+        return BusStateEntry(e[0], e[1], e[2])
+
+    def latest(self, can_id: int, channel: int = 1, *, extended: bool = False) -> Optional[CanMessage]:
+        """Последний кадр ID или None; самый быстрый путь без создания BusStateEntry."""
+        c = self._channels.get(channel)
+        if c is None:
+            return None
+        if not extended and can_id < STD_ID_COUNT:
+            return c.std_msg[can_id]
+        e = c.ext.get(can_id)
+        return e[0] if e is not None else None
+
+    def update_count(self, can_id: int, channel: int = 1, *, extended: bool = False) -> int:
+        c = self._channels.get(channel)
+        if c is None:
+            return 0
+        if not extended and can_id < STD_ID_COUNT:
+            return c.std_count[can_id]
+        e = c.ext.get(can_id)
+        return e[2] if e is not None else 0
+
+    def age(self, can_id: int, channel: int = 1, *, extended: bool = False) -> Optional[float]:
+        """Сколько секунд назад ID обновлялся в последний раз."""
+        entry = self.get(can_id, channel, extended=extended)
+        if entry is None:
+            return None
+        return time.monotonic() - entry.rx_time
+
+    async def changed(
+        self,
+        can_id: int,
+        channel: Optional[int] = None,
+        *,
+        extended: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Optional[Tuple[int, CanMessage]]:
+        """
+        Дождаться следующего кадра с can_id (на channel или на любом канале).
+        Возвращает (channel, msg) или None по таймауту.
+        """
+        key = (channel, can_id, extended)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, []).append(fut)
+        try:
+            return await asyncio.wait_for(fut, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            futs = self._waiters.get(key)
+            if futs is not None and fut in futs:
+                futs.remove(fut)
+                if not futs:
+                    del self._waiters[key]
+
+    def items(self, channel: Optional[int] = None) -> Iterator[Tuple[int, int, BusStateEntry]]:
+        """(channel, can_id, entry) для всех известных ID."""
+        for ch, c in self._channels.items():
+            if channel is not None and ch != channel:
+                continue
+            for can_id, msg in enumerate(c.std_msg):
+                if msg is not None:
+                    yield ch, can_id, BusStateEntry(msg, c.std_time[can_id], c.std_count[can_id])
+            for can_id, e in c.ext.items():
+                yield ch, can_id, BusStateEntry(e[0], e[1], e[2])
+
+    def clear(self) -> None:
+        self._channels.clear()
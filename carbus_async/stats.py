@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .messages import CanMessage
+
+STD_ID_COUNT = 0x800
+TIMESTAMP_WRAP = 1 << 32
+
+DEFAULT_NOMINAL_BITRATE = 500_000
+
+
+def frame_bits(
+    size: int,
+    *,
+    extended: bool = False,
+    fd: bool = False,
+    brs: bool = False,
+    rtr: bool = False,
+    worst_case_stuffing: bool = False,
+) -> Tuple[int, int]:
+    """
+    Оценка длины кадра в битах: (биты на nominal скорости, биты на data скорости).
+    Для кадров без BRS всё считается на nominal скорости (второе значение = 0).
+    """
+    n = 0 if rtr else size
+
+    if not fd:
+        head = 39 if extended else 19          # SOF .. DLC
+        tail = 16 + 2 + 7 + 3                  # CRC+del, ACK, EOF, IFS
+        bits = head + 8 * n + tail
+        if worst_case_stuffing:
+            bits += (head + 8 * n + 15 - 1) // 4
+        return bits, 0
+
+    arb = 36 if extended else 17               # SOF .. BRS
+    crc = 17 if n <= 16 else 21
+    data = 1 + 4 + 8 * n + 4 + crc + (crc + 3) // 4 + 1  # ESI, DLC, data, SBC, CRC, fixed stuff, del
+    tail = 2 + 7 + 3                           # ACK, EOF, IFS
+    if worst_case_stuffing:
+        arb += (arb - 1) // 4
+        data += (5 + 8 * n) // 4
+
+    if brs:
+        return arb + tail, data
+    return arb + data + tail, 0
+
+
+@dataclass
+class IdStats:
+    can_id: int
+    extended: bool
+    frames: int
+    bytes: int
+    fps: float
+    bps: float
+    iat_mean_s: Optional[float] = None
+    iat_std_s: Optional[float] = None
+    iat_min_s: Optional[float] = None
+    iat_max_s: Optional[float] = None
+
+
+@dataclass
+class ChannelStats:
+    channel: int
+    frames: int
+    bytes: int
+    fps: float
+    bps: float
+    bus_load: float
+    ids: Dict[int, IdStats] = field(default_factory=dict)
+    ext_ids: Dict[int, IdStats] = field(default_factory=dict)
+
+    def get(self, can_id: int, extended: bool = False) -> Optional[IdStats]:
+        return (self.ext_ids if extended else self.ids).get(can_id)
+
+
+@dataclass
+class BusStatsSnapshot:
+    window_s: float
+    channels: Dict[int, ChannelStats] = field(default_factory=dict)
+
+
+class _IdCounters:
+    __slots__ = ("frames", "bytes", "last_ts", "n", "mean", "m2", "min", "max")
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self.bytes = 0
+        self.last_ts = -1
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def reset_window(self) -> None:
+        self.frames = 0
+        self.bytes = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+
+class _ChannelCounters:
+    """
+    Счётчики одного канала. 11-битные ID — плоские списки по индексу can_id,
+    29-битные — словарь. В std_active попадают ID, тронутые в текущем окне,
+    чтобы сброс окна не обходил все 2048 ячеек.
+    """
+
+    def __init__(self, nominal: int, data: Optional[int], worst_case_stuffing: bool) -> None:
+        self.frames = 0
+        self.bytes = 0
+        self.busy_s = 0.0
+
+        self.std_frames: List[int] = [0] * STD_ID_COUNT
+        self.std_bytes: List[int] = [0] * STD_ID_COUNT
+        self.std_last: List[int] = [-1] * STD_ID_COUNT
+        self.std_n: List[int] = [0] * STD_ID_COUNT
+        self.std_mean: List[float] = [0.0] * STD_ID_COUNT
+        self.std_m2: List[float] = [0.0] * STD_ID_COUNT
+        self.std_min: List[float] = [math.inf] * STD_ID_COUNT
+        self.std_max: List[float] = [0.0] * STD_ID_COUNT
+        self.std_active: List[int] = []
+
+        self.ext: Dict[int, _IdCounters] = {}
+
+        self._nominal = nominal
+        self._data = data or nominal
+        self._stuffing = worst_case_stuffing
+        # ключ: size << 4 | ext | fd << 1 | brs << 2 | rtr << 3
+        self._busy_cache: Dict[int, float] = {}
+
+    def busy_time(self, size: int, extended: bool, fd: bool, brs: bool, rtr: bool) -> float:
+        key = (size << 4) | extended | (fd << 1) | (brs << 2) | (rtr << 3)
+        t = self._busy_cache.get(key)
+        if t is None:
+            nom_bits, data_bits = frame_bits(
+                size, extended=extended, fd=fd, brs=brs, rtr=rtr,
+                worst_case_stuffing=self._stuffing,
+            )
+            t = nom_bits / self._nominal + data_bits / self._data
+            self._busy_cache[key] = t
+        return t
+
+    def reset_window(self) -> None:
+        self.frames = 0
+        self.bytes = 0
+        self.busy_s = 0.0
+        for i in self.std_active:
+            self.std_frames[i] = 0
+            self.std_bytes[i] = 0
+            self.std_n[i] = 0
+            self.std_mean[i] = 0.0
+            self.std_m2[i] = 0.0
+            self.std_min[i] = math.inf
+            self.std_max[i] = 0.0
+        self.std_active.clear()
+        for c in self.ext.values():
+            c.reset_window()
+
+
+def _iat_stats(n: int, mean: float, m2: float, mn: float, mx: float) -> Tuple:
+    if n == 0:
+        return None, None, None, None
+    std = math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+    return mean, std, mn, mx
+
+
+class BusStatistics:
+    """
+    Статистика шины по каналам и CAN ID: кадры/с, байты/с, загрузка шины,
+    межкадровые интервалы (по аппаратным timestamp_us) и их джиттер.
+
+    Обновляется из read loop устройства за O(1) на кадр. snapshot() возвращает
+    значения за окно с момента предыдущего snapshot(reset=True).
+    """
+
+    def __init__(
+        self,
+        dev=None,
+        *,
+        bitrates: Optional[Dict[int, Tuple[int, Optional[int]]]] = None,
+        worst_case_stuffing: bool = False,
+        autostart: bool = True,
+    ) -> None:
+        self._dev = dev
+        self._bitrates = dict(bitrates or {})
+        self._stuffing = worst_case_stuffing
+        self._channels: Dict[int, _ChannelCounters] = {}
+        self._window_start = time.monotonic()
+        self._attached = False
+        if dev is not None and autostart:
+            self.start()
+
+    def start(self) -> None:
+        if self._dev is None or self._attached:
+            return
+        self._dev.add_rx_tap(self.update)
+        self._attached = True
+
+    def stop(self) -> None:
+        if self._dev is not None and self._attached:
+            self._dev.remove_rx_tap(self.update)
+        self._attached = False
+
+    def _channel(self, channel: int) -> _ChannelCounters:
+        c = self._channels.get(channel)
+        if c is None:
+            rates = self._bitrates.get(channel)
+            if rates is None and self._dev is not None:
+                rates = self._dev.get_channel_bitrate(channel)
+            nominal, data = rates or (DEFAULT_NOMINAL_BITRATE, None)
+            c = _ChannelCounters(nominal, data, self._stuffing)
+            self._channels[channel] = c
+        return c
+
+    def update(self, channel: int, msg: CanMessage) -> None:
+        c = self._channels.get(channel)
+        if c is None:
+            c = self._channel(channel)
+
+        size = len(msg.data)
+        c.frames += 1
+        c.bytes += size
+        c.busy_s += c.busy_time(size, msg.extended, msg.fd, msg.brs, msg.rtr)
+
+        ts = msg.timestamp_us
+        can_id = msg.can_id
+
+        if not msg.extended and can_id < STD_ID_COUNT:
+            if c.std_frames[can_id] == 0:
+                c.std_active.append(can_id)
+            c.std_frames[can_id] += 1
+            c.std_bytes[can_id] += size
+
+            last = c.std_last[can_id]
+            c.std_last[can_id] = ts
+            if last < 0:
+                return
+            iat = ((ts - last) % TIMESTAMP_WRAP) * 1e-6
+            n = c.std_n[can_id] + 1
+            c.std_n[can_id] = n
+            mean = c.std_mean[can_id]
+            delta = iat - mean
+            mean += delta / n
+            c.std_mean[can_id] = mean
+            c.std_m2[can_id] += delta * (iat - mean)
+            if iat < c.std_min[can_id]:
+                c.std_min[can_id] = iat
+            if iat > c.std_max[can_id]:
+                c.std_max[can_id] = iat
+            return
+
+        e = c.ext.get(can_id)
+        if e is None:
+            e = _IdCounters()
+            c.ext[can_id] = e
+        e.frames += 1
+        e.bytes += size
+
+        last = e.last_ts
+        e.last_ts = ts
+        if last < 0:
+            return
+        iat = ((ts - last) % TIMESTAMP_WRAP) * 1e-6
+        e.n += 1
+        delta = iat - e.mean
+        e.mean += delta / e.n
+        e.m2 += delta * (iat - e.mean)
+        if iat < e.min:
+            e.min = iat
+        if iat > e.max:
+            e.max = iat
+
+    def snapshot(self, *, reset: bool = True) -> BusStatsSnapshot:
+        now = time.monotonic()
+        window = max(now - self._window_start, 1e-9)
+        snap = BusStatsSnapshot(window_s=window)
+
+        for ch, c in self._channels.items():
+            cs = ChannelStats(
+                channel=ch,
+                frames=c.frames,
+                bytes=c.bytes,
+                fps=c.frames / window,
+                bps=c.bytes / window,
+                bus_load=min(c.busy_s / window, 1.0),
+            )
+            for i in c.std_active:
+                frames = c.std_frames[i]
+                mean, std, mn, mx = _iat_stats(
+                    c.std_n[i], c.std_mean[i], c.std_m2[i], c.std_min[i], c.std_max[i]
+                )
+                cs.ids[i] = IdStats(
+                    can_id=i,
+                    extended=False,
+                    frames=frames,
+                    bytes=c.std_bytes[i],
+                    fps=frames / window,
+                    bps=c.std_bytes[i] / window,
+                    iat_mean_s=mean,
+                    iat_std_s=std,
+                    iat_min_s=mn,
+                    iat_max_s=mx,
+                )
+            for can_id, e in c.ext.items():
+                if e.frames == 0:
+                    continue
+                mean, std, mn, mx = _iat_stats(e.n, e.mean, e.m2, e.min, e.max)
+                cs.ext_ids[can_id] = IdStats(
+                    can_id=can_id,
+                    extended=True,
+                    frames=e.frames,
+                    bytes=e.bytes,
+                    fps=e.frames / window,
+                    bps=e.bytes / window,
+                    iat_mean_s=mean,
+                    iat_std_s=std,
+                    iat_min_s=mn,
+                    iat_max_s=mx,
+                )
+            snap.channels[ch] = cs
+
+            if reset:
+                c.reset_window()
+
+        if reset:
+            self._window_start = now
+        return snap
+
+    def reset(self) -> None:
+        self._channels.clear()
+        self._window_start = time.monotonic()
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from .filter_expr import FilterLike, as_filter
+from .messages import CanMessage
+
+log = logging.getLogger("carbus_async.subscription")
+
+SubscriptionCallback = Callable[[int, CanMessage], None]
+SubscriptionPred = Callable[[int, CanMessage], bool]
+
+
+def _key(channel: int, msg: CanMessage) -> int:
+    return (channel << 32) | (int(msg.extended) << 31) | msg.can_id
+
+
+class _IdState:
+    __slots__ = ("data", "last_t", "pending", "pending_data", "timer")
+
+    def __init__(self) -> None:
+        self.data: Optional[bytes] = None           # последние выданные данные (с маской) для on_change
+        self.last_t = -1e9                           # время последней выдачи
+        self.pending: Optional[Tuple[int, CanMessage]] = None
+        self.pending_data: Optional[bytes] = None    # данные (с маской) отложенного кадра
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class Subscription:
+    """
+    Подписка на кадры с фильтрацией прямо в read loop (RX tap), до очередей.
+
+    - can_ids / channels / predicate / filter (выражение, см. filter_expr) —
+      какие кадры вообще интересны;
+    - on_change — выдавать кадр только при изменении данных; mask сужает
+      сравнение до нужных байт/бит (байты за пределами mask сравниваются целиком);
+    - min_interval_s — не чаще одного кадра на ID за интервал; подавленные
+      кадры не теряются бесследно: по окончании интервала выдаётся последний
+      из них (last value wins).
+
+    Кадры забираются через get() / async for, либо синхронным callback.
+    """
+
+    def __init__(
+        self,
+        dev=None,
+        *,
+        can_ids: Optional[Iterable[int]] = None,
+        channels: Optional[Iterable[int]] = None,
+        predicate: Optional[SubscriptionPred] = None,
+        filter: Optional[FilterLike] = None,
+        on_change: bool = False,
+        mask: Optional[bytes] = None,
+        min_interval_s: Optional[float] = None,
+        callback: Optional[SubscriptionCallback] = None,
+        maxsize: int = 1000,
+        autostart: bool = True,
+    ) -> None:
+        self._dev = dev
+        self._can_ids: Optional[Set[int]] = set(can_ids) if can_ids is not None else None
+        self._channels: Optional[Set[int]] = set(channels) if channels is not None else None
+        self._predicate = predicate
+        self._filter = as_filter(filter)
+        self.on_change = on_change or mask is not None
+        self.mask = bytes(mask) if mask is not None else None
+        self.min_interval_s = min_interval_s
+        self._callback = callback
+        self._queue: "asyncio.Queue[Tuple[int, CanMessage]]" = asyncio.Queue(maxsize=maxsize)
+        self._ids: Dict[int, _IdState] = {}
+        self._attached = False
+
+        self.received = 0       # кадров прошло фильтр по ID/каналу
+        self.delivered = 0      # кадров выдано подписчику
+        self.suppressed = 0     # отброшено как неизменившиеся / перекрыто более свежим
+        self.dropped = 0        # вытеснено из переполненной очереди
+
+        if dev is not None and autostart:
+            self.start()
+
+    # --- управление -----------------------------------------------------------
+
+    def start(self) -> None:
+        if self._dev is None or self._attached:
+            return
+        self._dev.add_rx_tap(self.offer)
+        self._attached = True
+
+    def close(self) -> None:
+        if self._dev is not None and self._attached:
+            self._dev.remove_rx_tap(self.offer)
+        self._attached = False
+        for st in self._ids.values():
+            if st.timer is not None:
+                st.timer.cancel()
+                st.timer = None
+
+    # --- read path ------------------------------------------------------------
+
+    def _masked(self, data: bytes) -> bytes:
+        mask = self.mask
+        if mask is None:
+            return bytes(data)
+        n = len(mask)
+        head = bytes(b & m for b, m in zip(data[:n], mask))
+        return head + bytes(data[n:]) if len(data) > n else head
+
+    def offer(self, channel: int, msg: CanMessage) -> bool:
+        """Обработать кадр; True — если кадр выдан подписчику сразу."""
+        if self._channels is not None and channel not in self._channels:
+            return False
+        if self._can_ids is not None and msg.can_id not in self._can_ids:
+            return False
+        if self._predicate is not None and not self._predicate(channel, msg):
+            return False
+        if self._filter is not None and not self._filter(channel, msg):
+            return False
+        self.received += 1
+
+        if not self.on_change and self.min_interval_s is None:
+            self._deliver(channel, msg)
+            return True
+
+        key = _key(channel, msg)
+        st = self._ids.get(key)
+        if st is None:
+            st = self._ids[key] = _IdState()
+
+        cur = None
+        if self.on_change:
+            # сравниваем с последним выданным кадром, а не с отложенным
+            cur = self._masked(msg.data)
+            if cur == st.data:
+                if st.pending is not None:
+                    # значение вернулось к выданному — отложенный кадр уже не нужен
+                    st.pending = st.pending_data = None
+                    self.suppressed += 1
+                self.suppressed += 1
+                return False
+
+        interval = self.min_interval_s
+        if interval is None:
+            st.data = cur
+            self._deliver(channel, msg)
+            return True
+
+        now = time.monotonic()
+        if now - st.last_t >= interval and st.timer is None:
+            st.last_t = now
+            st.data = cur
+            self._deliver(channel, msg)
+            return True
+
+        if st.pending is not None:
+            self.suppressed += 1
+        st.pending = (channel, msg)
+        st.pending_data = cur
+        if st.timer is None:
+            loop = asyncio.get_running_loop()
+            st.timer = loop.call_later(st.last_t + interval - now, self._flush, st)
+        return False
+
+    def _flush(self, st: _IdState) -> None:
+        st.timer = None
+        pending = st.pending
+        if pending is None:
+            return
+        st.pending = None
+        st.data, st.pending_data = st.pending_data, None
+        st.last_t = time.monotonic()
+        self._deliver(*pending)
+
+    def _deliver(self, channel: int, msg: CanMessage) -> None:
+        self.delivered += 1
+        if self._callback is not None:
+            try:
+                self._callback(channel, msg)
+            except Exception:
+                log.exception("Subscription callback failed (ch=%s id=0x%X)", channel, msg.can_id)
+            return
+        q = self._queue
+        if q.full():
+            q.get_nowait()
+            self.dropped += 1
+        q.put_nowait((channel, msg))
+
+    # --- потребитель ----------------------------------------------------------
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Tuple[int, CanMessage]]:
+        """Следующий кадр (channel, msg) или None по таймауту."""
+        if timeout is None:
+            return await self._queue.get()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def get_nowait(self) -> Optional[Tuple[int, CanMessage]]:
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> Tuple[int, CanMessage]:
+        return await self._queue.get()
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
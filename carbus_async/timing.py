@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+# asyncio.sleep() упирается в разрешение таймера event loop (порядка 1 мс
+# плюс задержка планировщика), поэтому точные дедлайны добираются в два этапа:
+# грубый sleep до (deadline - spin_s), затем активное ожидание с отдачей
+# управления loop-у через sleep(0), чтобы read loop не блокировался.
+
+DEFAULT_SPIN_S = 0.002
+
+clock = time.perf_counter
+
+
+async def sleep_until(deadline: float, *, spin_s: float = DEFAULT_SPIN_S) -> float:
+    """
+    Дождаться момента deadline (по time.perf_counter) и вернуть фактическое время.
+    spin_s=0 — только asyncio.sleep, без активного ожидания.
+    """
+    now = clock()
+    remaining = deadline - now
+    if remaining > spin_s:
+        await asyncio.sleep(remaining - spin_s)
+        now = clock()
+    while now < deadline:
+        await asyncio.sleep(0)
+        now = clock()
+    return now
+
+
+async def precise_sleep(delay: float, *, spin_s: float = DEFAULT_SPIN_S) -> float:
+    return await sleep_until(clock() + delay, spin_s=spin_s)
+
+
+class Timeout:
+    """
+    async with Timeout(delay, "N_As"): ... — аналог asyncio.timeout() (3.11+)
+    для Python 3.10: по истечении delay текущая задача отменяется, отмена
+    превращается в asyncio.TimeoutError. Без отдельной задачи, как у
+    wait_for(), поэтому годится для каждого кадра. delay=None — без ограничения.
+    """
+
+    __slots__ = ("_delay", "_what", "_task", "_handle", "_expired")
+
+    def __init__(self, delay: float | None, what: str = "timeout") -> None:
+        self._delay = delay
+        self._what = what
+        self._task: asyncio.Task | None = None
+        self._handle: asyncio.TimerHandle | None = None
+        self._expired = False
+
+    async def __aenter__(self) -> "Timeout":
+        if self._delay is not None:
+            self._task = asyncio.current_task()
+            self._handle = asyncio.get_running_loop().call_later(self._delay, self._expire)
+        return self
+
+    def _expire(self) -> None:
+        self._expired = True
+        self._task.cancel()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._expired and exc_type is asyncio.CancelledError:
+            uncancel = getattr(self._task, "uncancel", None)
+            if uncancel is not None:
+                uncancel()
+            raise asyncio.TimeoutError(self._what) from None
+        return False
+
+
+class Watchdog:
+    """
+    Таймаут каждой из множества коротких операций подряд (кадры ISO-TP) без
+    таймера на операцию: один call_later на всю серию, на операцию — только
+    отметки start()/stop(). Операция дольше delay отменяется с
+    asyncio.TimeoutError не позже чем через 1.25 * delay.
+
+        async with Watchdog(1.0, "N_As") as wd:
+            for msg in frames:
+                wd.start()
+                await transport.send(msg)
+                wd.stop()
+    """
+
+    __slots__ = ("_delay", "_what", "_task", "_handle", "_expired", "_since")
+
+    def __init__(self, delay: float | None, what: str = "timeout") -> None:
+        self._delay = delay
+        self._what = what
+        self._task: asyncio.Task | None = None
+        self._handle: asyncio.TimerHandle | None = None
+        self._expired = False
+        self._since: float | None = None
+
+    def start(self) -> None:
+        self._since = clock()
+
+    def stop(self) -> None:
+        self._since = None
+
+    async def __aenter__(self) -> "Watchdog":
+        if self._delay is not None:
+            self._task = asyncio.current_task()
+            self._handle = asyncio.get_running_loop().call_later(self._delay, self._check)
+        return self
+
+    def _check(self) -> None:
+        since = self._since
+        if since is None:
+            # операции нет: следующая проверка раньше, чтобы опоздание было не больше delay / 4
+            self._handle = asyncio.get_running_loop().call_later(self._delay / 4, self._check)
+            return
+        left = since + self._delay - clock()
+        if left > 0:
+            self._handle = asyncio.get_running_loop().call_later(left, self._check)
+            return
+        self._handle = None
+        self._expired = True
+        self._task.cancel()
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._expired and exc_type is asyncio.CancelledError:
+            uncancel = getattr(self._task, "uncancel", None)
+            if uncancel is not None:
+                uncancel()
+            raise asyncio.TimeoutError(self._what) from None
+        return False
@@ -0,0 +1,430 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import queue
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Set, Union
+
+from .filter_expr import FilterLike, as_filter
+from .messages import CanMessage
+
+log = logging.getLogger("carbus_async.trace")
+
+# Формат файла трассы (.cbt), всё little-endian:
+#
+#   FileHeader  : magic "CBTRACE\0", version u16, flags u16, start_time_us i64
+#   Chunk * N   : ChunkHeader + payload (zlib или как есть)
+#   ChunkHeader : magic "CHNK", flags u16, reserved u16, n_frames u32,
+#                 stored_size u32, raw_size u32, crc32 u32, t_min_us i64, t_max_us i64
+#   Frame       : timestamp_us i64, can_id u32, channel u8, flags u8, size u8, data[size]
+#
+# Биты флагов кадра совпадают с младшими битами BusMessageFlags.
+
+TRACE_MAGIC = b"CBTRACE\x00"
+TRACE_VERSION = 1
+CHUNK_MAGIC = b"CHNK"
+
+FILE_HEADER = struct.Struct("<8sHHq")
+CHUNK_HEADER = struct.Struct("<4sHHIIIIqq")
+FRAME_HEADER = struct.Struct("<qIBBB")
+
+CHUNK_FLAG_ZLIB = 0x0001
+
+FRAME_EXTENDED = 0x01
+FRAME_RTR = 0x02
+FRAME_FD = 0x04
+FRAME_BRS = 0x08
+
+PathLike = Union[str, Path]
+
+
+class TraceFormatError(ValueError):
+    ...
+
+
+class TraceFrame(NamedTuple):
+    timestamp_us: int
+    channel: int
+    msg: CanMessage
+
+
+@dataclass(frozen=True)
+class TraceChunkInfo:
+    offset: int          # смещение ChunkHeader в файле
+    flags: int
+    n_frames: int
+    stored_size: int
+    raw_size: int
+    crc32: int
+    t_min_us: int
+    t_max_us: int
+
+    @property
+    def data_offset(self) -> int:
+        return self.offset + CHUNK_HEADER.size
+
+    @property
+    def end_offset(self) -> int:
+        return self.data_offset + self.stored_size
+
+
+def message_flags(msg: CanMessage) -> int:
+    return (
+        (FRAME_EXTENDED if msg.extended else 0)
+        | (FRAME_RTR if msg.rtr else 0)
+        | (FRAME_FD if msg.fd else 0)
+        | (FRAME_BRS if msg.brs else 0)
+    )
+
+
+def decode_chunk_payload(info: TraceChunkInfo, stored) -> bytes:
+    if zlib.crc32(stored) != info.crc32:
+        raise TraceFormatError(f"CRC mismatch in chunk at offset {info.offset}")
+    if info.flags & CHUNK_FLAG_ZLIB:
+        return zlib.decompress(stored)
+    return bytes(stored)
+
+
+def iter_chunk_frames(raw: bytes) -> Iterator[TraceFrame]:
+    unpack = FRAME_HEADER.unpack_from
+    hsize = FRAME_HEADER.size
+    off = 0
+    end = len(raw)
+    while off < end:
+        ts, can_id, ch, fl, size = unpack(raw, off)
+        off += hsize
+        data = raw[off:off + size]
+        off += size
+        yield TraceFrame(
+            ts,
+            ch,
+            CanMessage(
+                can_id=can_id,
+                data=data,
+                extended=bool(fl & FRAME_EXTENDED),
+                rtr=bool(fl & FRAME_RTR),
+                fd=bool(fl & FRAME_FD),
+                brs=bool(fl & FRAME_BRS),
+                timestamp_us=ts & 0xFFFFFFFF,
+            ),
+        )
+
+
+class TimestampUnwrapper:
+    """Разворачивает 32-битный аппаратный timestamp_us в монотонный 64-битный."""
+
+    __slots__ = ("_last", "_wrap")
+
+    def __init__(self) -> None:
+        self._last = -1
+        self._wrap = 0
+
+    def __call__(self, raw: int) -> int:
+        if raw < self._last and self._last - raw > 0x80000000:
+            self._wrap += 1 << 32
+        self._last = raw
+        return self._wrap + raw
+
+
+class TraceWriter:
+    """
+    Запись трассы в бинарный формат .cbt.
+
+    append() только упаковывает кадр в буфер текущего чанка; сжатие и запись
+    на диск выполняются в фоновом потоке, поэтому вызывающий (read loop)
+    никогда не ждёт диск. Если поток не успевает, лишние чанки отбрасываются
+    и учитываются в dropped_frames, а не копятся в памяти бесконечно.
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        *,
+        compress: bool = True,
+        level: int = 1,
+        chunk_frames: int = 4096,
+        chunk_bytes: int = 256 * 1024,
+        max_pending_chunks: int = 256,
+        start_time_us: Optional[int] = None,
+        index: bool = True,
+    ) -> None:
+        self.path = Path(path)
+        self.compress = compress
+        self.level = level
+        self.chunk_frames = chunk_frames
+        self.chunk_bytes = chunk_bytes
+        self.max_pending_chunks = max_pending_chunks
+        self.start_time_us = (
+            start_time_us if start_time_us is not None else time.time_ns() // 1000
+        )
+
+        self.frames_written = 0
+        self.chunks_written = 0
+        # у каждого потока свой счётчик: += из двух потоков без блокировки теряет отсчёты
+        self._dropped_queue = 0     # очередь полна (поток вызывающего)
+        self._dropped_write = 0     # ошибка записи (фоновый поток)
+
+        self._buf = bytearray()
+        self._n = 0
+        self._t_min = 0
+        self._t_max = 0
+        self._pack = FRAME_HEADER.pack
+
+        self._index = None
+        if index:
+            from .trace_index import TraceIndexBuilder
+            self._index = TraceIndexBuilder()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file: BinaryIO = self.path.open("wb")
+        self._file.write(FILE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, 0, self.start_time_us))
+        self._thread = threading.Thread(
+            target=self._writer_main,
+            name=f"TraceWriter:{self.path.name}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._dropped_queue + self._dropped_write
+
+    def __enter__(self) -> "TraceWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, timestamp_us: int, channel: int, msg: CanMessage) -> None:
+        if self._closed:
+            raise ValueError("TraceWriter is closed")
+        data = msg.data
+        if self._n == 0:
+            self._t_min = self._t_max = timestamp_us
+        elif timestamp_us < self._t_min:
+            self._t_min = timestamp_us
+        elif timestamp_us > self._t_max:
+            self._t_max = timestamp_us
+
+        buf = self._buf
+        buf += self._pack(timestamp_us, msg.can_id, channel & 0xFF, message_flags(msg), len(data))
+        buf += data
+        self._n += 1
+
+        if self._n >= self.chunk_frames or len(buf) >= self.chunk_bytes:
+            self._seal()
+
+    def write(self, frame: TraceFrame) -> None:
+        self.append(frame.timestamp_us, frame.channel, frame.msg)
+
+    def write_many(self, frames: Iterable[TraceFrame]) -> int:
+        n = 0
+        for f in frames:
+            self.append(f.timestamp_us, f.channel, f.msg)
+            n += 1
+        return n
+
+    def flush(self) -> None:
+        """Закрыть текущий чанк и отдать его фоновому потоку."""
+        if self._n:
+            self._seal()
+
+    def _seal(self) -> None:
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise err
+        if self._queue.qsize() >= self.max_pending_chunks:
+            self._dropped_queue += self._n
+        else:
+            self._queue.put_nowait((bytes(self._buf), self._n, self._t_min, self._t_max))
+        self._buf = bytearray()
+        self._n = 0
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        size = self._file.tell()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+        if self._index is not None:
+            from .trace_index import index_path_for
+            self._index.write(index_path_for(self.path), size)
+
+    def _write_chunk(self, raw: bytes, n: int, t_min: int, t_max: int) -> None:
+        if self.compress:
+            stored = zlib.compress(raw, self.level)
+            flags = CHUNK_FLAG_ZLIB
+        else:
+            stored = raw
+            flags = 0
+        info = TraceChunkInfo(
+            self._file.tell(), flags, n, len(stored), len(raw), zlib.crc32(stored), t_min, t_max,
+        )
+        self._file.write(
+            CHUNK_HEADER.pack(
+                CHUNK_MAGIC, flags, 0, n, info.stored_size, info.raw_size, info.crc32, t_min, t_max,
+            )
+        )
+        self._file.write(stored)
+        if self._index is not None:
+            from .trace_index import chunk_keys
+            self._index.add_chunk(info, chunk_keys(raw))
+        self.frames_written += n
+        self.chunks_written += 1
+
+    def _writer_main(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                self._write_chunk(*item)
+            except BaseException as e:
+                log.exception("Trace write failed: %s", e)
+                self._error = e
+                self._dropped_write += item[1]
+        try:
+            self._file.flush()
+        except Exception as e:
+            self._error = e
+
+
+class TraceReader:
+    """Последовательное чтение файла трассы .cbt."""
+
+    def __init__(self, path: PathLike) -> None:
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            hdr = f.read(FILE_HEADER.size)
+        if len(hdr) < FILE_HEADER.size:
+            raise TraceFormatError(f"{self.path}: file too short")
+        magic, version, flags, start = FILE_HEADER.unpack(hdr)
+        if magic != TRACE_MAGIC:
+            raise TraceFormatError(f"{self.path}: not a carbus trace")
+        if version != TRACE_VERSION:
+            raise TraceFormatError(f"{self.path}: unsupported trace version {version}")
+        self.version = version
+        self.flags = flags
+        self.start_time_us = start
+
+    def chunks(self) -> Iterator[TraceChunkInfo]:
+        with self.path.open("rb") as f:
+            f.seek(FILE_HEADER.size)
+            while True:
+                info = self._read_chunk_header(f)
+                if info is None:
+                    return
+                yield info
+                f.seek(info.end_offset)
+
+    def frames(self) -> Iterator[TraceFrame]:
+        with self.path.open("rb") as f:
+            f.seek(FILE_HEADER.size)
+            while True:
+                info = self._read_chunk_header(f)
+                if info is None:
+                    return
+                stored = f.read(info.stored_size)
+                if len(stored) < info.stored_size:
+                    log.warning("%s: truncated chunk at offset %d", self.path, info.offset)
+                    return
+                yield from iter_chunk_frames(decode_chunk_payload(info, stored))
+
+    __iter__ = frames
+
+    def _read_chunk_header(self, f: BinaryIO) -> Optional[TraceChunkInfo]:
+        offset = f.tell()
+        hdr = f.read(CHUNK_HEADER.size)
+        if len(hdr) < CHUNK_HEADER.size:
+            return None
+        magic, flags, _res, n, stored, raw, crc, t_min, t_max = CHUNK_HEADER.unpack(hdr)
+        if magic != CHUNK_MAGIC:
+            raise TraceFormatError(f"{self.path}: bad chunk magic at offset {offset}")
+        return TraceChunkInfo(offset, flags, n, stored, raw, crc, t_min, t_max)
+
+
+class TraceRecorder:
+    """
+    Запись всей шины (или выбранных каналов / кадров по filter) с CarBusDevice в файл .cbt.
+
+    Кадры забираются синхронным RX tap прямо в read loop; 32-битный аппаратный
+    timestamp разворачивается в 64-битный, чтобы многочасовые записи
+    оставались монотонными.
+    """
+
+    def __init__(
+        self,
+        dev,
+        path: PathLike,
+        *,
+        channels: Optional[Iterable[int]] = None,
+        filter: Optional[FilterLike] = None,
+        compress: bool = True,
+        chunk_frames: int = 4096,
+        autostart: bool = True,
+        **writer_kwargs,
+    ) -> None:
+        self._dev = dev
+        self.path = Path(path)
+        self._channels: Optional[Set[int]] = set(channels) if channels is not None else None
+        self._filter = as_filter(filter)
+        self._writer_kwargs = dict(compress=compress, chunk_frames=chunk_frames, **writer_kwargs)
+        self._writer: Optional[TraceWriter] = None
+        self._unwrap = TimestampUnwrapper()
+        if autostart:
+            self.start()
+
+    @property
+    def writer(self) -> Optional[TraceWriter]:
+        return self._writer
+
+    @property
+    def frames_written(self) -> int:
+        return self._writer.frames_written if self._writer else 0
+
+    @property
+    def dropped_frames(self) -> int:
+        return self._writer.dropped_frames if self._writer else 0
+
+    def start(self) -> None:
+        if self._writer is not None:
+            return
+        self._writer = TraceWriter(self.path, **self._writer_kwargs)
+        self._unwrap = TimestampUnwrapper()
+        self._dev.add_rx_tap(self._on_frame)
+
+    async def stop(self) -> None:
+        if self._writer is None:
+            return
+        self._dev.remove_rx_tap(self._on_frame)
+        writer, self._writer = self._writer, None
+        await asyncio.to_thread(writer.close)
+
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._writer.flush()
+
+    def _on_frame(self, channel: int, msg: CanMessage) -> None:
+        # переполнение 32-битного timestamp отслеживается по всем кадрам,
+        # иначе при редких записываемых кадрах оно теряется
+        ts = self._unwrap(msg.timestamp_us)
+        if self._channels is not None and channel not in self._channels:
+            return
+        if self._filter is not None and not self._filter(channel, msg):
+            return
+        self._writer.append(ts, channel, msg)
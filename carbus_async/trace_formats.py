@@ -0,0 +1,399 @@
+from __future__ import annotations
+
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, TextIO, Union
+
+from .messages import CanMessage
+from .trace import PathLike, TraceFrame, TraceReader, TraceWriter
+
+# Потоковые конвертеры текстовых форматов трасс <-> TraceFrame.
+#
+# Все read_* — генераторы: файл читается построчно, память не зависит
+# от размера лога. Результат можно сразу отдать в TraceReplayer или
+# TraceWriter.write_many(); write_* принимают любой итератор TraceFrame.
+
+FD_DLC_SIZES = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+
+TextSource = Union[PathLike, Iterable[str]]
+
+_IFACE_INDEX = re.compile(r"(\d+)$")
+
+
+def _lines(src: TextSource) -> Iterator[str]:
+    if isinstance(src, (str, Path)):
+        with open(src, "r", encoding="ascii", errors="replace") as f:
+            yield from f
+    else:
+        yield from src
+
+
+def _seconds_to_us(s: str) -> int:
+    s = s.strip()
+    sign = -1 if s.startswith("-") else 1
+    sec, _, frac = s.lstrip("+-").partition(".")
+    return sign * (int(sec or "0") * 1_000_000 + int((frac + "000000")[:6]))
+
+
+def _us_to_seconds(us: int) -> str:
+    sign = "-" if us < 0 else ""
+    sec, frac = divmod(abs(us), 1_000_000)
+    return f"{sign}{sec}.{frac:06d}"
+
+
+def size_to_dlc(size: int) -> int:
+    for dlc, n in enumerate(FD_DLC_SIZES):
+        if size <= n:
+            return dlc
+    raise ValueError(f"CAN-FD payload too long: {size}")
+
+
+# --- candump -l -------------------------------------------------------------
+#
+#   (1436509052.249713) can0 123#DEADBEEF
+#   (1436509052.249713) can0 12345678#DEADBEEF     (8 hex цифр ID => extended)
+#   (1436509052.249713) can0 123#R                  (RTR)
+#   (1436509052.249713) can0 123##1DEADBEEF         (CAN-FD, 1 hex цифра флагов: BRS=1, ESI=2)
+
+
+def default_iface_channel(iface: str) -> int:
+    """can0 -> 1, vcan1 -> 2, без номера -> 1."""
+    m = _IFACE_INDEX.search(iface)
+    return int(m.group(1)) + 1 if m else 1
+
+
+def read_candump(
+    src: TextSource,
+    *,
+    channel_map: Optional[Dict[str, int]] = None,
+) -> Iterator[TraceFrame]:
+    cmap: Dict[str, int] = dict(channel_map or {})
+    for line in _lines(src):
+        parts = line.split()
+        if len(parts) < 3 or not parts[0].startswith("("):
+            continue
+        ts_s, iface, frame = parts[0], parts[1], parts[2]
+        can_id_s, sep, body = frame.partition("#")
+        if not sep:
+            continue
+
+        ch = cmap.get(iface)
+        if ch is None:
+            ch = cmap[iface] = default_iface_channel(iface)
+
+        extended = len(can_id_s) > 3
+        fd = brs = rtr = False
+        if body.startswith("#"):
+            fd = True
+            fd_flags = int(body[1], 16) if len(body) > 1 else 0
+            brs = bool(fd_flags & 0x1)
+            data = bytes.fromhex(body[2:])
+        elif body[:1] in ("R", "r"):
+            rtr = True
+            dlc = int(body[1:], 16) if len(body) > 1 else 0
+            data = bytes(dlc)
+        else:
+            data = bytes.fromhex(body)
+
+        ts = _seconds_to_us(ts_s[1:-1])
+        yield TraceFrame(
+            ts,
+            ch,
+            CanMessage(
+                can_id=int(can_id_s, 16),
+                data=data,
+                extended=extended,
+                rtr=rtr,
+                fd=fd,
+                brs=brs,
+                timestamp_us=ts & 0xFFFFFFFF,
+            ),
+        )
+
+
+def format_candump(ts_us: int, iface: str, msg: CanMessage) -> str:
+    can_id = f"{msg.can_id:08X}" if msg.extended else f"{msg.can_id:03X}"
+    if msg.fd:
+        body = f"#{1 if msg.brs else 0:X}{msg.data.hex().upper()}"
+    elif msg.rtr:
+        body = f"R{len(msg.data):X}" if msg.data else "R"
+    else:
+        body = msg.data.hex().upper()
+    return f"({_us_to_seconds(ts_us)}) {iface} {can_id}#{body}\n"
+
+
+def write_candump(
+    frames: Iterable[TraceFrame],
+    dst: Union[PathLike, TextIO],
+    *,
+    iface_map: Optional[Dict[int, str]] = None,
+) -> int:
+    imap = dict(iface_map or {})
+
+    def _write(f: TextIO) -> int:
+        n = 0
+        for ts, ch, msg in frames:
+            iface = imap.get(ch)
+            if iface is None:
+                iface = imap[ch] = f"can{max(ch - 1, 0)}"
+            f.write(format_candump(ts, iface, msg))
+            n += 1
+        return n
+
+    if isinstance(dst, (str, Path)):
+        with open(dst, "w", encoding="ascii", newline="\n") as f:
+            return _write(f)
+    return _write(dst)
+
+
+# --- Vector ASC -------------------------------------------------------------
+#
+#   base hex  timestamps absolute
+#      0.010000 1  123             Rx   d 8 01 02 03 04 05 06 07 08
+#      0.020000 1  18DAF110x       Tx   d 8 ...
+#      0.030000 1  123             Rx   r
+#      0.040000 CANFD   1 Rx        123  [symbolic]  1 0 d 12 01 02 ... <duration> <len> <flags> ...
+
+_ASC_DIRS = ("Rx", "Tx", "TxRq")
+
+
+def read_asc(src: TextSource) -> Iterator[TraceFrame]:
+    base = 16
+    relative = False
+    prev_ts = 0
+
+    for line in _lines(src):
+        parts = line.split()
+        if not parts:
+            continue
+
+        head = parts[0]
+        if not (head[0].isdigit() or head[0] == "-" and len(head) > 1):
+            if head == "base" and len(parts) >= 4:
+                base = 10 if parts[1] == "dec" else 16
+                relative = parts[3] == "relative"
+            continue
+
+        try:
+            ts = _seconds_to_us(head)
+        except ValueError:
+            continue
+        if relative:
+            ts += prev_ts
+            prev_ts = ts
+        if len(parts) < 4:
+            continue
+
+        if parts[1] == "CANFD":
+            frame = _parse_asc_fd(parts, base)
+        elif parts[1].isdigit():
+            frame = _parse_asc_classic(parts, base)
+        else:
+            frame = None
+
+        if frame is None:
+            continue
+        ch, msg = frame
+        msg.timestamp_us = ts & 0xFFFFFFFF
+        yield TraceFrame(ts, ch, msg)
+
+
+def _parse_asc_id(tok: str, base: int):
+    extended = tok[-1] in ("x", "X")
+    if extended:
+        tok = tok[:-1]
+    return int(tok, base), extended
+
+
+def _parse_asc_classic(parts, base: int):
+    # <ts> <ch> <id>[x] <dir> d <dlc> <data...> | <ts> <ch> <id> <dir> r [dlc]
+    if len(parts) < 5 or parts[3] not in _ASC_DIRS:
+        return None
+    try:
+        can_id, extended = _parse_asc_id(parts[2], base)
+    except ValueError:
+        return None
+    kind = parts[4]
+    if kind == "d":
+        n = int(parts[5], 16)
+        data = bytes(int(b, base) for b in parts[6:6 + n])
+        msg = CanMessage(can_id=can_id, data=data, extended=extended)
+    elif kind == "r":
+        n = int(parts[5], 16) if len(parts) > 5 and parts[5] not in ("Length", "=") else 0
+        msg = CanMessage(can_id=can_id, data=bytes(n), extended=extended, rtr=True)
+    else:
+        return None
+    return int(parts[1]), msg
+
+
+def _parse_asc_fd(parts, base: int):
+    # <ts> CANFD <ch> <dir> <id>[x] [symbolic] <brs> <esi> <dlc> <len> <data...> ...
+    if len(parts) < 9 or parts[3] not in _ASC_DIRS:
+        return None
+    try:
+        can_id, extended = _parse_asc_id(parts[4], base)
+    except ValueError:
+        return None
+    i = 5
+    if parts[i] not in ("0", "1"):
+        i += 1  # символьное имя
+    brs = parts[i] == "1"
+    n = int(parts[i + 3])
+    data = bytes(int(b, base) for b in parts[i + 4:i + 4 + n])
+    return int(parts[2]), CanMessage(can_id=can_id, data=data, extended=extended, fd=True, brs=brs)
+
+
+def format_asc(ts_us: int, channel: int, msg: CanMessage) -> str:
+    t = _us_to_seconds(ts_us)
+    can_id = f"{msg.can_id:X}x" if msg.extended else f"{msg.can_id:X}"
+    data = " ".join(f"{b:02X}" for b in msg.data)
+    if msg.fd:
+        n = len(msg.data)
+        return (
+            f"{t:>11} CANFD {channel:>3} Rx   {can_id:>8} {1 if msg.brs else 0} 0 "
+            f"{size_to_dlc(n):x} {n:>2} {data}\n"
+        )
+    if msg.rtr:
+        return f"{t:>11} {channel}  {can_id:<15} Rx   r {len(msg.data):X}\n"
+    return f"{t:>11} {channel}  {can_id:<15} Rx   d {len(msg.data):X} {data}\n"
+
+
+def write_asc(
+    frames: Iterable[TraceFrame],
+    dst: Union[PathLike, TextIO],
+    *,
+    start_time_us: Optional[int] = None,
+) -> int:
+    """Пишет ASC с временем относительно первого кадра (timestamps absolute)."""
+
+    def _write(f: TextIO) -> int:
+        start = start_time_us if start_time_us is not None else time.time_ns() // 1000
+        date = time.strftime("%a %b %d %H:%M:%S", time.localtime(start / 1e6))
+        date = f"{date}.{(start // 1000) % 1000:03d} {time.localtime(start / 1e6).tm_year}"
+        f.write(f"date {date}\nbase hex  timestamps absolute\ninternal events logged\n")
+        f.write(f"Begin Triggerblock {date}\n")
+        f.write("   0.000000 Start of measurement\n")
+
+        n = 0
+        t0 = None
+        for ts, ch, msg in frames:
+            if t0 is None:
+                t0 = ts
+            f.write(format_asc(ts - t0, ch, msg))
+            n += 1
+        f.write("End TriggerBlock\n")
+        return n
+
+    if isinstance(dst, (str, Path)):
+        with open(dst, "w", encoding="ascii", newline="\n") as f:
+            return _write(f)
+    return _write(dst)
+
+
+# --- CSV --------------------------------------------------------------------
+#
+#   timestamp_us,channel,can_id,extended,rtr,fd,brs,data
+#   1000,1,7E8,0,0,0,0,0262F190
+
+CSV_HEADER = "timestamp_us,channel,can_id,extended,rtr,fd,brs,data\n"
+
+
+def read_csv(src: TextSource) -> Iterator[TraceFrame]:
+    for line in _lines(src):
+        parts = line.rstrip("\r\n").split(",")
+        if len(parts) < 8 or not parts[0].lstrip("-").isdigit():
+            continue
+        ts = int(parts[0])
+        yield TraceFrame(
+            ts,
+            int(parts[1]),
+            CanMessage(
+                can_id=int(parts[2], 16),
+                data=bytes.fromhex(parts[7]),
+                extended=parts[3] == "1",
+                rtr=parts[4] == "1",
+                fd=parts[5] == "1",
+                brs=parts[6] == "1",
+                timestamp_us=ts & 0xFFFFFFFF,
+            ),
+        )
+
+
+def write_csv(frames: Iterable[TraceFrame], dst: Union[PathLike, TextIO]) -> int:
+
+    def _write(f: TextIO) -> int:
+        f.write(CSV_HEADER)
+        n = 0
+        for ts, ch, msg in frames:
+            f.write(
+                f"{ts},{ch},{msg.can_id:X},{msg.extended:d},{msg.rtr:d},"
+                f"{msg.fd:d},{msg.brs:d},{msg.data.hex().upper()}\n"
+            )
+            n += 1
+        return n
+
+    if isinstance(dst, (str, Path)):
+        with open(dst, "w", encoding="ascii", newline="\n") as f:
+            return _write(f)
+    return _write(dst)
+
+
+# --- общий вход -------------------------------------------------------------
+
+def write_trace(frames: Iterable[TraceFrame], dst: PathLike, **writer_kwargs) -> int:
+    with TraceWriter(dst, **writer_kwargs) as w:
+        return w.write_many(frames)
+
+
+READERS: Dict[str, Callable[..., Iterator[TraceFrame]]] = {
+    ".log": read_candump,
+    ".candump": read_candump,
+    ".asc": read_asc,
+    ".csv": read_csv,
+    ".cbt": lambda path: iter(TraceReader(path)),
+}
+
+WRITERS: Dict[str, Callable[..., int]] = {
+    ".log": write_candump,
+    ".candump": write_candump,
+    ".asc": write_asc,
+    ".csv": write_csv,
+    ".cbt": write_trace,
+}
+
+
+def _suffix(path: PathLike, table: Dict) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix not in table:
+        raise ValueError(f"Unknown trace format '{suffix}' (known: {', '.join(sorted(table))})")
+    return suffix
+
+
+def read_frames(path: PathLike, **kwargs) -> Iterator[TraceFrame]:
+    """Итератор TraceFrame по расширению файла (.log/.candump, .asc, .csv, .cbt)."""
+    return READERS[_suffix(path, READERS)](path, **kwargs)
+
+
+def write_frames(frames: Iterable[TraceFrame], path: PathLike, **kwargs) -> int:
+    return WRITERS[_suffix(path, WRITERS)](frames, path, **kwargs)
+
+
+def convert(src: PathLike, dst: PathLike, **write_kwargs) -> int:
+    """
+    Потоковая конвертация трассы между форматами по расширениям файлов.
+    При экспорте из .cbt в candump время пересчитывается в абсолютное
+    (от start_time_us записи), для остальных форматов остаётся как есть.
+    """
+    frames: Iterable[TraceFrame] = read_frames(src)
+    if _suffix(src, READERS) == ".cbt" and WRITERS[_suffix(dst, WRITERS)] is write_candump:
+        frames = _rebase(frames, TraceReader(src).start_time_us)
+    return write_frames(frames, dst, **write_kwargs)
+
+
+def _rebase(frames: Iterable[TraceFrame], start_us: int) -> Iterator[TraceFrame]:
+    offset = None
+    for ts, ch, msg in frames:
+        if offset is None:
+            offset = start_us - ts
+        yield TraceFrame(ts + offset, ch, msg)
@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import bisect
+import mmap
+import os
+import struct
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from .messages import CanFrameBatch
+from .trace import (
+    CHUNK_HEADER,
+    FRAME_EXTENDED,
+    FRAME_HEADER,
+    PathLike,
+    TraceChunkInfo,
+    TraceFormatError,
+    TraceFrame,
+    TraceReader,
+    decode_chunk_payload,
+    iter_chunk_frames,
+)
+
+# Индекс трассы (<trace>.idx), little-endian:
+#
+#   Header    : magic "CBTIDX\0\0", version u16, reserved u16, n_chunks u32, n_keys u32,
+#               bitmap_bytes u32, trace_size u64
+#   Chunks    : offset u64[n], stored_size u32[n], n_frames u32[n], t_min i64[n], t_max i64[n]
+#   Keys      : key u64[n_keys], по возрастанию; key = channel << 40 | ext << 32 | can_id
+#   Bitmaps   : n_keys * bitmap_bytes, бит i = ID встречается в чанке i
+#
+# Все массивы выровнены на 8 байт и читаются из mmap без копирования.
+
+INDEX_MAGIC = b"CBTIDX\x00\x00"
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct("<8sHHIIIQ")
+INDEX_SUFFIX = ".idx"
+
+
+def make_key(channel: int, extended: bool, can_id: int) -> int:
+    return (channel << 40) | (int(bool(extended)) << 32) | can_id
+
+
+def index_path_for(trace_path: PathLike) -> Path:
+    p = Path(trace_path)
+    return p.with_name(p.name + INDEX_SUFFIX)
+
+
+def chunk_keys(raw: bytes) -> Set[int]:
+    keys: Set[int] = set()
+    unpack = FRAME_HEADER.unpack_from
+    hsize = FRAME_HEADER.size
+    off = 0
+    end = len(raw)
+    while off < end:
+        _ts, can_id, ch, fl, size = unpack(raw, off)
+        keys.add((ch << 40) | ((fl & FRAME_EXTENDED) << 32) | can_id)
+        off += hsize + size
+    return keys
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class TraceIndexBuilder:
+    """Накапливает индекс по мере записи/сканирования чанков."""
+
+    def __init__(self) -> None:
+        self.offsets = array("Q")
+        self.stored = array("I")
+        self.n_frames = array("I")
+        self.t_min = array("q")
+        self.t_max = array("q")
+        self._bitmaps: Dict[int, bytearray] = {}
+
+    def add_chunk(self, info: TraceChunkInfo, keys: Iterable[int]) -> None:
+        idx = len(self.offsets)
+        self.offsets.append(info.offset)
+        self.stored.append(info.stored_size)
+        self.n_frames.append(info.n_frames)
+        self.t_min.append(info.t_min_us)
+        self.t_max.append(info.t_max_us)
+
+        byte, bit = divmod(idx, 8)
+        for key in keys:
+            bm = self._bitmaps.get(key)
+            if bm is None:
+                bm = bytearray()
+                self._bitmaps[key] = bm
+            if len(bm) <= byte:
+                bm.extend(bytes(byte + 1 - len(bm)))
+            bm[byte] |= 1 << bit
+
+    def write(self, path: PathLike, trace_size: int) -> None:
+        n = len(self.offsets)
+        bitmap_bytes = (n + 7) // 8
+        keys = sorted(self._bitmaps)
+
+        tmp = Path(str(path) + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, n, len(keys), bitmap_bytes, trace_size))
+            for arr in (self.offsets, self.stored, self.n_frames, self.t_min, self.t_max):
+                raw = arr.tobytes()
+                f.write(raw)
+                f.write(bytes(_pad8(len(raw)) - len(raw)))
+            f.write(array("Q", keys).tobytes())
+            for key in keys:
+                bm = self._bitmaps[key]
+                f.write(bm)
+                f.write(bytes(bitmap_bytes - len(bm)))
+        os.replace(tmp, path)
+
+
+def build_index(trace_path: PathLike, index_path: Optional[PathLike] = None) -> Path:
+    """Построить индекс для уже записанной трассы (один линейный проход)."""
+    trace_path = Path(trace_path)
+    index_path = Path(index_path) if index_path is not None else index_path_for(trace_path)
+    reader = TraceReader(trace_path)
+    builder = TraceIndexBuilder()
+    with trace_path.open("rb") as f:
+        for info in reader.chunks():
+            f.seek(info.data_offset)
+            raw = decode_chunk_payload(info, f.read(info.stored_size))
+            builder.add_chunk(info, chunk_keys(raw))
+    builder.write(index_path, trace_path.stat().st_size)
+    return index_path
+
+
+class IndexedTraceReader:
+    """
+    Случайный доступ к трассе .cbt по времени и CAN ID.
+
+    Трасса и индекс открываются через mmap; запрос находит кандидатов по
+    временной таблице чанков (бинарный поиск) и битмапам ID, распаковывает
+    только эти чанки и отдаёт подходящие кадры.
+    Если индекса нет или он устарел — строится автоматически.
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        *,
+        index_path: Optional[PathLike] = None,
+        rebuild: bool = True,
+    ) -> None:
+        self.path = Path(path)
+        self.index_path = Path(index_path) if index_path is not None else index_path_for(self.path)
+        self.start_time_us = TraceReader(self.path).start_time_us
+
+        trace_size = self.path.stat().st_size
+        if rebuild and not self._index_fresh(trace_size):
+            build_index(self.path, self.index_path)
+
+        self._trace_f = self.path.open("rb")
+        self._idx_f = self.index_path.open("rb")
+        self._mm = mmap.mmap(self._trace_f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._imm = mmap.mmap(self._idx_f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._load_index(trace_size)
+
+    def _index_fresh(self, trace_size: int) -> bool:
+        try:
+            with self.index_path.open("rb") as f:
+                hdr = f.read(INDEX_HEADER.size)
+        except FileNotFoundError:
+            return False
+        if len(hdr) < INDEX_HEADER.size:
+            return False
+        magic, version, _r, _n, _k, _b, size = INDEX_HEADER.unpack(hdr)
+        return magic == INDEX_MAGIC and version == INDEX_VERSION and size == trace_size
+
+    def _load_index(self, trace_size: int) -> None:
+        magic, version, _r, n, n_keys, bitmap_bytes, size = INDEX_HEADER.unpack_from(self._imm, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise TraceFormatError(f"{self.index_path}: not a carbus trace index")
+        if size != trace_size:
+            raise TraceFormatError(f"{self.index_path}: index is stale for {self.path}")
+
+        view = self._view = memoryview(self._imm)
+        off = INDEX_HEADER.size
+
+        def take(fmt: str, itemsize: int, count: int):
+            nonlocal off
+            arr = view[off:off + itemsize * count].cast(fmt)
+            off += _pad8(itemsize * count)
+            return arr
+
+        self._offsets = take("Q", 8, n)
+        self._stored = take("I", 4, n)
+        self._n_frames = take("I", 4, n)
+        self._t_min = take("q", 8, n)
+        self._t_max = take("q", 8, n)
+        self._keys = take("Q", 8, n_keys)
+        self._bitmaps_off = off
+        self._bitmap_bytes = bitmap_bytes
+        self._n_chunks = n
+
+        # Время по чанкам монотонно лишь приблизительно (несколько каналов,
+        # джиттер timestamp), поэтому бинарный поиск идёт по префиксному
+        # максимуму t_max и суффиксному минимуму t_min — оба неубывающие.
+        prefix = array("q")
+        cur = -(1 << 63)
+        for t in self._t_max:
+            cur = t if t > cur else cur
+            prefix.append(cur)
+        suffix = array("q", bytes(8 * n))
+        cur = (1 << 63) - 1
+        for i in range(n - 1, -1, -1):
+            t = self._t_min[i]
+            cur = t if t < cur else cur
+            suffix[i] = cur
+        self._t_max_prefix = prefix
+        self._t_min_suffix = suffix
+        self._key_pos = {k: i for i, k in enumerate(self._keys)}
+
+    def close(self) -> None:
+        for name in ("_offsets", "_stored", "_n_frames", "_t_min", "_t_max", "_keys"):
+            getattr(self, name).release()
+        self._view.release()
+        self._mm.close()
+        self._imm.close()
+        self._trace_f.close()
+        self._idx_f.close()
+
+    def __enter__(self) -> "IndexedTraceReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def chunk_count(self) -> int:
+        return self._n_chunks
+
+    @property
+    def frame_count(self) -> int:
+        return sum(self._n_frames)
+
+    @property
+    def time_range(self) -> Optional[tuple]:
+        if not self._n_chunks:
+            return None
+        return self._t_min_suffix[0], self._t_max_prefix[-1]
+
+    def keys(self) -> List[tuple]:
+        """Все (channel, extended, can_id), присутствующие в трассе."""
+        return [(k >> 40, bool((k >> 32) & 1), k & 0xFFFFFFFF) for k in self._keys]
+
+    def _chunk_range(self, t_start: Optional[int], t_end: Optional[int]) -> range:
+        lo = 0
+        hi = self._n_chunks
+        if t_start is not None:
+            lo = bisect.bisect_left(self._t_max_prefix, t_start)
+        if t_end is not None:
+            hi = bisect.bisect_right(self._t_min_suffix, t_end, lo=lo)
+        return range(lo, hi)
+
+    def _match_keys(
+        self,
+        can_ids: Optional[Set[int]],
+        channels: Optional[Set[int]],
+        extended: Optional[bool],
+    ) -> List[int]:
+        out = []
+        for k in self._keys:
+            if can_ids is not None and (k & 0xFFFFFFFF) not in can_ids:
+                continue
+            if channels is not None and (k >> 40) not in channels:
+                continue
+            if extended is not None and bool((k >> 32) & 1) != extended:
+                continue
+            out.append(k)
+        return out
+
+    def _candidate_chunks(
+        self,
+        t_start: Optional[int],
+        t_end: Optional[int],
+        keys: Optional[List[int]],
+    ) -> Iterator[int]:
+        rng = self._chunk_range(t_start, t_end)
+        if not rng:
+            return
+        if keys is None:
+            for i in rng:
+                if t_start is not None and self._t_max[i] < t_start:
+                    continue
+                if t_end is not None and self._t_min[i] > t_end:
+                    continue
+                yield i
+            return
+
+        b_lo = rng.start // 8
+        b_hi = (rng.stop + 7) // 8
+        mask = 0
+        for k in keys:
+            base = self._bitmaps_off + self._key_pos[k] * self._bitmap_bytes
+            mask |= int.from_bytes(self._imm[base + b_lo:base + b_hi], "little")
+        mask >>= rng.start - b_lo * 8
+        mask &= (1 << len(rng)) - 1
+
+        while mask:
+            low = mask & -mask
+            i = rng.start + low.bit_length() - 1
+            mask ^= low
+            if t_start is not None and self._t_max[i] < t_start:
+                continue
+            if t_end is not None and self._t_min[i] > t_end:
+                continue
+            yield i
+
+    def _chunk_raw(self, i: int) -> bytes:
+        off = self._offsets[i]
+        hdr = CHUNK_HEADER.unpack_from(self._mm, off)
+        info = TraceChunkInfo(off, hdr[1], hdr[3], hdr[4], hdr[5], hdr[6], hdr[7], hdr[8])
+        start = info.data_offset
+        with memoryview(self._mm)[start:start + info.stored_size] as stored:
+            return decode_chunk_payload(info, stored)
+
+    def query_batches(
+        self,
+        *,
+        t_start_us: Optional[int] = None,
+        t_end_us: Optional[int] = None,
+        can_ids: Optional[Iterable[int]] = None,
+        channels: Optional[Iterable[int]] = None,
+        extended: Optional[bool] = None,
+    ) -> Iterator[CanFrameBatch]:
+        """Подходящие кадры пачками, по одной CanFrameBatch на прочитанный чанк."""
+        ids = set(can_ids) if can_ids is not None else None
+        chs = set(channels) if channels is not None else None
+        keys = None
+        if ids is not None or chs is not None or extended is not None:
+            keys = self._match_keys(ids, chs, extended)
+            if not keys:
+                return
+        wanted = set(keys) if keys is not None else None
+
+        t_lo = t_start_us if t_start_us is not None else -(1 << 63)
+        t_hi = t_end_us if t_end_us is not None else (1 << 63) - 1
+        unpack = FRAME_HEADER.unpack_from
+        hsize = FRAME_HEADER.size
+
+        for i in self._candidate_chunks(t_start_us, t_end_us, keys):
+            raw = self._chunk_raw(i)
+            batch = CanFrameBatch()
+            off = 0
+            end = len(raw)
+            while off < end:
+                ts, can_id, ch, fl, size = unpack(raw, off)
+                off += hsize
+                if t_lo <= ts <= t_hi and (
+                    wanted is None
+                    or ((ch << 40) | ((fl & FRAME_EXTENDED) << 32) | can_id) in wanted
+                ):
+                    batch.append(ts, ch, can_id, fl, raw[off:off + size])
+                off += size
+            if len(batch):
+                yield batch
+
+    def query(self, **kwargs) -> Iterator[TraceFrame]:
+        """То же, что query_batches(), но поштучно в виде TraceFrame."""
+        for batch in self.query_batches(**kwargs):
+            for ts, ch, msg in batch:
+                yield TraceFrame(ts, ch, msg)
+
+    def frames(self) -> Iterator[TraceFrame]:
+        for i in range(self._n_chunks):
+            yield from iter_chunk_frames(self._chunk_raw(i))
+
+    __iter__ = frames
@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .exceptions import CarBusError
+from .messages import CanMessage
+from .replay import TraceReplayer
+from .timing import clock
+
+log = logging.getLogger("carbus_async.tx_buffer")
+
+Frame = Tuple[int, int, CanMessage]
+
+
+@dataclass
+class TxBufferReport:
+    frames: int = 0             # кадров загружено в адаптер (или отправлено программно)
+    uploads: int = 0            # загрузок в буфер, включая первую
+    underruns: int = 0          # буфер опустел раньше, чем пришла подкачка
+    hardware: bool = True       # False — адаптер без буфера, сработал программный replay
+    duration_s: float = 0.0
+    stopped: bool = False
+
+
+class TxBufferPlayer:
+    """
+    Отправка заранее подготовленной последовательности кадров из буфера
+    адаптера (DI_TX_BUFFER): тайминг между кадрами выдерживает сам адаптер,
+    джиттер хоста и USB на него не влияет.
+
+    frames — (timestamp_us, channel, CanMessage), как у TraceReplayer.
+    Последовательность длиннее буфера грузится частями: когда в очереди
+    адаптера остаётся не больше low_watermark от размера буфера, свободное
+    место дозаполняется следующими кадрами.
+
+    Если адаптер буфера не имеет (или отвергает команды), при fallback=True
+    последовательность воспроизводится программно через TraceReplayer.
+    """
+
+    def __init__(
+        self,
+        dev,
+        frames: Iterable[Frame],
+        *,
+        speed: float = 1.0,
+        channel_map: Optional[Dict[int, int]] = None,
+        buffer_size: Optional[int] = None,
+        low_watermark: float = 0.25,
+        poll_s: float = 0.005,
+        fallback: bool = True,
+    ) -> None:
+        if speed <= 0:
+            raise ValueError("speed must be > 0")
+        if not 0.0 <= low_watermark < 1.0:
+            raise ValueError("low_watermark must be in [0, 1)")
+        self._dev = dev
+        self._frames = frames
+        self.speed = speed
+        self._channel_map = dict(channel_map or {})
+        self.buffer_size = buffer_size
+        self.low_watermark = low_watermark
+        self.poll_s = poll_s
+        self.fallback = fallback
+        self._stop = asyncio.Event()
+        self._prev_ts: Optional[int] = None
+        self.report = TxBufferReport()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _take(self, it: Iterator[Frame], n: int) -> List[Frame]:
+        return list(itertools.islice(it, n))
+
+    def _entries(self, frames: List[Frame]) -> List[Tuple[int, int, CanMessage]]:
+        out = []
+        cmap = self._channel_map
+        prev = self._prev_ts
+        for ts, ch, msg in frames:
+            delay = 0 if prev is None else max(0, int((ts - prev) / self.speed))
+            prev = ts
+            out.append((delay, cmap.get(ch, ch), msg))
+        self._prev_ts = prev
+        return out
+
+    async def _buffer_size(self) -> int:
+        if not self._dev.experimental_enabled("tx_buffer"):
+            log.debug("TX buffer commands are not enabled (experimental)")
+            return 0
+        if self.buffer_size is not None:
+            return self.buffer_size
+        try:
+            info = await self._dev.get_device_info()
+        except CarBusError as e:
+            log.info("DEVICE_INFO failed, TX buffer unavailable: %s", e)
+            return 0
+        if not info.feature_tx_buffer:
+            return 0
+        return info.tx_buffer_size or 0
+
+    async def _software(self, frames: Iterable[Frame], t0: float) -> TxBufferReport:
+        if not self.fallback:
+            raise CarBusError("Adapter TX buffer is not available")
+        log.info("TX buffer unavailable, replaying in software")
+        replayer = TraceReplayer(self._dev, frames, speed=self.speed, channel_map=self._channel_map)
+        stop_watch = asyncio.get_running_loop().create_task(self._stop.wait())
+        stop_watch.add_done_callback(lambda _: replayer.stop())
+        try:
+            rr = await replayer.run()
+        finally:
+            stop_watch.cancel()
+        rep = self.report
+        rep.hardware = False
+        rep.frames = rr.frames_sent
+        rep.stopped = rr.stopped
+        rep.duration_s = clock() - t0
+        return rep
+
+    async def run(self) -> TxBufferReport:
+        rep = self.report = TxBufferReport()
+        self._prev_ts = None
+        t0 = clock()
+        dev = self._dev
+        it = iter(self._frames)
+
+        size = await self._buffer_size()
+        if size <= 0:
+            return await self._software(it, t0)
+
+        first = self._take(it, size)
+        if not first:
+            return rep
+        try:
+            await dev.tx_buffer_clear()
+            await dev.tx_buffer_add(self._entries(first))
+            await dev.tx_buffer_start()
+        except CarBusError as e:
+            log.info("TX buffer rejected: %s", e)
+            return await self._software(itertools.chain(first, it), t0)
+
+        rep.frames = len(first)
+        rep.uploads = 1
+        exhausted = len(first) < size
+        low = int(size * self.low_watermark)
+
+        while not self._stop.is_set():
+            await asyncio.sleep(self.poll_s)
+            queued, _ = await dev.tx_buffer_status()
+            if exhausted:
+                if queued == 0:
+                    break
+                continue
+            if queued > low:
+                continue
+            underrun = queued == 0
+            if underrun:
+                rep.underruns += 1
+            chunk = self._take(it, size - queued)
+            if len(chunk) < size - queued:
+                exhausted = True
+            if chunk:
+                await dev.tx_buffer_add(self._entries(chunk))
+                rep.frames += len(chunk)
+                rep.uploads += 1
+                if underrun:
+                    # опустевший буфер адаптер останавливает — запускаем снова
+                    await dev.tx_buffer_start()
+
+        if self._stop.is_set():
+            rep.stopped = True
+            await dev.tx_buffer_stop()
+        rep.duration_s = clock() - t0
+        log.debug("TX buffer playback finished: %s", rep)
+        return rep
+
+
+async def play_from_buffer(dev, frames: Iterable[Frame], **kwargs) -> TxBufferReport:
+    return await TxBufferPlayer(dev, frames, **kwargs).run()
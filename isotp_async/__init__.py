@@ -1,10 +1,20 @@
+from .adaptive import AdaptiveFlowControl
 from .carbus_iface import CarBusCanTransport
-from .transport import IsoTpChannel, IsoTpConnection
-from .api import open_isotp
+from .transport import IsoTpChannel, IsoTpConnection, IsoTpRxStream, IsoTpUnexpectedPdu
+from .hardware import HwIsoTpChannel
+from .network import IsoTpNetwork
+from .api import IsoTpCanEndpoint, IsoTpEndpoint, open_isotp
 
 __all__ = [
+    "AdaptiveFlowControl",
     "CarBusCanTransport",
     "IsoTpChannel",
     "IsoTpConnection",
+    "IsoTpRxStream",
+    "IsoTpUnexpectedPdu",
+    "HwIsoTpChannel",
+    "IsoTpNetwork",
+    "IsoTpCanEndpoint",
+    "IsoTpEndpoint",
     "open_isotp",
 ]
\ No newline at end of file
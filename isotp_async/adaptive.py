@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+log = logging.getLogger("isotp_async.adaptive")
+
+# коды STmin от быстрого к медленному: 0, 100..900 мкс, затем миллисекунды
+STMIN_LADDER = (0x00, 0xF1, 0xF2, 0xF4, 0xF6, 0xF9, 1, 2, 3, 5, 8, 10, 15, 20, 30, 50, 80, 127)
+
+PeerKey = Tuple[int, int, int]  # (channel, tx_id, rx_id)
+
+
+def _ladder_index(st_min: int) -> int:
+    """Позиция в STMIN_LADDER: точное совпадение или ближайший более медленный код."""
+    if st_min in STMIN_LADDER:
+        return STMIN_LADDER.index(st_min)
+    us = (st_min - 0xF0) * 100 if 0xF1 <= st_min <= 0xF9 else st_min * 1000
+    for i, code in enumerate(STMIN_LADDER):
+        code_us = (code - 0xF0) * 100 if 0xF1 <= code <= 0xF9 else code * 1000
+        if code_us >= us:
+            return i
+    return len(STMIN_LADDER) - 1
+
+
+def _key_str(key: PeerKey) -> str:
+    ch, tx_id, rx_id = key
+    return f"{ch}:0x{tx_id:X}:0x{rx_id:X}"
+
+
+def _parse_key(s: str) -> PeerKey:
+    ch, tx_id, rx_id = s.split(":")
+    return int(ch), int(tx_id, 16), int(rx_id, 16)
+
+
+@dataclass
+class PeerFlow:
+    block_size: int
+    st_min: int
+    streak: int = 0             # успешных приёмов подряд на текущих BS/STmin
+    patience: int = 0           # сколько чистых приёмов ждать до следующего ускорения
+    transfers: int = 0
+    errors: int = 0
+    best_block_size: Optional[int] = None
+    best_st_min: Optional[int] = None
+    best_rate: float = 0.0      # байт/с лучшего безошибочного приёма
+
+
+class AdaptiveFlowControl:
+    """
+    Подбор BS/STmin, которые приёмник IsoTpChannel объявляет в FC, отдельно
+    для каждого собеседника (channel, tx_id, rx_id).
+
+    success_streak чистых приёмов подряд — BS вдвое больше (выше
+    max_block_size — 0, без ограничения), а когда BS уже 0 — STmin на
+    ступень быстрее. Ошибка приёма (неверный SN, таймаут N_Cr, потеря кадров
+    в очереди транспорта) возвращает к лучшим проверенным параметрам, а
+    следующая попытка ускориться откладывается вдвое дольше; если ошибка
+    случилась и на них — STmin на две ступени медленнее, BS вдвое меньше.
+    Лучшие параметры (по скорости безошибочного приёма) сохраняются в path
+    (JSON) и используются как стартовые в следующем сеансе. Файл пишется в
+    фоновом потоке и только когда лучшие BS/STmin изменились; save() —
+    записать сразу (например, перед выходом, чтобы сохранить и скорость).
+
+        fc = AdaptiveFlowControl("~/.carbus/isotp_flow.json")
+        isotp = await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, flow_control=fc)
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        *,
+        max_block_size: int = 32,
+        min_block_size: int = 1,
+        success_streak: int = 3,
+    ) -> None:
+        if not 1 <= min_block_size <= max_block_size <= 0xFF:
+            raise ValueError("need 1 <= min_block_size <= max_block_size <= 255")
+        self.path = os.path.expanduser(path) if path else None
+        self.max_block_size = max_block_size
+        self.min_block_size = min_block_size
+        self.success_streak = success_streak
+        self._peers: Dict[PeerKey, PeerFlow] = {}
+        self._writing = False
+        self._queued: Optional[Dict[str, Any]] = None
+        if self.path:
+            self.load()
+
+    def params(self, key: PeerKey, block_size: int, st_min: int) -> Tuple[int, int]:
+        """BS и STmin для FC; block_size/st_min — стартовые для нового собеседника."""
+        peer = self._peers.get(key)
+        if peer is None:
+            peer = self._peers[key] = PeerFlow(block_size & 0xFF, st_min & 0xFF, patience=self.success_streak)
+        return peer.block_size, peer.st_min
+
+    def stats(self, key: PeerKey) -> Optional[PeerFlow]:
+        return self._peers.get(key)
+
+    def on_success(self, key: PeerKey, nbytes: int = 0, duration_s: float = 0.0) -> None:
+        peer = self._peers.get(key)
+        if peer is None:
+            return
+        peer.transfers += 1
+        peer.streak += 1
+        if duration_s > 0:
+            rate = nbytes / duration_s
+            if rate > peer.best_rate:
+                peer.best_rate = rate
+                best = (peer.block_size, peer.st_min)
+                if best != (peer.best_block_size, peer.best_st_min):
+                    peer.best_block_size, peer.best_st_min = best
+                    self._save_later()
+        if peer.streak < peer.patience:
+            return
+        peer.streak = 0
+        bs, st = peer.block_size, peer.st_min
+        if bs != 0:
+            bs *= 2
+            if bs > self.max_block_size:
+                bs = 0
+        else:
+            i = _ladder_index(st)
+            if i > 0:
+                st = STMIN_LADDER[i - 1]
+        if (bs, st) != (peer.block_size, peer.st_min):
+            log.debug("ISO-TP %s: FC BS=%d STmin=0x%02X -> BS=%d STmin=0x%02X",
+                      _key_str(key), peer.block_size, peer.st_min, bs, st)
+            peer.block_size, peer.st_min = bs, st
+
+    def on_error(self, key: PeerKey, kind: str) -> None:
+        """kind: "sequence", "timeout" или "overflow"."""
+        peer = self._peers.get(key)
+        if peer is None:
+            return
+        peer.transfers += 1
+        peer.errors += 1
+        peer.streak = 0
+        best = (peer.best_block_size, peer.best_st_min)
+        if best[0] is not None and best != (peer.block_size, peer.st_min):
+            # неудачная попытка ускориться: назад к проверенным, следующая — позже
+            bs, st = best
+            peer.patience = min(peer.patience * 2, 64 * self.success_streak)
+        else:
+            bs = peer.block_size
+            bs = max(self.min_block_size, (bs or self.max_block_size * 2) // 2)
+            st = STMIN_LADDER[min(_ladder_index(peer.st_min) + 2, len(STMIN_LADDER) - 1)]
+            # лучшие параметры оказались ненадёжны — выбираем заново
+            if peer.best_block_size is not None:
+                peer.best_block_size = peer.best_st_min = None
+                self._save_later()
+            peer.best_rate = 0.0
+            peer.patience = self.success_streak
+        log.info("ISO-TP %s: %s error, FC BS=%d STmin=0x%02X -> BS=%d STmin=0x%02X",
+                 _key_str(key), kind, peer.block_size, peer.st_min, bs, st)
+        peer.block_size, peer.st_min = bs, st
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            for k, v in raw.items():
+                bs, st = int(v["block_size"]) & 0xFF, int(v["st_min"]) & 0xFF
+                self._peers[_parse_key(k)] = PeerFlow(
+                    bs, st, patience=self.success_streak,
+                    best_block_size=bs, best_st_min=st, best_rate=float(v.get("rate", 0.0)),
+                )
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Cannot load ISO-TP flow settings from %s: %s", self.path, e)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        raw = {}
+        for key, peer in self._peers.items():
+            if peer.best_block_size is None:
+                continue
+            raw[_key_str(key)] = {
+                "block_size": peer.best_block_size,
+                "st_min": peer.best_st_min,
+                "rate": round(peer.best_rate, 1),
+            }
+        return raw
+
+    def save(self) -> None:
+        """Записать лучшие параметры сейчас (синхронно)."""
+        if self.path:
+            self._write(self._snapshot())
+
+    def _save_later(self) -> None:
+        # вызывается из пути приёма: запись на диск — в фоновом потоке,
+        # не больше одной одновременно (следующая ждёт с последним снимком)
+        if not self.path:
+            return
+        raw = self._snapshot()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(raw)
+            return
+        if self._writing:
+            self._queued = raw
+            return
+        self._start_write(loop, raw)
+
+    def _start_write(self, loop: asyncio.AbstractEventLoop, raw: Dict[str, Any]) -> None:
+        self._writing = True
+        fut = loop.run_in_executor(None, self._write, raw)
+        fut.add_done_callback(self._write_done)
+
+    def _write_done(self, fut: "asyncio.Future[None]") -> None:
+        self._writing = False
+        raw, self._queued = self._queued, None
+        if raw is not None:
+            self._start_write(fut.get_loop(), raw)
+
+    def _write(self, raw: Dict[str, Any]) -> None:
+        tmp = self.path + ".tmp"
+        try:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(raw, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Cannot save ISO-TP flow settings to %s: %s", self.path, e)
@@ -3,8 +3,16 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Any
 
-# from carbus_async import CanIdRouter, RoutedCarBusCanTransport
+from carbus_async.exceptions import CarBusError
 from isotp_async import IsoTpChannel, CarBusCanTransport, IsoTpConnection
+from isotp_async.hardware import HwIsoTpChannel, open_hw_isotp
+from isotp_async.network import IsoTpNetwork
+
+# параметры IsoTpChannel, которые понимает и движок адаптера
+_HW_CHANNEL_KWARGS = (
+    "block_size", "st_min_ms", "fc_timeout", "cf_timeout",
+    "tx_dl", "fd", "brs", "extended", "padding",
+)
 
 
 @dataclass(frozen=True)
@@ -22,8 +30,24 @@ async def open_isotp(
     tx_id: int | None = None,
     rx_id: int | None = None,
     router: Any | None = None,
+    network: IsoTpNetwork | None = None,
+    hardware: bool | None = None,
     **channel_kwargs,
-) -> IsoTpChannel:
+) -> IsoTpChannel | HwIsoTpChannel:
+    """
+    hardware=None — использовать ISO-TP движок адаптера, если он есть
+    (DI_ISOTP), иначе программный IsoTpChannel; True — только аппаратно;
+    False — только программно. С flow_control= (AdaptiveFlowControl) по
+    умолчанию выбирается программный стек: FC адаптера хост не настраивает.
+
+    Программные соединения по умолчанию живут в общей IsoTpNetwork устройства
+    и канала: кадры разбираются по rx_id в read loop. Общую очередь
+    receive_can() сеть не читает: она ограничена dev.rx_queue_size, а если
+    её не читает никто — dev.set_rx_queue_enabled(False). network= — своя
+    сеть, router= — CanIdRouter. Повторный open_isotp с теми же tx_id/rx_id
+    и параметрами возвращает то же соединение (с другими — ValueError);
+    close() (или async with) освобождает rx_id, когда закрыты все открывшие.
+    """
 
     if endpoint is not None:
         channel = endpoint.channel
@@ -33,6 +57,22 @@ async def open_isotp(
     if tx_id is None or rx_id is None:
         raise ValueError("tx_id and rx_id are required (or pass endpoint=...)")
 
+    if hardware is None and channel_kwargs.get("flow_control") is not None:
+        hardware = False
+
+    if hardware is not False and router is None:
+        hw_kwargs = {k: v for k, v in channel_kwargs.items() if k in _HW_CHANNEL_KWARGS}
+        hw = await open_hw_isotp(dev, channel=channel, tx_id=tx_id, rx_id=rx_id, **hw_kwargs)
+        if hw is not None:
+            return hw
+        if hardware:
+            raise CarBusError("Adapter ISO-TP engine is not available")
+
+    if network is None and router is None and hasattr(dev, "add_rx_tap"):
+        network = IsoTpNetwork.shared(dev, channel)
+    if network is not None:
+        return network.acquire(tx_id=tx_id, rx_id=rx_id, **channel_kwargs)
+
     # ЛЕНИВЫЕ ИМПОРТЫ, чтобы не было circular import:
     if router is None:
         from isotp_async.carbus_iface import CarBusCanTransport  # <-- подстрой путь под твой проект
@@ -48,15 +88,3 @@ async def open_isotp(
 class IsoTpCanEndpoint:
     rx_id: int   # что слушаем (request -> ECU)
     tx_id: int   # куда отвечаем (ECU -> tester)
-
-
-class IsoTpNetwork:
-    def __init__(self, base_send, router: CanIdRouter):
-        self._send = base_send
-        self._router = router
-
-    def endpoint(self, ep: IsoTpCanEndpoint) -> IsoTpConnection:
-        transport = RoutedCarBusCanTransport(
-            dev=..., channel=..., rx_id=ep.rx_id, router=self._router
-        )
-        return IsoTpConnection(transport=transport, tx_id=ep.tx_id)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Optional
+from typing import Optional, Sequence
 
 from carbus_async.device import CarBusDevice
 from carbus_async.messages import CanMessage
@@ -11,11 +11,18 @@ from .iface import CanTransport
 
 
 class CarBusCanTransport(CanTransport):
+    # send() сериализует кадр до возврата — CanMessage можно переиспользовать
+    copies_on_send = True
+
     def __init__(self, dev: CarBusDevice, channel: int, rx_id: int) -> None:
         self._dev = dev
         self._channel = channel
         self._rx_id = rx_id
 
+    @property
+    def channel(self) -> int:
+        return self._channel
+
     async def send(self, msg: CanMessage) -> None:
         await self._dev.send_can(
             msg,
@@ -24,6 +31,9 @@ class CarBusCanTransport(CanTransport):
             echo=False,
         )
 
+    async def send_batch(self, msgs: Sequence[CanMessage]) -> None:
+        await self._dev.send_can_batch([(self._channel, m) for m in msgs])
+
     async def recv(self, timeout: Optional[float] = None) -> Optional[CanMessage]:
         while True:
             if timeout is None:
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from carbus_async.exceptions import CarBusError
+
+from .transport import IsoTpRxStream
+
+log = logging.getLogger("isotp_async.hardware")
+
+
+class HwIsoTpChannel:
+    """
+    ISO-TP соединение, которое ведёт движок адаптера (DI_ISOTP): FF/CF/FC,
+    BS и STmin обрабатывает прошивка, по USB идут только PDU целиком.
+    API тот же, что у IsoTpChannel / IsoTpConnection.
+    """
+
+    def __init__(
+        self,
+        dev: Any,
+        *,
+        channel: int,
+        tx_id: int,
+        rx_id: int,
+        max_pdu: Optional[int] = None,
+        extended: bool = False,
+        tx_dl: int = 8,
+        fd: bool = False,
+        brs: bool = False,
+        padding: Optional[int] = 0xAA,
+        block_size: int = 0,
+        st_min_ms: int = 0,
+        fc_timeout: float = 1.0,
+        cf_timeout: float = 1.0,
+        send_timeout: float = 5.0,
+        queue_size: int = 64,
+    ) -> None:
+        self._dev = dev
+        self.channel = channel
+        self.tx_id = tx_id
+        self.rx_id = rx_id
+        self.max_pdu = max_pdu
+        self.extended = extended
+        self.tx_dl = tx_dl
+        self.fd = fd or tx_dl > 8
+        self.brs = brs
+        self.padding = padding
+        self.block_size = block_size
+        self.st_min_ms = st_min_ms
+        self.fc_timeout = fc_timeout
+        self.cf_timeout = cf_timeout
+        self.send_timeout = send_timeout
+        self.dropped = 0
+        self._rx: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize=queue_size)
+        self._handle: Optional[int] = None
+
+    @classmethod
+    async def open(cls, dev: Any, **kwargs) -> "HwIsoTpChannel":
+        ch = cls(dev, **kwargs)
+        ch._handle = await dev.isotp_open(
+            ch.channel,
+            ch.tx_id,
+            ch.rx_id,
+            ch._on_pdu,
+            extended=ch.extended,
+            fd=ch.fd,
+            brs=ch.brs,
+            tx_dl=ch.tx_dl,
+            padding=ch.padding,
+            block_size=ch.block_size,
+            st_min=ch.st_min_ms,
+            n_bs_s=ch.fc_timeout,
+            n_cr_s=ch.cf_timeout,
+        )
+        log.debug("ISO-TP 0x%X/0x%X on ch%d handled by adapter (handle %d)",
+                  ch.tx_id, ch.rx_id, ch.channel, ch._handle)
+        return ch
+
+    @property
+    def hardware(self) -> bool:
+        return True
+
+    def _on_pdu(self, pdu: bytes) -> None:
+        try:
+            self._rx.put_nowait(pdu)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            log.warning("ISO-TP 0x%X: RX queue full, PDU dropped", self.rx_id)
+
+    async def send_pdu(self, data: bytes) -> None:
+        if self._handle is None:
+            raise CarBusError("ISO-TP channel is closed")
+        if self.max_pdu is not None and len(data) > self.max_pdu:
+            raise ValueError(f"PDU of {len(data)} bytes exceeds adapter ISO-TP buffer ({self.max_pdu})")
+        await self._dev.isotp_send(self._handle, self.channel, data, timeout=self.send_timeout)
+
+    async def recv_pdu(self, timeout: float = 1.0) -> Optional[bytes]:
+        try:
+            return await asyncio.wait_for(self._rx.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def recv_stream(self, timeout: float = 1.0, *, chunk_size: int = 4096, **_) -> Optional[IsoTpRxStream]:
+        """Совместимость с IsoTpChannel.recv_stream: адаптер отдаёт PDU целиком."""
+        pdu = await self.recv_pdu(timeout=timeout)
+        if pdu is None:
+            return None
+        return IsoTpRxStream(len(pdu), memoryview(pdu), None, chunk_size)
+
+    async def close(self) -> None:
+        handle, self._handle = self._handle, None
+        if handle is not None:
+            try:
+                await self._dev.isotp_close(handle)
+            except CarBusError as e:
+                log.warning("ISO-TP close failed (handle %d): %s", handle, e)
+
+    async def __aenter__(self) -> "HwIsoTpChannel":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def send(self, payload: bytes) -> None:
+        await self.send_pdu(payload)
+
+    async def recv(self, timeout: float = 1.0) -> Optional[bytes]:
+        return await self.recv_pdu(timeout=timeout)
+
+    async def request(self, payload: bytes, timeout: float = 1.0) -> Optional[bytes]:
+        await self.send_pdu(payload)
+        return await self.recv_pdu(timeout=timeout)
+
+
+async def open_hw_isotp(dev: Any, **kwargs) -> Optional[HwIsoTpChannel]:
+    """HwIsoTpChannel, если адаптер умеет ISO-TP и принял соединение, иначе None."""
+    if not hasattr(dev, "isotp_open") or not dev.experimental_enabled("isotp"):
+        return None
+    try:
+        info = await dev.get_device_info()
+    except CarBusError as e:
+        log.info("DEVICE_INFO failed, using software ISO-TP: %s", e)
+        return None
+    if not info.feature_isotp:
+        return None
+    kwargs.setdefault("max_pdu", info.isotp_buffer_size)
+    try:
+        return await HwIsoTpChannel.open(dev, **kwargs)
+    except CarBusError as e:
+        log.info("Adapter rejected ISO-TP open, using software: %s", e)
+        return None
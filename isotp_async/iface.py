@@ -5,6 +5,9 @@ from carbus_async.messages import CanMessage
 
 
 class CanTransport(Protocol):
+    # необязательный атрибут copies_on_send = True: send() не хранит ссылку
+    # на CanMessage после возврата, и отправитель может переиспользовать кадр;
+    # необязательный async send_batch(msgs) — несколько кадров одной записью
 
     async def send(self, msg: CanMessage) -> None:
         ...
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import weakref
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from carbus_async.messages import CanMessage
+
+from .transport import IsoTpConnection
+
+log = logging.getLogger("isotp_async.network")
+
+# общие сети open_isotp(): id(dev) -> {channel: IsoTpNetwork}
+_shared: Dict[int, Dict[int, "IsoTpNetwork"]] = {}
+
+
+def _rx_key(can_id: int, extended: bool) -> int:
+    return (int(extended) << 31) | can_id
+
+
+class NetworkCanTransport:
+    """
+    Транспорт одного соединения IsoTpNetwork. Кадры раскладывает сеть:
+    FC — в отдельную очередь (их ждёт передающая сторона), остальное — в
+    очередь данных, так что send_pdu и recv_pdu могут идти одновременно.
+    """
+
+    copies_on_send = True
+
+    def __init__(self, network: "IsoTpNetwork", rx_id: int, extended: bool, queue_size: int) -> None:
+        self._net = network
+        self.rx_id = rx_id
+        self.extended = extended
+        self._data: "asyncio.Queue[CanMessage]" = asyncio.Queue(maxsize=queue_size)
+        self._fc: "asyncio.Queue[CanMessage]" = asyncio.Queue(maxsize=4)
+        self.dropped = 0
+
+    @property
+    def channel(self) -> int:
+        return self._net.channel
+
+    def _push(self, msg: CanMessage) -> None:
+        data = msg.data
+        q = self._fc if data and data[0] >> 4 == 0x3 else self._data
+        if q.full():
+            # как в CanIdRouter: вытесняем самый старый кадр
+            q.get_nowait()
+            self.dropped += 1
+        q.put_nowait(msg)
+
+    async def send(self, msg: CanMessage) -> None:
+        await self._net._dev.send_can(msg, channel=self._net.channel, confirm=False, echo=False)
+
+    async def send_batch(self, msgs: Sequence[CanMessage]) -> None:
+        ch = self._net.channel
+        await self._net._dev.send_can_batch([(ch, m) for m in msgs])
+
+    @staticmethod
+    async def _get(q: "asyncio.Queue[CanMessage]", timeout: Optional[float]) -> Optional[CanMessage]:
+        if not q.empty():
+            return q.get_nowait()
+        try:
+            if timeout is None:
+                return await q.get()
+            return await asyncio.wait_for(q.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def recv(self, timeout: Optional[float] = None) -> Optional[CanMessage]:
+        return await self._get(self._data, timeout)
+
+    async def recv_fc(self, timeout: Optional[float] = None) -> Optional[CanMessage]:
+        return await self._get(self._fc, timeout)
+
+    def discard_fc(self) -> None:
+        """Сбросить FC, оставшиеся от прерванной передачи."""
+        while not self._fc.empty():
+            self._fc.get_nowait()
+
+    @property
+    def closed(self) -> bool:
+        """True, когда сеть больше не отдаёт кадры этому транспорту."""
+        return self._net._routes.get(_rx_key(self.rx_id, self.extended)) is not self
+
+    def close(self) -> None:
+        """Освободить одну ссылку на rx_id в сети (IsoTpChannel.close())."""
+        self._net._detach(self)
+
+
+class IsoTpNetwork:
+    """
+    ISO-TP стек одного канала устройства: все принятые кадры разбираются в
+    одном месте (RX tap) поиском по словарю rx_id — стоимость кадра не зависит
+    от числа соединений, общая RX-очередь устройства не используется.
+
+        net = IsoTpNetwork(dev, channel=1)
+        engine = net.endpoint(tx_id=0x7E0, rx_id=0x7E8)
+        abs_ = net.endpoint(IsoTpCanEndpoint(rx_id=0x740, tx_id=0x760))
+        await asyncio.gather(engine.request(b"\\x22\\xF1\\x90"), abs_.request(b"\\x19\\x02\\xFF"))
+
+    Каждое IsoTpConnection полнодуплексное и со своими таймерами;
+    channel_kwargs — параметры IsoTpChannel по умолчанию для всех соединений.
+    """
+
+    def __init__(self, dev: Any, channel: int = 1, *, queue_size: int = 256, **channel_kwargs) -> None:
+        self._dev = dev
+        self.channel = channel
+        self.queue_size = queue_size
+        self._defaults = channel_kwargs
+        self._routes: Dict[int, NetworkCanTransport] = {}
+        self._conns: Dict[int, IsoTpConnection] = {}
+        self._refs: Dict[int, int] = {}
+        self._kwargs: Dict[int, Dict[str, Any]] = {}
+        self._attached = False
+        self.unrouted = 0
+
+    @classmethod
+    def shared(cls, dev: Any, channel: int = 1) -> "IsoTpNetwork":
+        """Общая сеть устройства и канала (ей пользуется open_isotp)."""
+        nets = _shared.get(id(dev))
+        if nets is None:
+            nets = _shared[id(dev)] = {}
+            weakref.finalize(dev, _shared.pop, id(dev), None)
+        net = nets.get(channel)
+        if net is None:
+            net = nets[channel] = cls(dev, channel)
+        return net
+
+    def endpoint(
+        self,
+        ep: Any = None,
+        *,
+        tx_id: Optional[int] = None,
+        rx_id: Optional[int] = None,
+        extended: bool = False,
+        **channel_kwargs,
+    ) -> IsoTpConnection:
+        if ep is not None:
+            tx_id, rx_id = ep.tx_id, ep.rx_id
+        if tx_id is None or rx_id is None:
+            raise ValueError("tx_id and rx_id are required (or pass an endpoint)")
+        key = _rx_key(rx_id, extended)
+        if key in self._routes:
+            raise ValueError(f"ISO-TP rx_id 0x{rx_id:X} is already used on channel {self.channel}")
+
+        transport = NetworkCanTransport(self, rx_id, extended, self.queue_size)
+        kwargs = {**self._defaults, **channel_kwargs}
+        conn = IsoTpConnection(can=transport, tx_id=tx_id, rx_id=rx_id, extended=extended, **kwargs)
+        self._routes[key] = transport
+        self._conns[key] = conn
+        self._refs[key] = 1
+        self._kwargs[key] = kwargs
+        if not self._attached:
+            self._dev.add_rx_tap(self._on_frame)
+            self._attached = True
+        return conn
+
+    def acquire(self, *, tx_id: int, rx_id: int, extended: bool = False, **channel_kwargs) -> IsoTpConnection:
+        """
+        Как endpoint(), но если соединение с теми же tx_id/rx_id уже открыто,
+        вернуть его (open_isotp): каждый close() освобождает одну ссылку.
+        Параметры соединения при этом должны совпадать с уже открытым.
+        """
+        key = _rx_key(rx_id, extended)
+        conn = self._conns.get(key)
+        if conn is not None and conn.tx_id == tx_id:
+            kwargs = {**self._defaults, **channel_kwargs}
+            if kwargs != self._kwargs[key]:
+                raise ValueError(
+                    f"ISO-TP 0x{tx_id:X}/0x{rx_id:X} on channel {self.channel} is already open "
+                    f"with {self._kwargs[key]}, got {kwargs}"
+                )
+            self._refs[key] += 1
+            return conn
+        return self.endpoint(tx_id=tx_id, rx_id=rx_id, extended=extended, **channel_kwargs)
+
+    def release(self, conn: IsoTpConnection) -> None:
+        self._detach(conn.can)
+
+    def _detach(self, transport: NetworkCanTransport) -> None:
+        key = _rx_key(transport.rx_id, transport.extended)
+        if self._routes.get(key) is not transport:
+            return
+        self._refs[key] -= 1
+        if self._refs[key] > 0:
+            return
+        del self._conns[key]
+        del self._routes[key]
+        del self._refs[key]
+        del self._kwargs[key]
+        if not self._routes:
+            self.close()
+
+    @property
+    def connections(self) -> Tuple[IsoTpConnection, ...]:
+        return tuple(self._conns.values())
+
+    def close(self) -> None:
+        if self._attached:
+            self._dev.remove_rx_tap(self._on_frame)
+            self._attached = False
+
+    def _on_frame(self, channel: int, msg: CanMessage) -> None:
+        if channel != self.channel:
+            return
+        transport = self._routes.get(_rx_key(msg.can_id, msg.extended))
+        if transport is None:
+            self.unrouted += 1
+            return
+        transport._push(msg)
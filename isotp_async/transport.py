@@ -1,12 +1,35 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
-from typing import Optional
+import logging
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Optional, Set, Tuple
 
 from carbus_async.messages import CanMessage
+from carbus_async.timing import DEFAULT_SPIN_S, Timeout, Watchdog, clock, sleep_until
+from .adaptive import AdaptiveFlowControl
 from .iface import CanTransport
 
+# допустимые длины кадра CAN-FD (DLC 0..15)
+CAN_FD_FRAME_LENGTHS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64)
+# байт заполнения до ближайшей длины CAN-FD, если padding выключен (ISO 15765-2:2016)
+FD_DLC_FILL = 0xCC
+FF_DL_12BIT_MAX = 0xFFF
+
+# FlowStatus
+FS_CTS = 0x0
+FS_WAIT = 0x1
+FS_OVFLW = 0x2
+
+N_AS_TIMEOUT = "ISO-TP: frame transmission timeout (N_As)"
+N_AR_TIMEOUT = "ISO-TP: FlowControl transmission timeout (N_Ar)"
+
+log = logging.getLogger("isotp_async.transport")
+
+
+class IsoTpUnexpectedPdu(RuntimeError):
+    """Приём прерван новым SF/FF собеседника (N_UNEXP_PDU); кадр начнёт следующий приём."""
+
 
 def _st_min_to_seconds(st_min: int) -> float:
 
@@ -14,11 +37,44 @@ def _st_min_to_seconds(st_min: int) -> float:
         return st_min / 1000.0
     if 0xF1 <= st_min <= 0xF9:
         return (st_min - 0xF0) * 100e-6  # 0xF1 -> 1*100us, ...
-    return 0.0
+    # зарезервированные значения — как максимальный STmin (ISO 15765-2)
+    return 0x7F / 1000.0
+
+
+def _fd_frame_len(n: int) -> int:
+    for size in CAN_FD_FRAME_LENGTHS:
+        if size >= n:
+            return size
+    raise ValueError(f"frame of {n} bytes does not fit into CAN-FD")
 
 
 @dataclass
 class IsoTpChannel:
+    """
+    ISO 15765-2 поверх CanTransport.
+
+    tx_dl — длина кадра при передаче: 8 (классический CAN) или 12..64 (CAN-FD,
+    ISO 15765-2:2016); при приёме RX_DL берётся из длины First Frame.
+    padding — байт заполнения кадров до 8 (и до ближайшей длины CAN-FD);
+    None — без заполнения (кадры CAN-FD всё равно дополняются до допустимой
+    длины байтом 0xCC).
+    max_rx_pdu — предел длины принимаемого PDU: на FF длиннее отвечаем FC OVFLW.
+
+    CF передаются с интервалом не меньше STmin из FC: грубый sleep и активное
+    ожидание последних spin_s (timing.sleep_until), так что выдерживаются и
+    коды 100..900 мкс. При STmin=0 и транспорте с send_batch() блок (до BS,
+    не больше batch_frames кадров) уходит одной записью.
+
+    flow_control — AdaptiveFlowControl: BS/STmin в FC приёмника подбираются
+    по ошибкам приёма от этого собеседника вместо block_size/st_min_ms.
+
+    Таймеры ISO 15765-2: n_as/n_ar — отправка кадра (передатчик/FC
+    приёмника), fc_timeout — N_Bs, cf_timeout — N_Cr, n_br — через сколько
+    приёмник шлёт FC.WAIT, если потребитель recv_stream не забрал блок (None —
+    не слать). FC.WAIT от собеседника перезапускает N_Bs, но не больше
+    n_wft_max раз подряд — так долгие операции ECU (запись flash) не рвут
+    передачу.
+    """
 
     can: CanTransport
     tx_id: int
@@ -29,199 +85,522 @@ class IsoTpChannel:
     fc_timeout: float = 1.0
     cf_timeout: float = 1.0
 
+    tx_dl: int = 8
+    fd: bool = False
+    brs: bool = False
+    extended: bool = False
+    padding: Optional[int] = 0xAA
+    max_rx_pdu: int = 16 * 1024 * 1024
+    spin_s: float = DEFAULT_SPIN_S
+    batch_frames: int = 32
+    flow_control: Optional[AdaptiveFlowControl] = None
+    n_as: Optional[float] = 1.0
+    n_ar: Optional[float] = 1.0
+    n_br: Optional[float] = 0.5
+    n_wft_max: int = 64
+
+    # BS/STmin, объявленные в FC текущего приёма
+    _rx_fc: Tuple[int, int] = field(default=(0, 0), init=False, repr=False)
+    # SF/FF, прервавший прошлый приём
+    _pending: Optional[CanMessage] = field(default=None, init=False, repr=False)
+    _bg: Set["asyncio.Task"] = field(default_factory=set, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.tx_dl not in CAN_FD_FRAME_LENGTHS or self.tx_dl < 8:
+            raise ValueError(f"tx_dl must be 8 or a CAN-FD frame length up to 64, got {self.tx_dl}")
+        if self.tx_dl > 8:
+            self.fd = True
+
+    def _buffer(self, n: int) -> bytearray:
+        """Буфер кадра под n байт полезной нагрузки, уже заполненный padding."""
+        if n > 8:
+            size = _fd_frame_len(n)
+            fill = self.padding if self.padding is not None else FD_DLC_FILL
+        elif self.padding is not None:
+            size, fill = 8, self.padding
+        else:
+            size, fill = n, 0
+        return bytearray((fill,)) * size
+
+    def _message(self, data) -> CanMessage:
+        return CanMessage(
+            can_id=self.tx_id,
+            data=data,
+            extended=self.extended,
+            fd=self.fd,
+            brs=self.brs,
+        )
+
+    def _frame(self, pci: bytes, payload=b"") -> CanMessage:
+        h = len(pci)
+        buf = self._buffer(h + len(payload))
+        buf[:h] = pci
+        buf[h:h + len(payload)] = payload
+        return self._message(bytes(buf))
+
+    async def _await_fc(self, recv_fc) -> Tuple[int, float]:
+        """
+        Дождаться FC.CTS: (BS, STmin в секундах). На каждый FC.WAIT таймер N_Bs
+        перезапускается, WAIT больше n_wft_max подряд — ошибка; FC.OVFLW и
+        неизвестный FS прерывают передачу. Прочие кадры игнорируются (ISO 15765-2).
+        """
+        waits = 0
+        deadline = clock() + self.fc_timeout
+        while True:
+            msg = await recv_fc(timeout=max(0.0, deadline - clock()))
+            if msg is None:
+                raise asyncio.TimeoutError("ISO-TP: FlowControl timeout (N_Bs)")
+            data = msg.data
+            if not data or data[0] >> 4 != 0x3:
+                continue
+
+            fs = data[0] & 0x0F  # FS (0=CTS, 1=WT, 2=OVFLW)
+            if fs == FS_CTS:
+                bs = data[1] if len(data) > 1 else 0  # 0 => "unlimited"
+                st_min_raw = data[2] if len(data) > 2 else self.st_min_ms
+                return bs, _st_min_to_seconds(st_min_raw)
+            if fs == FS_WAIT:
+                waits += 1
+                if waits > self.n_wft_max:
+                    raise RuntimeError(f"ISO-TP: more than {self.n_wft_max} FC.WAIT in a row (N_WFTmax)")
+                deadline = clock() + self.fc_timeout
+                continue
+            if fs == FS_OVFLW:
+                raise RuntimeError("ISO-TP: FlowControl OVFLW from peer")
+            raise RuntimeError(f"ISO-TP: invalid FlowStatus=0x{fs:02X}")
+
     async def send_pdu(self, data: bytes) -> None:
+        # N_As: один сторожевой таймер на всю передачу, на кадр — только отметки
+        async with Watchdog(self.n_as, N_AS_TIMEOUT) as wd:
+            await self._send_pdu(data, wd)
+
+    async def _send_pdu(self, data: bytes, wd: Watchdog) -> None:
+        send = self.can.send
         length = len(data)
+        if length == 0:
+            # SF_DL=0 недопустим — приёмник такой кадр игнорирует
+            raise ValueError("ISO-TP: empty PDU")
+        tx_dl = self.tx_dl
+        view = memoryview(data)
         if length <= 7:
             # Single Frame
-            pci = bytes([0x00 | (length & 0x0F)])
-
-            if len(data) < 7:
-                for _ in range(7-len(data)):
-                    data = data + b"\xaa"
-
-            msg = CanMessage(
-                can_id=self.tx_id,
-                data=pci + data,
-            )
-            await self.can.send(msg)
+            wd.start()
+            await send(self._frame(bytes([0x00 | length]), view))
+            return
+        if tx_dl > 8 and length <= tx_dl - 2:
+            # Single Frame с escape-последовательностью (CAN-FD): SF_DL в байте 1
+            wd.start()
+            await send(self._frame(bytes([0x00, length]), view))
             return
 
         # --- Multi-frame: First Frame ---
-        len_hi = (length >> 8) & 0x0F
-        len_lo = length & 0xFF
-        ff_pci0 = 0x10 | len_hi  # high nibble = 0x1 (FF), low=high bits len
-        ff_pci1 = len_lo
-
-        first_data = data[:6]
-        ff_payload = bytes([ff_pci0, ff_pci1]) + first_data
-        msg = CanMessage(
-            can_id=self.tx_id,
-            data=ff_payload,
-        )
-        await self.can.send(msg)
-
-        offset = 6
+        if length <= FF_DL_12BIT_MAX:
+            ff_pci = bytes([0x10 | ((length >> 8) & 0x0F), length & 0xFF])
+        else:
+            # FF_DL > 4095: 12 бит нулей и 32-битная длина
+            if length > 0xFFFFFFFF:
+                raise ValueError("ISO-TP: PDU longer than 4 GiB")
+            ff_pci = bytes([0x10, 0x00]) + length.to_bytes(4, "big")
+
+        # транспорт с отдельной очередью FC (IsoTpNetwork) позволяет
+        # одновременно принимать и передавать по одному соединению
+        recv_fc = getattr(self.can, "recv_fc", None) or self.can.recv
+        discard_fc = getattr(self.can, "discard_fc", None)
+        if discard_fc is not None:
+            discard_fc()
+
+        offset = tx_dl - len(ff_pci)
+        wd.start()
+        await send(self._frame(ff_pci, view[:offset]))
+        wd.stop()
 
         # ---  FlowControl от peer ---
-        fc_msg = await self.can.recv(timeout=self.fc_timeout)
-        if fc_msg is None:
-            raise asyncio.TimeoutError("ISO-TP: FlowControl timeout (N_Bs)")
-
-        if not fc_msg.data:
-            raise RuntimeError("ISO-TP: empty FlowControl frame")
-
-        fc_pci = fc_msg.data[0]
-        fc_type = fc_pci >> 4  # 3 = FC
-
-        if fc_type != 0x3:
-            raise RuntimeError(f"ISO-TP: expected FlowControl, got PCI=0x{fc_pci:02X}")
-
-        fs = fc_pci & 0x0F  # FS (0=CTS, 1=WT, 2=OVFLW)
-        bs = fc_msg.data[1] if len(fc_msg.data) > 1 else 0
-        st_min_raw = fc_msg.data[2] if len(fc_msg.data) > 2 else self.st_min_ms
-
-        if fs == 0x2:
-            raise RuntimeError("ISO-TP: FlowControl OVFLW from peer")
-
-        # Для простоты: поддерживаем только FS=CTS (0x0)
-        if fs != 0x0:
-            raise RuntimeError(f"ISO-TP: unsupported FlowStatus=0x{fs:02X}")
-
-        if bs == 0x00:
-            # 0 => "unlimited"
-            bs = 0
-
-        st_min = _st_min_to_seconds(st_min_raw)
+        bs, st_min = await self._await_fc(recv_fc)
 
         # --- Consecutive Frames ---
+        # полные CF собираются в одном буфере прямо из memoryview данных;
+        # если транспорт копирует кадр в send(), и CanMessage один на всю передачу
+        cf_size = tx_dl - 1
+        cf_buf = self._buffer(tx_dl)
+        reuse = getattr(self.can, "copies_on_send", False)
+        cf_msg = self._message(cf_buf) if reuse else None
+        send_batch = getattr(self.can, "send_batch", None)
+        next_t: Optional[float] = None
         seq_num = 1
         frames_in_block = 0
 
         while offset < length:
             if bs != 0 and frames_in_block >= bs:
-                # BS, FC
-                fc_msg = await self.can.recv(timeout=self.fc_timeout)
-                if fc_msg is None:
-                    raise asyncio.TimeoutError("ISO-TP: second FlowControl timeout (N_Bs)")
-
-                fc_pci = fc_msg.data[0]
-                fc_type = fc_pci >> 4
-                if fc_type != 0x3:
-                    raise RuntimeError(f"ISO-TP: expected FlowControl, got PCI=0x{fc_pci:02X}")
-                fs = fc_pci & 0x0F
-                bs = fc_msg.data[1] if len(fc_msg.data) > 1 else 0
-                st_min_raw = fc_msg.data[2] if len(fc_msg.data) > 2 else self.st_min_ms
-
-                if fs == 0x2:
-                    raise RuntimeError("ISO-TP: FlowControl OVFLW from peer")
-                if fs != 0x0:
-                    raise RuntimeError(f"ISO-TP: unsupported FlowStatus=0x{fs:02X}")
-
-                if bs == 0x00:
-                    bs = 0
-                st_min = _st_min_to_seconds(st_min_raw)
+                bs, st_min = await self._await_fc(recv_fc)
                 frames_in_block = 0
+                next_t = None   # первый CF блока уходит сразу после FC
+
+            if st_min == 0 and send_batch is not None:
+                # STmin=0: остаток блока (не больше batch_frames) — одной записью
+                count = self.batch_frames
+                if bs != 0:
+                    count = min(count, bs - frames_in_block)
+                frames = []
+                while len(frames) < count and offset < length:
+                    n = min(cf_size, length - offset)
+                    buf = self._buffer(1 + n)
+                    buf[0] = 0x20 | seq_num
+                    buf[1:1 + n] = view[offset:offset + n]
+                    offset += n
+                    frames.append(self._message(bytes(buf)))
+                    seq_num = (seq_num + 1) & 0x0F
+                wd.start()
+                await send_batch(frames)
+                wd.stop()
+                frames_in_block += len(frames)
+                continue
 
-            chunk = data[offset:offset + 7]
-            offset += len(chunk)
-
-            cf_pci = 0x20 | (seq_num & 0x0F)  # high nibble = 0x2 (CF)
-            cf_payload = bytes([cf_pci]) + chunk
-
-            if len(cf_payload) < 8:
-                for _ in range(8 - len(cf_payload)):
-                    cf_payload = cf_payload + b"\xaa"
-
-            msg = CanMessage(
-                can_id=self.tx_id,
-                data=cf_payload,
-            )
-            await self.can.send(msg)
+            n = min(cf_size, length - offset)
+            buf = cf_buf if n == cf_size else self._buffer(1 + n)
+            buf[0] = 0x20 | seq_num  # high nibble = 0x2 (CF)
+            buf[1:1 + n] = view[offset:offset + n]
+            offset += n
+
+            if next_t is not None:
+                await sleep_until(next_t, spin_s=self.spin_s)
+            wd.start()
+            if reuse and buf is cf_buf:
+                await send(cf_msg)
+            else:
+                await send(self._message(bytes(buf)))
+            wd.stop()
+            if st_min > 0:
+                # STmin отсчитывается от фактической отправки — интервал не короче заданного
+                next_t = clock() + st_min
 
+            # SN: 1, 2, ..., 15, 0, 1, ...
             seq_num = (seq_num + 1) & 0x0F
-            if seq_num == 0:
-                seq_num = 0x1
 
             frames_in_block += 1
 
-            if st_min > 0:
-                await asyncio.sleep(st_min)
-
-    async def recv_pdu(self, timeout: float = 1.0) -> Optional[bytes]:
-
-        first = await self.can.recv(timeout=timeout)
-        if first is None:
-            return None
-
-        data = first.data
-        if not data:
-            return None
+    async def _recv_first(
+        self, timeout: float, max_length: Optional[int]
+    ) -> Optional[Tuple[int, memoryview, bool]]:
+        """
+        Дождаться SF или FF: (длина PDU, данные первого кадра, multi-frame).
+        На FF уже отправлен FC.CTS. CF и FC вне приёма игнорируются.
+        """
+        deadline = clock() + timeout
+        while True:
+            first, self._pending = self._pending, None
+            if first is None:
+                first = await self.can.recv(timeout=max(0.0, deadline - clock()))
+                if first is None:
+                    return None
+
+            data = first.data
+            if not data:
+                continue
+            pci = data[0]
+            if pci >> 4 == 0x1:
+                break
+            if pci >> 4 != 0x0:
+                continue
 
-        pci = data[0]
-        frame_type = pci >> 4
+            # --- Single Frame ---
+            length, header = pci & 0x0F, 1
+            if length == 0 and len(data) > 8:
+                # escape SF (CAN-FD)
+                length, header = data[1], 2
+            if length == 0 or header + length > len(data):
+                # SF_DL = 0 или длиннее кадра — такой SF игнорируется
+                continue
+            return length, memoryview(data)[header:header + length], False
 
-        # --- Single Frame ---
-        if frame_type == 0x0:
-            length = pci & 0x0F
-            return data[1:1 + length]
+        view = memoryview(data)
 
         # --- First Frame ---
-        if frame_type != 0x1:
-            return None
-
-        # FF length
         length_hi = pci & 0x0F
         length_lo = data[1] if len(data) > 1 else 0
         total_length = (length_hi << 8) | length_lo
+        header = 2
+        if total_length == 0:
+            # FF_DL > 4095: 32-битная длина в байтах 2..5
+            total_length = int.from_bytes(data[2:6], "big")
+            header = 6
+
+        if max_length is not None and total_length > max_length:
+            await self._send_fc(FS_OVFLW, 0, 0)
+            raise RuntimeError(
+                f"ISO-TP: FF length {total_length} exceeds max_rx_pdu={max_length}"
+            )
 
-        payload = bytearray(data[2:])
-
-        bs = self.block_size
-        st_raw = self.st_min_ms
-        fc_pci = 0x30  # type=3 (FC), FS=0 (CTS)
-        fc_payload = bytes([fc_pci, bs & 0xFF, st_raw & 0xFF])
-
-        if len(fc_payload) < 8:
-            fc_payload = fc_payload + b"\x00" * (8 - len(fc_payload))
-
-        fc_frame = CanMessage(
-            can_id=self.tx_id,
-            data=fc_payload,
-        )
-        await self.can.send(fc_frame)
-
-        st_min = _st_min_to_seconds(st_raw)
-
+        if self.flow_control is not None:
+            self._rx_fc = self.flow_control.params(self._peer_key, self.block_size, self.st_min_ms)
+        else:
+            self._rx_fc = (self.block_size, self.st_min_ms)
+        await self._send_fc()
+        n = min(len(data) - header, total_length)
+        return total_length, view[header:header + n], True
+
+    @property
+    def _peer_key(self) -> Tuple[int, int, int]:
+        return getattr(self.can, "channel", 0), self.tx_id, self.rx_id
+
+    async def _send_fc(self, fs: int = FS_CTS, bs: Optional[int] = None, st_min: Optional[int] = None) -> None:
+        if bs is None:
+            bs, st_min = self._rx_fc
+        async with Timeout(self.n_ar, N_AR_TIMEOUT):
+            await self.can.send(self._frame(bytes([0x30 | fs, bs & 0xFF, st_min & 0xFF])))
+
+    def _send_wait(self, state: list) -> None:
+        """Таймер N_Br: потребитель не забрал блок — FC.WAIT, чтобы передатчик ждал."""
+        if state[0] >= self.n_wft_max:
+            log.warning("ISO-TP 0x%X: consumer stalled, N_WFTmax reached", self.rx_id)
+            return
+        state[0] += 1
+        task = asyncio.ensure_future(self._send_fc(FS_WAIT))
+        self._bg.add(task)
+        task.add_done_callback(self._bg.discard)
+        state[1] = asyncio.get_running_loop().call_later(self.n_br, self._send_wait, state)
+
+    async def _cf_pieces(self, remaining: int) -> AsyncIterator[memoryview]:
+        """
+        Данные CF по мере прихода (memoryview на payload кадра, без PCI); при
+        BS>0 — по блокам: блок из BS кадров сначала принимается целиком.
+        Проверяет SN и N_Cr; после каждого блока отправляет FC.CTS — пока
+        потребитель не забрал блок, следующий не запрашивается, а каждые n_br
+        передатчику уходит FC.WAIT. Новый SF/FF от собеседника прерывает
+        приём (IsoTpUnexpectedPdu) и начинает следующий; FC и неизвестные
+        кадры игнорируются.
+        """
+        fc = self.flow_control
+        block_size = self._rx_fc[0]
+        dropped = getattr(self.can, "dropped", 0)
+        nbytes = remaining
+        t0 = clock()
         expected_sn = 1
-        while len(payload) < total_length:
-            cf = await self.can.recv(timeout=self.cf_timeout)
-            if cf is None:
-                raise asyncio.TimeoutError("ISO-TP: CF timeout (N_Cr)")
-
-            if not cf.data:
-                continue
-
-            cf_pci = cf.data[0]
-            cf_type = cf_pci >> 4
-            if cf_type != 0x2:
-                continue
-
-            sn = cf_pci & 0x0F
+        block: List[memoryview] = []
+        while remaining > 0:
+            deadline = clock() + self.cf_timeout
+            while True:
+                cf = await self.can.recv(timeout=max(0.0, deadline - clock()))
+                if cf is None:
+                    if fc is not None:
+                        fc.on_error(self._peer_key, "timeout")
+                    raise asyncio.TimeoutError("ISO-TP: CF timeout (N_Cr)")
+                if not cf.data:
+                    continue
+                cf_type = cf.data[0] >> 4
+                if cf_type == 0x2:
+                    break
+                if cf_type in (0x0, 0x1):
+                    # новый SF/FF: текущий приём прерывается, кадр начнёт следующий
+                    self._pending = cf
+                    raise IsoTpUnexpectedPdu(
+                        f"ISO-TP: reception interrupted by new {'FF' if cf_type else 'SF'}"
+                    )
+
+            sn = cf.data[0] & 0x0F
             if sn != (expected_sn & 0x0F):
+                if fc is not None:
+                    lost = getattr(self.can, "dropped", 0) != dropped
+                    fc.on_error(self._peer_key, "overflow" if lost else "sequence")
                 raise RuntimeError(
                     f"ISO-TP: wrong sequence number: got {sn}, expected {expected_sn}"
                 )
 
-            payload.extend(cf.data[1:])
+            n = min(len(cf.data) - 1, remaining)
+            remaining -= n
             expected_sn = (expected_sn + 1) & 0x0F
-            # надо подумать, гдето нужно так((((
-            # if expected_sn == 0:
-            #     expected_sn = 1
+            piece = memoryview(cf.data)[1:1 + n]
+            if not block_size:
+                yield piece
+                continue
+            block.append(piece)
+            if remaining == 0:
+                for piece in block:
+                    yield piece
+                break
+            if len(block) < block_size:
+                continue
 
-            if st_min > 0:
-                await asyncio.sleep(st_min)
+            # блок принят целиком (не больше BS кадров): N_Br идёт от последнего
+            # CF, FC.CTS — когда потребитель забрал блок, до того — FC.WAIT
+            wait = [0, None]
+            if self.n_br is not None:
+                wait[1] = asyncio.get_running_loop().call_later(self.n_br, self._send_wait, wait)
+            try:
+                for piece in block:
+                    yield piece
+            finally:
+                if wait[1] is not None:
+                    wait[1].cancel()
+            block = []
+            if self._bg:
+                # FC.WAIT, уже отданный в транспорт, должен уйти раньше CTS
+                await asyncio.gather(*self._bg, return_exceptions=True)
+            await self._send_fc()
+
+        if fc is not None:
+            if getattr(self.can, "dropped", 0) != dropped:
+                # кадры этого PDU дошли, но очередь транспорта переполнялась
+                fc.on_error(self._peer_key, "overflow")
+            else:
+                fc.on_success(self._peer_key, nbytes, clock() - t0)
+
+    async def recv_pdu(self, timeout: float = 1.0) -> Optional[bytes]:
+        while True:
+            start = await self._recv_first(timeout, self.max_rx_pdu)
+            if start is None:
+                return None
+            total_length, head, multi = start
+            if not multi:
+                return bytes(head)
+
+            # буфер выделяется один раз по длине из FF
+            payload = bytearray(total_length)
+            pos = len(head)
+            payload[:pos] = head
+            try:
+                async for piece in self._cf_pieces(total_length - pos):
+                    n = len(piece)
+                    payload[pos:pos + n] = piece
+                    pos += n
+            except IsoTpUnexpectedPdu as e:
+                log.warning("%s after %d of %d bytes", e, pos, total_length)
+                continue
+
+            return bytes(payload)
+
+    async def close(self) -> None:
+        """
+        Освободить транспорт (в IsoTpNetwork — одну ссылку на соединение).
+        Фоновые FC.WAIT отменяются, только когда транспорт закрыт совсем.
+        """
+        close = getattr(self.can, "close", None)
+        if close is not None:
+            res = close()
+            if asyncio.iscoroutine(res):
+                await res
+        if getattr(self.can, "closed", True):
+            for task in list(self._bg):
+                task.cancel()
+
+    async def __aenter__(self) -> "IsoTpChannel":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def recv_stream(
+        self,
+        timeout: float = 1.0,
+        *,
+        chunk_size: int = 4096,
+        max_length: Optional[int] = None,
+    ) -> Optional["IsoTpRxStream"]:
+        """
+        Начать приём PDU по частям: вернуть поток, как только пришёл SF/FF
+        (None — таймаут). Длина известна сразу (stream.length), данные
+        забираются по мере прихода CF — память не зависит от размера PDU.
+        """
+        start = await self._recv_first(timeout, max_length)
+        if start is None:
+            return None
+        total_length, head, multi = start
+        pieces = self._cf_pieces(total_length - len(head)) if multi else None
+        return IsoTpRxStream(total_length, head, pieces, chunk_size)
+
+
+class IsoTpRxStream:
+    """
+    Один принимаемый PDU:
+
+        stream = await isotp.recv_stream(timeout=5.0)
+        async for chunk in stream:          # bytes, не длиннее chunk_size
+            f.write(chunk)
+
+    или await stream.readinto(buf) / await stream.copy_to(f). Нарушение SN и
+    N_Cr поднимают исключение из итерации, как в recv_pdu; новый SF/FF
+    собеседника — IsoTpUnexpectedPdu (его PDU вернёт следующий recv_*).
+    """
+
+    def __init__(
+        self,
+        length: int,
+        head: memoryview,
+        pieces: Optional[AsyncIterator[memoryview]],
+        chunk_size: int,
+    ) -> None:
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be > 0")
+        self.length = length
+        self.received = 0
+        self.chunk_size = chunk_size
+        self._head: Optional[memoryview] = head
+        self._pieces = pieces
+        self._buf = bytearray(chunk_size)
+
+    @property
+    def done(self) -> bool:
+        return self.received >= self.length
+
+    def __aiter__(self) -> "IsoTpRxStream":
+        return self
+
+    async def _next_piece(self) -> Optional[memoryview]:
+        piece = self._head
+        if piece is not None:
+            self._head = None
+            return piece
+        if self._pieces is None:
+            return None
+        try:
+            return await self._pieces.__anext__()
+        except StopAsyncIteration:
+            return None
 
-        return bytes(payload[:total_length])
+    async def __anext__(self) -> bytes:
+        if self.done:
+            raise StopAsyncIteration
+        buf = self._buf
+        fill = 0
+        limit = min(self.chunk_size, self.length - self.received)
+        while fill < limit:
+            piece = await self._next_piece()
+            if piece is None:
+                break
+            n = len(piece)
+            take = min(n, limit - fill)
+            buf[fill:fill + take] = piece[:take]
+            fill += take
+            if take < n:
+                # остаток кадра — в начало следующего куска
+                self._head = piece[take:]
+        if fill == 0:
+            raise StopAsyncIteration
+        self.received += fill
+        return bytes(buf[:fill])
+
+    async def readinto(self, buffer) -> int:
+        """Принять остаток PDU в буфер вызывающего, кадр за кадром без промежуточных копий."""
+        out = memoryview(buffer)
+        if len(out) < self.length - self.received:
+            raise ValueError(f"buffer of {len(out)} bytes is too small for {self.length} byte PDU")
+        pos = 0
+        while not self.done:
+            piece = await self._next_piece()
+            if piece is None:
+                break
+            n = len(piece)
+            out[pos:pos + n] = piece
+            pos += n
+            self.received += n
+        return pos
+
+    async def copy_to(self, fileobj) -> int:
+        """Записывать PDU в файл (объект с write()) по мере приёма."""
+        total = 0
+        async for chunk in self:
+            fileobj.write(chunk)
+            total += len(chunk)
+        return total
 
 
 class IsoTpConnection(IsoTpChannel):
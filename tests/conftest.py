@@ -0,0 +1,165 @@
+import asyncio
+import struct
+from typing import List, Optional
+
+import pytest
+
+from carbus_async.messages import CanMessage
+
+
+class MemTransport:
+    """
+    Один конец CAN-шлейфа в памяти: send() кладёт копию кадра в очередь
+    собеседника, recv() берёт из своей. sent — все отправленные кадры.
+    """
+
+    copies_on_send = True
+
+    def __init__(self, inq: asyncio.Queue, outq: asyncio.Queue, *, batch: bool = False) -> None:
+        self.inq = inq
+        self.outq = outq
+        self.sent: List[CanMessage] = []
+        self.batches = 0
+        if batch:
+            self.send_batch = self._send_batch
+
+    async def send(self, msg: CanMessage) -> None:
+        copy = CanMessage(can_id=msg.can_id, data=bytes(msg.data), extended=msg.extended,
+                          fd=msg.fd, brs=msg.brs)
+        self.sent.append(copy)
+        self.outq.put_nowait(copy)
+
+    async def _send_batch(self, msgs) -> None:
+        self.batches += 1
+        for msg in msgs:
+            await self.send(msg)
+
+    async def recv(self, timeout: Optional[float] = None) -> Optional[CanMessage]:
+        try:
+            return await asyncio.wait_for(self.inq.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+@pytest.fixture
+def loopback():
+    """loopback(**kw) -> (a, b): два соединённых MemTransport."""
+    def make(**kw):
+        q1, q2 = asyncio.Queue(), asyncio.Queue()
+        return MemTransport(q1, q2, **kw), MemTransport(q2, q1, **kw)
+    return make
+
+
+class FakeDevice:
+    """
+    Устройство только с RX tap-ами и отправкой (для IsoTpNetwork и мониторов):
+    feed() вызывает tap-ы как read loop, sent — отправленные (channel, msg).
+    """
+
+    def __init__(self) -> None:
+        self.taps = []
+        self.error_taps = []
+        self.sent = []
+
+    def add_rx_tap(self, fn) -> None:
+        if fn not in self.taps:
+            self.taps.append(fn)
+
+    def remove_rx_tap(self, fn) -> None:
+        if fn in self.taps:
+            self.taps.remove(fn)
+
+    def add_bus_error_tap(self, fn) -> None:
+        self.error_taps.append(fn)
+
+    def remove_bus_error_tap(self, fn) -> None:
+        if fn in self.error_taps:
+            self.error_taps.remove(fn)
+
+    def feed(self, channel: int, msg: CanMessage) -> None:
+        for tap in list(self.taps):
+            tap(channel, msg)
+
+    async def send_can(self, msg: CanMessage, *, channel: int = 1, **kw) -> None:
+        self.sent.append((channel, msg))
+
+    async def send_can_batch(self, frames, **kw) -> None:
+        self.sent.extend(frames)
+
+
+class FakeAdapter:
+    """
+    Адаптер на другом конце потока CarBusDevice.open_stream(): отвечает на
+    команды пустым ACK, записывает их в cmds, inject() отдаёт кадр с шины.
+    """
+
+    def __init__(self, experimental=()) -> None:
+        self.reader = asyncio.StreamReader()
+        self.writer = self
+        self.experimental = frozenset(experimental)
+        self.cmds = []      # (command, header flags, payload)
+        self._buf = b""
+
+    # --- StreamWriter ---
+    def write(self, data: bytes) -> None:
+        self._buf += bytes(data)
+        self._parse()
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    async def wait_closed(self) -> None:
+        pass
+
+    def _parse(self) -> None:
+        from carbus_async.protocol import need_extended_header
+
+        while self._buf:
+            if self._buf[:4] == bytes((0xA5, 0, 0xA5, 0)):
+                self._buf = self._buf[4:]
+                self.reader.feed_data(bytes((0x5A, 0, 0x5A, 0)))
+                continue
+            cmd = self._buf[0]
+            if need_extended_header(cmd, self.experimental):
+                if len(self._buf) < 6:
+                    return
+                seq, hl = self._buf[1], 6
+                flags = int.from_bytes(self._buf[2:4], "little")
+                size = int.from_bytes(self._buf[4:6], "little")
+            else:
+                if len(self._buf) < 4:
+                    return
+                seq, flags, size, hl = self._buf[1], self._buf[2], self._buf[3], 4
+            if len(self._buf) < hl + size:
+                return
+            payload, self._buf = self._buf[hl:hl + size], self._buf[hl + size:]
+            self.cmds.append((cmd, flags, payload))
+            if cmd == 0x40 and not flags & 0x01:
+                continue    # MESSAGE без подтверждения
+            self.reader.feed_data(bytes((0x80 | cmd, seq, 0, 0)))
+
+    def inject(self, channel: int, can_id: int, data: bytes) -> None:
+        payload = struct.pack("<IIIII", 0, 0, 0, can_id, len(data)) + bytes(data)
+        self.inject_command(0x40, channel << 13, payload)
+
+    def inject_command(self, cmd: int, flags: int, payload: bytes) -> None:
+        """Асинхронная команда адаптера с заголовком, как её разберёт read loop."""
+        from carbus_async.protocol import need_extended_header
+
+        if need_extended_header(cmd, self.experimental):
+            header = bytes((cmd, 0)) + flags.to_bytes(2, "little") + len(payload).to_bytes(2, "little")
+        else:
+            header = bytes((cmd, 0, flags, len(payload)))
+        self.reader.feed_data(header + payload)
+
+
+async def open_fake(**kw):
+    """(adapter, CarBusDevice) поверх FakeAdapter; kw — для open_stream()."""
+    from carbus_async.device import CarBusDevice
+
+    adapter = FakeAdapter(kw.get("experimental", ()))
+    dev = await CarBusDevice.open_stream(adapter.reader, adapter.writer, **kw)
+    return adapter, dev
@@ -0,0 +1,104 @@
+import json
+
+from isotp_async.adaptive import STMIN_LADDER, AdaptiveFlowControl, _ladder_index
+
+KEY = (1, 0x7E0, 0x7E8)
+
+
+def test_speed_up_after_success_streak():
+    fc = AdaptiveFlowControl(max_block_size=8, success_streak=2)
+    assert fc.params(KEY, 2, 10) == (2, 10)
+    seen = []
+    for _ in range(8):
+        fc.on_success(KEY)
+        seen.append(fc.params(KEY, 2, 10))
+    # BS вдвое, выше max_block_size — 0, потом STmin на ступень быстрее
+    assert seen == [(2, 10), (4, 10), (4, 10), (8, 10), (8, 10), (0, 10), (0, 10), (0, 8)]
+    assert fc.stats(KEY).transfers == 8
+
+
+def test_error_falls_back_to_best_and_doubles_patience():
+    fc = AdaptiveFlowControl(max_block_size=8, success_streak=2)
+    fc.params(KEY, 2, 10)
+    fc.on_success(KEY, 100, 1.0)
+    peer = fc.stats(KEY)
+    assert (peer.best_block_size, peer.best_st_min, peer.best_rate) == (2, 10, 100.0)
+    fc.on_success(KEY)
+    assert fc.params(KEY, 2, 10) == (4, 10)
+
+    fc.on_error(KEY, "sequence")
+    assert fc.params(KEY, 2, 10) == (2, 10)
+    assert (peer.errors, peer.patience, peer.best_block_size) == (1, 4, 2)
+    for _ in range(3):
+        fc.on_success(KEY)
+    assert fc.params(KEY, 2, 10) == (2, 10)
+    fc.on_success(KEY)
+    assert fc.params(KEY, 2, 10) == (4, 10)
+
+
+def test_error_on_best_slows_down_two_steps():
+    fc = AdaptiveFlowControl(max_block_size=8, min_block_size=2, success_streak=3)
+    fc.params(KEY, 8, 5)
+    fc.on_success(KEY, 100, 1.0)
+    fc.on_error(KEY, "timeout")     # ошибка на самих лучших параметрах
+    peer = fc.stats(KEY)
+    assert fc.params(KEY, 8, 5) == (4, STMIN_LADDER[_ladder_index(5) + 2])
+    assert (peer.best_block_size, peer.best_st_min, peer.best_rate) == (None, None, 0.0)
+    assert peer.patience == 3
+
+    fc.on_error(KEY, "overflow")
+    fc.on_error(KEY, "overflow")
+    assert fc.params(KEY, 8, 5)[0] == 2     # не ниже min_block_size
+    for _ in range(20):
+        fc.on_error(KEY, "timeout")
+    assert fc.params(KEY, 8, 5) == (2, STMIN_LADDER[-1])
+
+
+def test_error_with_unlimited_block_size():
+    fc = AdaptiveFlowControl(max_block_size=8)
+    fc.params(KEY, 0, 0)
+    fc.on_error(KEY, "sequence")
+    assert fc.params(KEY, 0, 0) == (8, STMIN_LADDER[2])
+
+
+def test_unknown_peer_is_ignored():
+    fc = AdaptiveFlowControl()
+    fc.on_success(KEY, 100, 1.0)
+    fc.on_error(KEY, "timeout")
+    assert fc.stats(KEY) is None
+
+
+def test_ladder_index_rounds_to_slower_code():
+    assert STMIN_LADDER[_ladder_index(4)] == 5
+    assert STMIN_LADDER[_ladder_index(0xF3)] == 0xF4
+    assert STMIN_LADDER[_ladder_index(0x7F)] == 0x7F
+
+
+def test_json_round_trip(tmp_path):
+    path = tmp_path / "flow" / "isotp.json"
+    other = (2, 0x18DA10F1, 0x18DAF110)
+    fc = AdaptiveFlowControl(str(path))
+    fc.params(KEY, 4, 2)
+    fc.params(other, 8, 0)
+    fc.on_success(KEY, 4000, 0.5)   # вне event loop файл пишется сразу
+    assert json.loads(path.read_text()) == {
+        "1:0x7E0:0x7E8": {"block_size": 4, "st_min": 2, "rate": 8000.0},
+    }
+
+    fc.on_success(other, 100, 0.1)
+    fc.stats(other).best_rate = 1234.56
+    fc.save()
+
+    loaded = AdaptiveFlowControl(str(path))
+    assert loaded.params(KEY, 8, 0) == (4, 2)
+    assert loaded.params(other, 1, 1) == (8, 0)
+    peer = loaded.stats(other)
+    assert (peer.best_block_size, peer.best_st_min, peer.best_rate) == (8, 0, 1234.6)
+    assert peer.patience == loaded.success_streak
+
+
+def test_corrupt_file_is_ignored(tmp_path):
+    path = tmp_path / "isotp.json"
+    path.write_text("{not json")
+    fc = AdaptiveFlowControl(str(path))
+    assert fc.params(KEY, 4, 2) == (4, 2)
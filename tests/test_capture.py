@@ -0,0 +1,88 @@
+import asyncio
+
+from carbus_async import CanMatchRule, TraceReader, TriggerCapture
+from carbus_async.messages import CanMessage
+
+from conftest import FakeDevice
+
+
+def msg(can_id: int, ts_ms: int, *data: int) -> CanMessage:
+    return CanMessage(can_id=can_id, data=bytes(data), timestamp_us=ts_ms * 1000)
+
+
+def test_match_rule():
+    rule = CanMatchRule(can_id=0x7E8, value=b"\x7F", offset=1)
+    assert rule.mask == b"\xFF"
+    assert rule.matches(1, msg(0x7E8, 0, 0x03, 0x7F, 0x22))
+    assert not rule.matches(1, msg(0x7E8, 0, 0x03, 0x62, 0x22))
+    assert not rule.matches(1, msg(0x7E0, 0, 0x03, 0x7F, 0x22))
+    assert not rule.matches(1, msg(0x7E8, 0, 0x03))
+    assert CanMatchRule(predicate=lambda ch, m: ch == 2).matches(2, msg(1, 0))
+
+
+def test_trigger_on_match(tmp_path):
+    dev = FakeDevice()
+
+    async def main():
+        cap = TriggerCapture(dev, tmp_path / "cap_{index}.cbt", channels=(1,),
+                             pre_frames=100, post_frames=3, post_s=10.0)
+        cap.trigger_on_match(can_id=0x7E8, value=b"\x7F", offset=1)
+        for i in range(5):
+            dev.feed(1, msg(0x100, i, i))
+        dev.feed(1, msg(0x7E8, 5, 0x03, 0x7F, 0x22))
+        for i in range(6, 9):
+            dev.feed(1, msg(0x100, i, i))
+        result = await cap.wait(timeout=1.0)
+        await cap.stop()
+        return result
+
+    result = asyncio.run(main())
+    assert (result.pre_frames, result.post_frames) == (6, 3)
+    assert result.reason == "match ch=1 id=0x7E8"
+    assert [f.msg.can_id for f in TraceReader(result.path)][-4:] == [0x7E8, 0x100, 0x100, 0x100]
+
+
+def test_pre_history_has_no_gap_after_rearm(tmp_path):
+    dev = FakeDevice()
+
+    async def main():
+        cap = TriggerCapture(dev, tmp_path / "cap_{index}.cbt", channels=(1,),
+                             pre_frames=100, post_frames=4, post_s=10.0)
+        for i in range(3):
+            dev.feed(1, msg(0x100, i, i))
+        cap.trigger("first")
+        for i in range(3, 7):
+            dev.feed(1, msg(0x100, i, i))
+        first = await cap.wait(timeout=1.0)
+        dev.feed(1, msg(0x100, 7, 7))
+        cap.trigger("second")
+        for i in range(8, 12):
+            dev.feed(1, msg(0x100, i, i))
+        second = await cap.wait(timeout=1.0)
+        await cap.stop()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert (first.pre_frames, first.post_frames) == (3, 4)
+    assert (second.pre_frames, second.post_frames) == (8, 4)
+    assert [f.msg.data[0] for f in TraceReader(second.path)] == list(range(12))
+
+
+def test_pre_s_is_a_cap(tmp_path, caplog):
+    dev = FakeDevice()
+
+    async def main():
+        cap = TriggerCapture(dev, tmp_path / "cap_{index}.cbt", channels=(1,),
+                             pre_frames=5, pre_s=0.006, post_frames=1, post_s=10.0)
+        for i in range(10):
+            dev.feed(1, msg(0x100, i, i))
+        cap.trigger("t")
+        dev.feed(1, msg(0x100, 10, 10))
+        first = await cap.wait(timeout=1.0)
+        await cap.stop()
+        return first
+
+    result = asyncio.run(main())
+    # pre_s=6 мс до триггера (t=9 мс) просит кадры с 3 мс, кольцо из 5 кадров держит 5..9
+    assert [f.msg.data[0] for f in TraceReader(result.path)] == [5, 6, 7, 8, 9, 10]
+    assert "cover only" in caplog.text
@@ -0,0 +1,74 @@
+import asyncio
+
+from carbus_async import CycleEventKind, CycleTimeMonitor
+from carbus_async.messages import CanMessage
+
+
+def drain(mon):
+    out = []
+    while not mon.events.empty():
+        out.append(mon.events.get_nowait())
+    return out
+
+
+def test_timeout_for_id_that_never_arrives():
+    async def main():
+        mon = CycleTimeMonitor(tick_s=0.005)
+        mon.watch(0x100, period_s=0.01, timeout_factor=3)
+        await asyncio.sleep(0.1)
+        await mon.stop()
+        return mon
+
+    mon = asyncio.run(main())
+    events = drain(mon)
+    assert [e.kind for e in events] == [CycleEventKind.TIMEOUT]
+    assert events[0].can_id == 0x100 and events[0].observed_s >= 0.03
+    assert mon.stats(0x100).in_timeout and mon.stats(0x100).timeouts == 1
+
+
+def test_deadline_counted_from_start():
+    async def main():
+        mon = CycleTimeMonitor(tick_s=0.005, autostart=False)
+        mon.watch(0x100, period_s=0.01, timeout_factor=3)
+        await asyncio.sleep(0.06)
+        assert mon.events.empty()     # колесо ещё не запущено
+        mon.start()
+        await asyncio.sleep(0.015)
+        assert mon.events.empty()
+        await asyncio.sleep(0.06)
+        await mon.stop()
+        return mon
+
+    mon = asyncio.run(main())
+    assert [e.kind for e in drain(mon)] == [CycleEventKind.TIMEOUT]
+
+
+def test_learned_period_waits_for_frames():
+    async def main():
+        mon = CycleTimeMonitor(tick_s=0.005)
+        mon.watch(0x100)
+        await asyncio.sleep(0.05)
+        await mon.stop()
+        return mon
+
+    assert drain(asyncio.run(main())) == []
+
+
+def test_frames_keep_watch_alive_then_recover():
+    async def main():
+        mon = CycleTimeMonitor(tick_s=0.005)
+        mon.watch(0x100, period_s=0.01, timeout_factor=3)
+        ts = 0
+        for _ in range(8):
+            mon.update(1, CanMessage(can_id=0x100, data=b"\x00", timestamp_us=ts))
+            ts += 10_000
+            await asyncio.sleep(0.01)
+        assert mon.events.empty()
+        await asyncio.sleep(0.08)
+        mon.update(1, CanMessage(can_id=0x100, data=b"\x00", timestamp_us=ts + 80_000))
+        await mon.stop()
+        return mon
+
+    kinds = [e.kind for e in drain(asyncio.run(main()))]
+    assert kinds[:1] == [CycleEventKind.TIMEOUT]
+    assert CycleEventKind.RECOVERED in kinds
@@ -0,0 +1,52 @@
+import asyncio
+import struct
+
+import pytest
+
+from carbus_async.protocol import Command
+
+from conftest import open_fake
+
+
+def sent(adapter, command):
+    return [(flags, payload) for cmd, flags, payload in adapter.cmds if cmd == command]
+
+
+def test_isotp_channel_in_header_flags():
+    async def main():
+        adapter, dev = await open_fake(experimental=("isotp",))
+        try:
+            handle = await dev.isotp_open(2, 0x7E0, 0x7E8, lambda pdu: None)
+            await dev.isotp_send(handle, 2, b"\x22\xF1\x90")
+            with pytest.raises(ValueError):
+                await dev.isotp_send(handle, 1, b"\x3E\x00")
+        finally:
+            await dev.close()
+        return adapter
+
+    adapter = asyncio.run(main())
+    # ISOTP_OPEN — короткий заголовок (канал в битах 5..7),
+    # ISOTP_DATA — расширенный (канал в битах 13..15, как CHANNEL_n)
+    ((open_flags, _),) = sent(adapter, Command.ISOTP_OPEN)
+    ((data_flags, payload),) = sent(adapter, Command.ISOTP_DATA)
+    assert open_flags == 2 * 0x20
+    assert data_flags == 0x4000
+    assert payload[4:] == b"\x22\xF1\x90"
+
+
+def test_isotp_rx_channel_checked():
+    async def main():
+        adapter, dev = await open_fake(experimental=("isotp",))
+        got = []
+        try:
+            handle = await dev.isotp_open(2, 0x7E0, 0x7E8, got.append)
+            pdu = struct.pack("<I", handle)
+            adapter.inject_command(Command.ISOTP_DATA, 0x2000, pdu + b"\x01")   # канал 1
+            adapter.inject_command(Command.ISOTP_DATA, 0x4000, pdu + b"\x02")   # канал 2
+            for _ in range(20):
+                await asyncio.sleep(0)
+        finally:
+            await dev.close()
+        return got
+
+    assert asyncio.run(main()) == [b"\x02"]
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from isotp_async import IsoTpChannel
+from isotp_async.transport import CAN_FD_FRAME_LENGTHS
+
+SIZES = (1, 6, 7, 8, 62, 63, 64, 100, 4095, 4096, 70000)
+
+
+def pattern(n: int) -> bytes:
+    return bytes(i * 7 & 0xFF for i in range(n))
+
+
+async def roundtrip(a, b, data: bytes, **kw) -> bytes:
+    tx = IsoTpChannel(a, tx_id=0x7E0, rx_id=0x7E8, **kw)
+    rx = IsoTpChannel(b, tx_id=0x7E8, rx_id=0x7E0, **kw)
+    _, got = await asyncio.gather(tx.send_pdu(data), rx.recv_pdu(timeout=5.0))
+    return got
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_classic_roundtrip(loopback, size):
+    a, b = loopback()
+    data = pattern(size)
+    assert asyncio.run(roundtrip(a, b, data)) == data
+    assert all(len(m.data) == 8 and not m.fd for m in a.sent)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_fd_roundtrip(loopback, size):
+    a, b = loopback()
+    data = pattern(size)
+    assert asyncio.run(roundtrip(a, b, data, tx_dl=64, brs=True)) == data
+    assert all(len(m.data) in CAN_FD_FRAME_LENGTHS for m in a.sent)
+    assert all(m.fd and m.brs for m in a.sent)
+
+
+def test_fd_escape_single_frame(loopback):
+    a, b = loopback()
+    data = pattern(20)
+    assert asyncio.run(roundtrip(a, b, data, tx_dl=64)) == data
+    (sf,) = a.sent
+    assert sf.data[:2] == bytes([0x00, 20])
+    assert len(sf.data) == 24   # дополнен до длины CAN-FD
+
+
+def test_fd_unpadded_fill(loopback):
+    a, b = loopback()
+    data = pattern(10)
+    assert asyncio.run(roundtrip(a, b, data, tx_dl=64, padding=None)) == data
+    (sf,) = a.sent
+    assert sf.data == bytes([0x00, 10]) + data
+
+
+@pytest.mark.parametrize("size, pci", [
+    (4095, bytes([0x1F, 0xFF])),
+    (4096, bytes([0x10, 0x00, 0x00, 0x00, 0x10, 0x00])),
+    (70000, bytes([0x10, 0x00]) + (70000).to_bytes(4, "big")),
+])
+def test_first_frame_length(loopback, size, pci):
+    a, b = loopback()
+    asyncio.run(roundtrip(a, b, pattern(size)))
+    assert a.sent[0].data[:len(pci)] == pci
+
+
+def test_tx_dl_validation(loopback):
+    a, _ = loopback()
+    for tx_dl in (7, 9, 65):
+        with pytest.raises(ValueError):
+            IsoTpChannel(a, tx_id=1, rx_id=2, tx_dl=tx_dl)
@@ -0,0 +1,215 @@
+import asyncio
+import time
+
+import pytest
+
+from carbus_async.messages import CanMessage
+from isotp_async import IsoTpChannel, IsoTpUnexpectedPdu
+
+from conftest import MemTransport
+
+
+def frame(*data: int) -> CanMessage:
+    return CanMessage(can_id=0x7E8, data=bytes(data) + b"\xAA" * (8 - len(data)))
+
+
+async def peer(transport, script):
+    """Собеседник передатчика: дождаться FF и отвечать по script (FC или пауза)."""
+    await transport.recv(timeout=1.0)
+    for item in script:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+        else:
+            await transport.send(item)
+
+
+def sender(a, **kw) -> IsoTpChannel:
+    return IsoTpChannel(a, tx_id=0x7E0, rx_id=0x7E8, **kw)
+
+
+def receiver(b, **kw) -> IsoTpChannel:
+    return IsoTpChannel(b, tx_id=0x7E8, rx_id=0x7E0, **kw)
+
+
+def assert_no_wait_after_cts(timeline):
+    """После FC.CTS до следующего CF собеседник не должен получить FC.WAIT."""
+    pci = [m.data[0] for m in timeline]
+    for prev, cur in zip(pci, pci[1:]):
+        assert not (prev == 0x30 and cur == 0x31), pci
+
+
+def test_wait_restarts_n_bs(loopback):
+    a, b = loopback()
+    tx = sender(a, fc_timeout=0.15)
+    script = [0.1, frame(0x31, 0, 0)] * 4 + [0.1, frame(0x30, 0, 0)]
+
+    async def main():
+        await asyncio.gather(tx.send_pdu(bytes(100)), peer(b, script))
+
+    asyncio.run(main())
+    assert len(a.sent) == 1 + 14
+
+
+def test_n_wft_max(loopback):
+    a, b = loopback()
+    tx = sender(a, n_wft_max=2)
+    script = [frame(0x31, 0, 0)] * 3
+
+    async def main():
+        with pytest.raises(RuntimeError, match="N_WFTmax"):
+            await asyncio.gather(tx.send_pdu(bytes(100)), peer(b, script))
+
+    asyncio.run(main())
+
+
+def test_n_bs_timeout(loopback):
+    a, b = loopback()
+    tx = sender(a, fc_timeout=0.1)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError, match="N_Bs"):
+            await asyncio.gather(tx.send_pdu(bytes(100)), peer(b, [frame(0x21, 0)]))
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("fc, match", [
+    (frame(0x32, 0, 0), "OVFLW"),
+    (frame(0x35, 0, 0), "FlowStatus"),
+])
+def test_fc_errors(loopback, fc, match):
+    a, b = loopback()
+    tx = sender(a)
+
+    async def main():
+        with pytest.raises(RuntimeError, match=match):
+            await asyncio.gather(tx.send_pdu(bytes(100)), peer(b, [fc]))
+
+    asyncio.run(main())
+
+
+def test_receiver_overflow(loopback):
+    a, b = loopback()
+    tx, rx = sender(a), receiver(b, max_rx_pdu=50)
+
+    async def main():
+        results = await asyncio.gather(tx.send_pdu(bytes(100)), rx.recv_pdu(timeout=1.0),
+                                       return_exceptions=True)
+        return results
+
+    sent, got = asyncio.run(main())
+    assert isinstance(sent, RuntimeError) and "OVFLW" in str(sent)
+    assert isinstance(got, RuntimeError) and "max_rx_pdu" in str(got)
+    assert b.sent[0].data[:3] == bytes([0x32, 0, 0])
+
+
+def test_slow_consumer_wait_before_cts(loopback):
+    a, b = loopback()
+    b.sent = a.sent     # общая лента кадров обоих направлений
+    tx = sender(a, fc_timeout=0.2)
+    rx = receiver(b, block_size=2, n_br=0.05)
+    data = bytes(range(100))
+
+    async def main():
+        send = asyncio.ensure_future(tx.send_pdu(data))
+        stream = await rx.recv_stream(timeout=1.0, chunk_size=1)
+        out = bytearray()
+        async for chunk in stream:
+            out += chunk
+            if len(out) % 20 == 0:
+                await asyncio.sleep(0.12)
+        await send
+        return bytes(out)
+
+    assert asyncio.run(main()) == data
+    assert any(m.data[0] == 0x31 for m in a.sent)
+    assert_no_wait_after_cts(a.sent)
+
+
+def test_wait_in_flight_is_sent_before_cts():
+    q1, q2 = asyncio.Queue(), asyncio.Queue()
+
+    class SlowFc(MemTransport):
+        """FC.WAIT уходит в шину медленно."""
+
+        async def send(self, msg):
+            if msg.data[0] == 0x31:
+                await asyncio.sleep(0.05)
+            await super().send(msg)
+
+    a, b = MemTransport(q1, q2), SlowFc(q2, q1)
+    b.sent = a.sent
+    tx = sender(a, fc_timeout=0.5)
+    rx = receiver(b, block_size=1, n_br=0.02)
+
+    async def main():
+        send = asyncio.ensure_future(tx.send_pdu(bytes(20)))
+        stream = await rx.recv_stream(timeout=1.0, chunk_size=1)
+        async for _ in stream:
+            if stream.received == 7:
+                await asyncio.sleep(0.03)   # WAIT ещё пишется, когда потребитель вернулся
+        await send
+
+    asyncio.run(main())
+    assert any(m.data[0] == 0x31 for m in a.sent)
+    assert_no_wait_after_cts(a.sent)
+
+
+def test_ff_interrupts_reception(loopback):
+    a, b = loopback()
+    rx = receiver(b)
+    for f in (frame(0x10, 20, 1, 1, 1, 1, 1, 1), frame(0x21, 1, 1, 1, 1, 1, 1, 1),
+              frame(0x10, 10, 7, 7, 7, 7, 7, 7), frame(0x21, 7, 7, 7, 7)):
+        a.outq.put_nowait(f)
+
+    assert asyncio.run(rx.recv_pdu(timeout=1.0)) == bytes([7] * 10)
+
+
+def test_sf_interrupts_stream(loopback):
+    a, b = loopback()
+    rx = receiver(b)
+
+    async def main():
+        for f in (frame(0x10, 20, 1, 1, 1, 1, 1, 1), frame(0x21, 1, 1, 1, 1, 1, 1, 1), frame(0x02, 4, 4)):
+            a.outq.put_nowait(f)
+        stream = await rx.recv_stream(timeout=1.0)
+        with pytest.raises(IsoTpUnexpectedPdu):
+            async for _ in stream:
+                pass
+        return await rx.recv_pdu(timeout=0.1)
+
+    assert asyncio.run(main()) == bytes([4, 4])
+
+
+@pytest.mark.parametrize("bad", [
+    CanMessage(can_id=0x7E8, data=bytes([0x00]) + b"\xAA" * 7),         # SF_DL = 0
+    CanMessage(can_id=0x7E8, data=bytes([0x00, 0x00]) + bytes(10)),     # escape SF_DL = 0
+    CanMessage(can_id=0x7E8, data=bytes([0x00, 30]) + bytes(10)),       # длиннее кадра
+    CanMessage(can_id=0x7E8, data=bytes([0x21, 1, 2])),                 # CF вне приёма
+    CanMessage(can_id=0x7E8, data=bytes([0x30, 0, 0])),                 # FC вне приёма
+])
+def test_invalid_frames_ignored(loopback, bad):
+    a, b = loopback()
+    rx = receiver(b)
+    a.outq.put_nowait(bad)
+    a.outq.put_nowait(frame(0x02, 5, 5))
+
+    assert asyncio.run(rx.recv_pdu(timeout=0.2)) == bytes([5, 5])
+
+
+def test_empty_pdu_rejected(loopback):
+    a, _ = loopback()
+    with pytest.raises(ValueError):
+        asyncio.run(sender(a).send_pdu(b""))
+
+
+def test_n_as_timeout():
+    class Stuck(MemTransport):
+        async def send(self, msg):
+            await asyncio.sleep(10)
+
+    tx = sender(Stuck(asyncio.Queue(), asyncio.Queue()), n_as=0.1)
+    t = time.perf_counter()
+    with pytest.raises(asyncio.TimeoutError, match="N_As"):
+        asyncio.run(tx.send_pdu(bytes(3)))
+    assert time.perf_counter() - t < 1.0
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from carbus_async.messages import CanMessage
+from isotp_async import IsoTpNetwork, open_isotp
+
+from conftest import FakeDevice, open_fake
+
+
+def frame(can_id: int, *data: int) -> CanMessage:
+    return CanMessage(can_id=can_id, data=bytes(data) + b"\xAA" * (8 - len(data)))
+
+
+def test_demux_by_rx_id():
+    dev = FakeDevice()
+    net = IsoTpNetwork(dev, channel=1)
+    engine = net.endpoint(tx_id=0x7E0, rx_id=0x7E8)
+    abs_ = net.endpoint(tx_id=0x760, rx_id=0x768)
+    assert dev.taps == [net._on_frame]
+
+    dev.feed(1, frame(0x768, 0x02, 0x50, 0x03))
+    dev.feed(1, frame(0x7E8, 0x02, 0x50, 0x01))
+    dev.feed(1, frame(0x123, 0x01, 0x00))    # чужой ID
+    dev.feed(2, frame(0x7E8, 0x02, 0x51, 0x01))    # другой канал
+
+    async def main():
+        return (await engine.recv_pdu(timeout=0.1), await abs_.recv_pdu(timeout=0.1),
+                await engine.recv_pdu(timeout=0.05))
+
+    assert asyncio.run(main()) == (b"\x50\x01", b"\x50\x03", None)
+    assert net.unrouted == 1
+
+    with pytest.raises(ValueError):
+        net.endpoint(tx_id=0x7E1, rx_id=0x7E8)
+
+
+def test_send_and_receive_on_one_connection():
+    dev = FakeDevice()
+    net = IsoTpNetwork(dev, channel=1)
+    conn = net.endpoint(tx_id=0x7E0, rx_id=0x7E8)
+
+    async def main():
+        send = asyncio.ensure_future(conn.send_pdu(bytes(range(20))))
+        await asyncio.sleep(0)
+        # FC и данные собеседника идут в разные очереди соединения
+        dev.feed(1, frame(0x7E8, 0x02, 0x7E, 0x00))
+        dev.feed(1, frame(0x7E8, 0x30, 0x00, 0x00))
+        await send
+        return await conn.recv_pdu(timeout=0.1)
+
+    assert asyncio.run(main()) == b"\x7E\x00"
+    assert [m.data[0] >> 4 for _, m in dev.sent] == [1, 2, 2]
+
+
+def test_queue_overflow_drops_oldest():
+    dev = FakeDevice()
+    net = IsoTpNetwork(dev, channel=1, queue_size=2)
+    conn = net.endpoint(tx_id=0x7E0, rx_id=0x7E8)
+    for i in range(5):
+        dev.feed(1, frame(0x7E8, 0x01, i))
+
+    async def main():
+        return [await conn.recv_pdu(timeout=0.05) for _ in range(3)]
+
+    assert asyncio.run(main()) == [b"\x03", b"\x04", None]
+    assert conn.can.dropped == 3
+
+
+def test_open_isotp_close_and_reopen():
+    dev = FakeDevice()
+
+    async def main():
+        a = await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, hardware=False)
+        b = await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, hardware=False)
+        assert a is b
+        net = IsoTpNetwork.shared(dev, 1)
+        assert len(dev.taps) == 1
+
+        await a.close()
+        assert net.connections == (a,)
+        await b.close()
+        assert net.connections == () and dev.taps == []
+
+        async with await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, hardware=False) as c:
+            assert c is not a
+            dev.feed(1, frame(0x7E8, 0x01, 0x42))
+            assert await c.recv_pdu(timeout=0.1) == b"\x42"
+        assert dev.taps == []
+
+    asyncio.run(main())
+
+
+def test_device_rx_queue_is_bounded():
+    async def main():
+        adapter, dev = await open_fake(rx_queue_size=4)
+        try:
+            await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, hardware=False)
+            for i in range(10):
+                adapter.inject(1, 0x100, bytes([i]))
+            for _ in range(50):
+                await asyncio.sleep(0)
+            assert dev.rx_queue_dropped == 6
+            ch, msg = await dev.receive_can()
+            return ch, msg.data
+        finally:
+            await dev.close()
+
+    assert asyncio.run(main()) == (1, b"\x06")
+
+
+def test_acquire_with_different_settings():
+    dev = FakeDevice()
+    net = IsoTpNetwork(dev, channel=1, block_size=4)
+    conn = net.acquire(tx_id=0x7E0, rx_id=0x7E8, st_min_ms=2)
+    assert net.acquire(tx_id=0x7E0, rx_id=0x7E8, st_min_ms=2) is conn
+    with pytest.raises(ValueError, match="already open"):
+        net.acquire(tx_id=0x7E0, rx_id=0x7E8, st_min_ms=2, block_size=8)
+    with pytest.raises(ValueError, match="already open"):
+        net.acquire(tx_id=0x7E0, rx_id=0x7E8)
+
+
+def test_close_keeps_background_tasks_of_other_holders():
+    dev = FakeDevice()
+
+    async def main():
+        a = await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, hardware=False)
+        b = await open_isotp(dev, channel=1, tx_id=0x7E0, rx_id=0x7E8, hardware=False)
+        task = asyncio.ensure_future(asyncio.sleep(1))
+        a._bg.add(task)
+        await a.close()
+        assert not a.can.closed
+        await asyncio.sleep(0)
+        assert not task.cancelled()
+        await b.close()
+        assert b.can.closed
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from isotp_async import IsoTpChannel
+
+from conftest import MemTransport
+
+
+def pattern(n: int) -> bytes:
+    return bytes(i * 13 & 0xFF for i in range(n))
+
+
+def count_fc(transport) -> int:
+    return sum(1 for m in transport.sent if m.data[0] >> 4 == 0x3)
+
+
+async def roundtrip(a, b, data: bytes, *, block_size=0, **kw) -> bytes:
+    tx = IsoTpChannel(a, tx_id=0x7E0, rx_id=0x7E8, **kw)
+    rx = IsoTpChannel(b, tx_id=0x7E8, rx_id=0x7E0, block_size=block_size, **kw)
+    _, got = await asyncio.gather(tx.send_pdu(data), rx.recv_pdu(timeout=5.0))
+    return got
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 8, 15])
+@pytest.mark.parametrize("tx_dl", [8, 64])
+def test_block_size(loopback, block_size, tx_dl):
+    a, b = loopback()
+    data = pattern(3000)
+    assert asyncio.run(roundtrip(a, b, data, block_size=block_size, tx_dl=tx_dl)) == data
+    cfs = sum(1 for m in a.sent if m.data[0] >> 4 == 0x2)
+    assert count_fc(b) == -(-cfs // block_size)
+    assert all(m.data[1] == block_size for m in b.sent)
+
+
+@pytest.mark.parametrize("block_size", [0, 5])
+def test_batched_consecutive_frames(loopback, block_size):
+    a, b = loopback(batch=True)
+    data = pattern(2000)
+    assert asyncio.run(roundtrip(a, b, data, block_size=block_size, batch_frames=10)) == data
+    cfs = sum(1 for m in a.sent if m.data[0] >> 4 == 0x2)
+    assert a.batches >= -(-cfs // 10)
+    sns = [m.data[0] & 0x0F for m in a.sent[1:]]
+    assert sns == [(i + 1) & 0x0F for i in range(cfs)]
+
+
+class KeepRefs(MemTransport):
+    """Транспорт, который хранит сам CanMessage, а не копию."""
+
+    copies_on_send = False
+
+    async def send(self, msg):
+        self.sent.append(msg)
+        self.outq.put_nowait(msg)
+
+
+def test_frames_not_reused_without_copies_on_send():
+    q1, q2 = asyncio.Queue(), asyncio.Queue()
+    a, b = KeepRefs(q1, q2), MemTransport(q2, q1)
+    data = pattern(500)
+    assert asyncio.run(roundtrip(a, b, data)) == data
+    assert len({id(m) for m in a.sent}) == len(a.sent)
+
+
+def test_padding(loopback):
+    a, b = loopback()
+    asyncio.run(roundtrip(a, b, pattern(10), padding=0x55))
+    assert a.sent[-1].data == bytes([0x21]) + pattern(10)[6:] + b"\x55" * 3
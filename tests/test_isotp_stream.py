@@ -0,0 +1,130 @@
+import asyncio
+import io
+
+import pytest
+
+from carbus_async.messages import CanMessage
+from isotp_async import IsoTpChannel
+
+
+def pattern(n: int) -> bytes:
+    return bytes(i * 5 & 0xFF for i in range(n))
+
+
+def channels(a, b, **rx_kw):
+    tx = IsoTpChannel(a, tx_id=0x7E0, rx_id=0x7E8)
+    rx = IsoTpChannel(b, tx_id=0x7E8, rx_id=0x7E0, **rx_kw)
+    return tx, rx
+
+
+def frame(*data: int) -> CanMessage:
+    return CanMessage(can_id=0x7E0, data=bytes(data) + b"\xAA" * (8 - len(data)))
+
+
+@pytest.mark.parametrize("size", [5, 100, 70000])
+def test_chunks(loopback, size):
+    a, b = loopback()
+    tx, rx = channels(a, b)
+    data = pattern(size)
+
+    async def main():
+        send = asyncio.ensure_future(tx.send_pdu(data))
+        stream = await rx.recv_stream(timeout=1.0, chunk_size=1000)
+        assert stream.length == size
+        chunks = [c async for c in stream]
+        await send
+        return chunks
+
+    chunks = asyncio.run(main())
+    assert b"".join(chunks) == data
+    assert all(len(c) == 1000 for c in chunks[:-1])
+
+
+def test_readinto_and_copy_to(loopback):
+    a, b = loopback()
+    tx, rx = channels(a, b)
+    data = pattern(5000)
+
+    # передатчику FC нужен до CF, поэтому отправка и приём идут параллельно
+    async def main():
+        send = asyncio.ensure_future(tx.send_pdu(data))
+        buf = bytearray(len(data))
+        stream = await rx.recv_stream(timeout=1.0)
+        n = await stream.readinto(buf)
+        await send
+        send = asyncio.ensure_future(tx.send_pdu(data[::-1]))
+        f = io.BytesIO()
+        stream = await rx.recv_stream(timeout=1.0)
+        await stream.copy_to(f)
+        await send
+        return bytes(buf[:n]), f.getvalue()
+
+    first, second = asyncio.run(main())
+    assert first == data
+    assert second == data[::-1]
+
+
+def test_readinto_small_buffer(loopback):
+    a, b = loopback()
+    tx, rx = channels(a, b)
+
+    async def main():
+        send = asyncio.ensure_future(tx.send_pdu(pattern(100)))
+        stream = await rx.recv_stream(timeout=1.0)
+        with pytest.raises(ValueError):
+            await stream.readinto(bytearray(10))
+        send.cancel()
+
+    asyncio.run(main())
+
+
+def test_slow_consumer_gets_whole_pdu(loopback):
+    a, b = loopback()
+    tx, rx = channels(a, b, block_size=4, n_br=0.05)
+    tx.fc_timeout = 0.2
+    data = pattern(400)
+
+    async def main():
+        send = asyncio.ensure_future(tx.send_pdu(data))
+        stream = await rx.recv_stream(timeout=1.0, chunk_size=7)
+        out = bytearray()
+        async for chunk in stream:
+            out += chunk
+            if len(out) < 60:
+                await asyncio.sleep(0.12)   # дольше n_br и короче 2 * fc_timeout
+        await send
+        return bytes(out)
+
+    assert asyncio.run(main()) == data
+    waits = [m for m in b.sent if m.data[0] == 0x31]
+    assert waits
+
+
+def test_wrong_sequence_number(loopback):
+    a, b = loopback()
+    _, rx = channels(a, b)
+
+    async def main():
+        for f in (frame(0x10, 20, 1, 2, 3, 4, 5, 6), frame(0x22, 7, 8, 9, 10, 11, 12, 13)):
+            a.outq.put_nowait(f)
+        stream = await rx.recv_stream(timeout=1.0)
+        with pytest.raises(RuntimeError, match="sequence"):
+            async for _ in stream:
+                pass
+
+    asyncio.run(main())
+
+
+def test_n_cr_timeout(loopback):
+    a, b = loopback()
+    _, rx = channels(a, b, cf_timeout=0.1)
+
+    async def main():
+        a.outq.put_nowait(frame(0x10, 20, 1, 2, 3, 4, 5, 6))
+        a.outq.put_nowait(frame(0x21, 7, 8, 9, 10, 11, 12, 13))
+        stream = await rx.recv_stream(timeout=1.0, chunk_size=13)
+        assert await stream.__anext__() == bytes(range(1, 14))
+        with pytest.raises(asyncio.TimeoutError, match="N_Cr"):
+            await stream.__anext__()
+
+    asyncio.run(main())
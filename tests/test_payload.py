@@ -0,0 +1,35 @@
+import pytest
+
+from carbus_async.payload import Counter, Crc8, PayloadGenerator, Xor8, _ChecksumField, crc8
+
+
+def test_checksum_subclass_without_compute_fails_on_construction():
+    class Sum8(_ChecksumField):
+        __slots__ = ()
+
+    with pytest.raises(TypeError, match="compute"):
+        Sum8(0, None)
+
+
+def test_checksum_subclass():
+    class Sum8(_ChecksumField):
+        __slots__ = ()
+
+        def compute(self, data) -> int:
+            return sum(self._covered(data)) & 0xFF
+
+    gen = PayloadGenerator(bytes(4), [Counter(8, 4), Sum8(3, span=(0, 3))])
+    frames = [gen(t, b"") for t in range(3)]
+    assert [f[1] for f in frames] == [0, 1, 2]
+    assert all(f[3] == f[1] for f in frames)
+
+
+def test_builtin_checksums():
+    data = bytearray(b"\x00\x11\x22\x33")
+    Xor8(0).apply(data, 0)
+    assert data[0] == 0x11 ^ 0x22 ^ 0x33 and Xor8(0).check(bytes(data))
+
+    c = Crc8(0, span=(1, 4))
+    c.apply(data, 0)
+    assert data[0] == crc8(b"\x11\x22\x33")
+    assert c.check(bytes(data)) and not c.check(bytes(data[:1]) + b"\x00\x22\x33")
@@ -0,0 +1,58 @@
+import asyncio
+
+from carbus_async.periodic import PeriodicCanSender
+
+from conftest import FakeDevice
+
+
+class FlakyDevice(FakeDevice):
+    """Пакетная запись падает, пока fail > 0."""
+
+    def __init__(self, fail: int) -> None:
+        super().__init__()
+        self.fail = fail
+
+    async def send_can_batch(self, frames, **kw) -> None:
+        if self.fail:
+            self.fail -= 1
+            raise OSError("port write failed")
+        await super().send_can_batch(frames, **kw)
+
+
+def test_failed_batch_is_not_counted_as_sent():
+    dev = FlakyDevice(fail=2)
+
+    async def main():
+        sender = PeriodicCanSender(dev)
+        a = sender.add("a", channel=1, can_id=0x100, data=bytes(8), period_s=0.01)
+        b = sender.add("b", channel=1, can_id=0x200, data=bytes(8), period_s=0.01)
+        await asyncio.sleep(0.055)
+        await sender.stop_all()
+        return a.stats(), b.stats()
+
+    for st in asyncio.run(main()):
+        assert st.failed == 2
+        assert st.sent == len(dev.sent) // 2
+        assert st.sent >= 2
+
+
+def test_failed_modify_is_counted_per_job():
+    dev = FakeDevice()
+
+    def bad(tick, data):
+        if tick == 0:
+            raise ValueError("bad tick")
+        return data
+
+    async def main():
+        sender = PeriodicCanSender(dev)
+        a = sender.add("a", channel=1, can_id=0x100, data=bytes(8), period_s=0.01, modify=bad)
+        b = sender.add("b", channel=1, can_id=0x200, data=bytes(8), period_s=0.01)
+        await asyncio.sleep(0.035)
+        await sender.stop_all()
+        return a.stats(), b.stats()
+
+    a, b = asyncio.run(main())
+    assert (a.failed, b.failed) == (1, 0)
+    assert a.sent == b.sent - 1
+    assert [m.can_id for _, m in dev.sent].count(0x100) == a.sent
@@ -0,0 +1,34 @@
+import pytest
+
+from carbus_async.messages import CanMessage
+from carbus_async.trace import TraceReader, TraceWriter
+
+
+def msg(i: int) -> CanMessage:
+    return CanMessage(can_id=0x100 + i, data=bytes([i]))
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "t.cbt"
+    with TraceWriter(path, chunk_frames=3, index=False) as w:
+        for i in range(7):
+            w.append(1000 + i, 1, msg(i))
+    assert (w.frames_written, w.chunks_written, w.dropped_frames) == (7, 3, 0)
+    frames = list(TraceReader(path).frames())
+    assert [(f.timestamp_us, f.msg.can_id) for f in frames] == [(1000 + i, 0x100 + i) for i in range(7)]
+
+
+def test_dropped_frames_from_both_threads(tmp_path):
+    w = TraceWriter(tmp_path / "t.cbt", chunk_frames=2, max_pending_chunks=0, index=False)
+    for i in range(3):
+        w.append(i, 1, msg(i))      # очередь «полна»: чанк из 2 кадров отброшен сразу
+
+    def broken(*chunk):
+        raise OSError("disk full")
+
+    w._write_chunk = broken
+    w.max_pending_chunks = 256
+    with pytest.raises(OSError):
+        w.close()                   # оставшийся кадр падает при записи в фоновом потоке
+    assert w.dropped_frames == 3
+    assert w.frames_written == 0